@@ -1,7 +1,9 @@
 import os
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, bindparam, event, or_
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import IntegrityError
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from datetime import datetime, timedelta
@@ -10,6 +12,20 @@ import json
 import bcrypt
 import jwt
 import logging
+import math
+import time
+import atexit
+
+from db_upgrade import upgrade_database
+from gazetteer import seeded_gazetteer
+from geo import DriverGrid
+from location_buffer import DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_ROWS, LocationBuffer
+from models import LanePrice
+from path_simplify import DEFAULT_MAX_PATHS, DEFAULT_TOLERANCES, PathCache, PathLevels, choose_level, parse_path_detail
+from position_store import DEFAULT_WRITE_INTERVAL, Position, PositionStore, position_backend
+from price_service import record_match_price
+from socket_context import DEFAULT_MAX_AGE, SocketContexts
+from matching import MatchRules, ToleranceIndex, TolerancePosting, RequestPosting, pair_cost
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -29,12 +45,27 @@ db = SQLAlchemy(app, model_class=Base)
 # JWT Configuration
 app.config['JWT_SECRET_KEY'] = os.environ.get("JWT_SECRET_KEY", "jwt-secret-key")
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+# 설정하면 (예: redis://) 기사 최신 위치를 여러 노드가 공유한다
+app.config['DRIVER_POSITION_STORE_URL'] = os.environ.get("DRIVER_POSITION_STORE_URL")
 
 # Initialize SocketIO for real-time tracking
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading',
+                    message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
 
 # Store active connections
 active_connections = {}
+# 연결(sid)별 위치 추적 권한 캐시
+socket_contexts = SocketContexts(max_age=app.config.get('SOCKET_CONTEXT_MAX_AGE', DEFAULT_MAX_AGE))
+
+# 배차 가능한 기사의 위치 격자 인덱스 (워커마다 하나)
+driver_grid = DriverGrid()
+
+# 매칭별 단순화 경로 (워커마다 하나, 최근에 조회한 매칭만)
+path_cache = PathCache(max_paths=app.config.get('PATH_CACHE_SIZE', DEFAULT_MAX_PATHS))
+
+# 기본 지명 사전 (장소 테이블 없이 지명 → 좌표)
+places = seeded_gazetteer()
 
 # Models
 class User(db.Model):
@@ -103,6 +134,8 @@ class Tolerance(db.Model):
     arrival_time = db.Column(db.DateTime, nullable=False)
     container_type = db.Column(db.String(20), nullable=False)  # 20ft, 40ft, etc.
     container_count = db.Column(db.Integer, nullable=False)
+    origin_lat = db.Column(db.Float)  # Pickup coordinates, used to pick the nearest driver
+    origin_lng = db.Column(db.Float)
     is_empty_run = db.Column(db.Boolean, default=False)
     price = db.Column(db.Integer)  # Price in KRW
     status = db.Column(db.String(20), default='available')  # available, matched, completed, cancelled
@@ -136,6 +169,9 @@ class DeliveryRequest(db.Model):
 
 class Match(db.Model):
     __tablename__ = 'matches'
+    __table_args__ = (
+        db.UniqueConstraint('tolerance_id', 'delivery_request_id', name='uq_match_pair'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tolerance_id = db.Column(db.Integer, db.ForeignKey('tolerances.id'), nullable=False)
@@ -150,8 +186,18 @@ class Match(db.Model):
     driver = db.relationship('Driver', backref='matches')
     location_paths = db.relationship('LocationPath', backref='match', lazy=True)
 
+@event.listens_for(Match.status, 'set')
+@event.listens_for(Match.driver_id, 'set')
+def invalidate_tracking_contexts(match, value, oldvalue, initiator):
+    """매칭 상태나 배정 기사가 바뀌면 소켓 권한 캐시에서 그 매칭을 뺀다"""
+    if match.id is not None and value != oldvalue:
+        socket_contexts.invalidate_match(match.id)
+
 class LocationPath(db.Model):
     __tablename__ = 'location_paths'
+    __table_args__ = (
+        db.Index('ix_location_paths_match_time', 'match_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     match_id = db.Column(db.Integer, db.ForeignKey('matches.id'), nullable=False)
@@ -389,6 +435,7 @@ def tolerances():
         if not carrier:
             return jsonify({'error': '운송사 정보를 찾을 수 없습니다'}), 404
         
+        origin_point = places.locate(None, data['origin']) or (None, None)
         tolerance = Tolerance(
             carrier_id=carrier.id,
             origin=data['origin'],
@@ -397,6 +444,8 @@ def tolerances():
             arrival_time=datetime.fromisoformat(data['arrival_time']),
             container_type=data['container_type'],
             container_count=data['container_count'],
+            origin_lat=data.get('origin_lat', origin_point[0]),
+            origin_lng=data.get('origin_lng', origin_point[1]),
             is_empty_run=data.get('is_empty_run', False),
             price=data.get('price'),
             special_requirements=data.get('special_requirements')
@@ -572,6 +621,8 @@ def update_location():
     driver.current_location_lng = data['longitude']
     
     db.session.commit()
+    position_store.update(driver.id, data['latitude'], data['longitude'], data.get('speed'), data.get('heading'))
+    sync_driver(driver)
     
     return jsonify({'success': True, 'message': '위치가 업데이트되었습니다'})
 
@@ -579,15 +630,17 @@ def update_location():
 @login_required
 def get_location_path(match_id):
     match = Match.query.get_or_404(match_id)
-    paths = LocationPath.query.filter_by(match_id=match_id).order_by(LocationPath.timestamp).all()
-    
-    return jsonify([{
-        'latitude': p.latitude,
-        'longitude': p.longitude,
-        'timestamp': p.timestamp.isoformat(),
-        'status': p.status,
-        'notes': p.notes
-    } for p in paths])
+    try:
+        since = parse_history_cursor(request.args.get('since'))
+    except ValueError:
+        return jsonify({'error': '유효하지 않은 since 값입니다'}), 400
+    try:
+        level, zoom = parse_path_detail(request.args.get('level'), request.args.get('zoom'))
+    except ValueError:
+        return jsonify({'error': '유효하지 않은 level 또는 zoom 값입니다'}), 400
+    # level 1-3 (또는 지도 zoom) 이면 단순화한 경로, 없으면 모든 위치
+    level = path_level(match.id, level, zoom)
+    return jsonify(simplified_path(match.id, level, since) if level else location_history(match.id, since))
 
 @app.route('/api/carriers')
 @login_required
@@ -601,6 +654,324 @@ def get_carriers():
         'email': c.email
     } for c in carriers])
 
+def ensure_driver_grid():
+    """Load the driver grid on first use and reload it once it is older than DRIVER_GRID_MAX_AGE"""
+    max_age = app.config.get('DRIVER_GRID_MAX_AGE', 300)
+    if driver_grid.loaded_at is None or time.monotonic() - driver_grid.loaded_at > max_age:
+        positions = db.session.query(Driver.id, Driver.current_location_lat, Driver.current_location_lng) \
+            .filter(Driver.status == 'available', Driver.is_active.is_(True),
+                    Driver.current_location_lat.isnot(None), Driver.current_location_lng.isnot(None)).all()
+        # drivers 테이블은 주기적으로만 갱신되므로 위치 저장소의 최신 위치를 우선한다
+        latest = position_store.get_many([driver_id for driver_id, _, _ in positions])
+        positions = [(driver_id, latest[driver_id].latitude, latest[driver_id].longitude) if driver_id in latest
+                     else (driver_id, lat, lng) for driver_id, lat, lng in positions]
+        driver_grid.load(positions, loaded_at=time.monotonic())
+    return driver_grid
+
+def sync_driver(driver):
+    """Reflect a driver's position or status change in the grid"""
+    if driver_grid.loaded_at is None:
+        return
+    if (driver.status == 'available' and driver.is_active
+            and driver.current_location_lat is not None and driver.current_location_lng is not None):
+        driver_grid.update(driver.id, driver.current_location_lat, driver.current_location_lng)
+    else:
+        driver_grid.discard(driver.id)
+
+# 한 INSERT 문에 넣을 위치 수 (SQLite 바인드 변수 제한 안쪽)
+LOCATION_INSERT_CHUNK = 100
+
+def _update_driver_positions(positions):
+    """One executemany UPDATE of drivers' current location from ``{driver_id: (lat, lng)}``"""
+    drivers = Driver.__table__
+    db.session.execute(
+        drivers.update().where(drivers.c.id == bindparam('driver_id'))
+        .values(current_location_lat=bindparam('lat'), current_location_lng=bindparam('lng')),
+        [{'driver_id': driver_id, 'lat': lat, 'lng': lng} for driver_id, (lat, lng) in positions.items()])
+
+def write_locations(points, positions):
+    """Write buffered GPS points with multi-row inserts and any buffered driver positions, in one transaction"""
+    with app.app_context():
+        try:
+            paths = LocationPath.__table__
+            for start in range(0, len(points), LOCATION_INSERT_CHUNK):
+                db.session.execute(paths.insert().values(points[start:start + LOCATION_INSERT_CHUNK]))
+            if positions:
+                _update_driver_positions(positions)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def write_driver_positions(positions):
+    """Write back the position store's latest driver positions"""
+    with app.app_context():
+        try:
+            _update_driver_positions(positions)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+# 위치 업데이트 쓰기 지연 버퍼 (워커마다 하나, 첫 위치가 들어올 때 시작)
+location_buffer = LocationBuffer(write_locations,
+                                 flush_rows=app.config.get('LOCATION_FLUSH_ROWS', DEFAULT_FLUSH_ROWS),
+                                 flush_interval=app.config.get('LOCATION_FLUSH_MS',
+                                                               DEFAULT_FLUSH_INTERVAL * 1000) / 1000)
+atexit.register(location_buffer.stop)
+
+# 기사 최신 위치 저장소 (drivers 테이블에는 DRIVER_POSITION_WRITE_INTERVAL 초마다 기록)
+position_store = PositionStore(write_driver_positions,
+                               backend=position_backend(app.config.get('DRIVER_POSITION_STORE_URL')),
+                               write_interval=app.config.get('DRIVER_POSITION_WRITE_INTERVAL', DEFAULT_WRITE_INTERVAL))
+atexit.register(position_store.stop)
+
+def queue_location(driver_id, match_id, latitude, longitude, status=None, notes=None, speed=None, heading=None):
+    """Buffer a GPS point for the next batched write and record the driver's latest position.
+
+    Returns (point, position); an indexed driver also moves in the grid right away.
+    """
+    point = location_buffer.start().add(match_id, None, latitude, longitude, status, notes)
+    position = position_store.start().update(driver_id, latitude, longitude, speed, heading, point['timestamp'])
+    path_cache.add_point(match_id, history_point(point['timestamp'], latitude, longitude, status, notes),
+                         point['timestamp'])
+    if driver_grid.loaded_at is not None and driver_id in driver_grid:
+        driver_grid.update(driver_id, latitude, longitude)
+    return point, position
+
+def authorize_tracking(sid, user_id, match_id):
+    """(context, None) if the connection may follow the match, else (None, error message).
+
+    Only a connection's first event for a match, or the first after the
+    match changed, reads the database; the result is kept in socket_contexts.
+    """
+    try:
+        user_id, match_id = int(user_id), int(match_id)
+    except (TypeError, ValueError):
+        return None, '유효하지 않은 매칭입니다'
+    context = socket_contexts.get(sid, user_id, match_id)
+    if context is not None:
+        return context, None
+    
+    user = User.query.get(user_id)
+    if not user:
+        return None, '유효하지 않은 사용자입니다'
+    match = Match.query.get(match_id)
+    if not match:
+        return None, '유효하지 않은 매칭입니다'
+    driver_id = None
+    if user.role == 'driver':
+        driver = Driver.query.filter_by(user_id=user_id).first()
+        if not driver or match.driver_id != driver.id:
+            return None, '권한이 없습니다'
+        driver_id = driver.id
+    elif user.role == 'carrier':
+        # 운송사는 자신의 매칭만 볼 수 있음
+        if not user.carrier or match.tolerance.carrier_id != user.carrier.id:
+            return None, '권한이 없습니다'
+    elif user.role != 'admin':
+        return None, '권한이 없습니다'
+    match_driver = (match.driver_id, match.driver.user.full_name if match.driver else None)
+    return socket_contexts.allow(sid, user, driver_id, match.id, match_driver), None
+
+# join_tracking 이 location_history 메시지 하나에 담는 위치 수
+LOCATION_HISTORY_CHUNK = 500
+
+def history_point(timestamp, latitude, longitude, status, notes, point_id=None):
+    """One point of a location history as sent to clients (``id`` is None until the point is stored)"""
+    return {
+        'id': point_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'timestamp': timestamp.isoformat(),
+        'status': status,
+        'notes': notes
+    }
+
+def history_order(timestamp, point_id):
+    """Sort key of a history point or ``(timestamp, id)`` cursor; unstored points (id None) sort last at their time"""
+    return (timestamp, math.inf if point_id is None else point_id)
+
+def history_cursor(point):
+    """``(timestamp, id)`` cursor of a history point"""
+    return datetime.fromisoformat(point['timestamp']), point['id']
+
+def location_history(match_id, since=None, limit=None):
+    """Path of a match after the ``(timestamp, id)`` cursor ``since``, oldest first and at most ``limit`` points.
+
+    Stored points are merged with those still in the write-behind buffer.
+    Points sharing a timestamp are paged by id, so a chunk boundary between
+    them skips none; a cursor without an id covers every point at its time.
+    The last point's cursor is the one for the next call.
+    """
+    after = history_order(*since) if since is not None else None
+    # 버퍼를 먼저 읽어야 그 사이에 저장된 위치가 빠지지 않는다 (겹치면 중복 제거)
+    pending = [point for point in location_buffer.pending(match_id)
+               if after is None or history_order(point['timestamp'], None) > after]
+    query = LocationPath.query.filter_by(match_id=match_id)
+    if since is not None:
+        timestamp, point_id = since
+        if point_id is None:
+            query = query.filter(LocationPath.timestamp > timestamp)
+        else:
+            query = query.filter(or_(LocationPath.timestamp > timestamp,
+                                     and_(LocationPath.timestamp == timestamp, LocationPath.id > point_id)))
+    query = query.order_by(LocationPath.timestamp, LocationPath.id)
+    if limit is not None:
+        query = query.limit(limit)
+    points = {}
+    for p in query.all():
+        points[(p.timestamp, p.latitude, p.longitude)] = (p.id, p.status, p.notes)
+    for point in pending:
+        points.setdefault((point['timestamp'], point['latitude'], point['longitude']),
+                          (None, point['status'], point['notes']))
+    history = [history_point(timestamp, latitude, longitude, status, notes, point_id)
+               for (timestamp, latitude, longitude), (point_id, status, notes)
+               in sorted(points.items(), key=lambda item: history_order(item[0][0], item[1][0]))]
+    return history if limit is None else history[:limit]
+
+def parse_history_cursor(value):
+    """Cursor sent by a client as ``<ISO timestamp>[,<id>]`` of the last point it has, as ``(timestamp, id)``.
+
+    None when empty; ValueError if malformed.
+    """
+    if not value:
+        return None
+    timestamp, _, point_id = value.partition(',')
+    return datetime.fromisoformat(timestamp), int(point_id) if point_id else None
+
+def format_history_cursor(cursor):
+    timestamp, point_id = cursor
+    return timestamp.isoformat() if point_id is None else f'{timestamp.isoformat()},{point_id}'
+
+def cached_path(match_id):
+    """The match's path at every detail level, built from its history on first use.
+
+    Points this worker queues are added as they arrive; points stored by
+    other workers are caught up from the history on every call.
+    """
+    paths = path_cache.get(match_id)
+    if paths is None:
+        paths = PathLevels(app.config.get('PATH_TOLERANCES_M', DEFAULT_TOLERANCES))
+    for point in location_history(match_id, (paths.cursor, None) if paths.cursor else None):
+        paths.add(point, datetime.fromisoformat(point['timestamp']))
+    path_cache.put(match_id, paths)
+    return paths
+
+def path_level(match_id, level=None, zoom=None):
+    """Detail level to send: ``level`` as asked, else the level for a map ``zoom``, else 0 (every point)"""
+    return choose_level(level, zoom, lambda: cached_path(match_id),
+                        app.config.get('PATH_TOLERANCES_M', DEFAULT_TOLERANCES))
+
+def simplified_path(match_id, level, since=None):
+    """Path of a match at detail ``level`` (1 = finest) after the ``(timestamp, id)`` cursor ``since``, oldest first"""
+    points = cached_path(match_id).points(level)
+    if since is not None:
+        after = history_order(*since)
+        points = [p for p in points if history_order(*history_cursor(p)) > after]
+    return points
+
+def stream_location_history(server, sid, match_id, since=None, level=None, zoom=None, stream=None):
+    """Send the path of a match after ``since`` to one connection, in chunks (run as a background task).
+
+    Every chunk is a ``location_history`` message carrying the cursor of its
+    last point, the detail level and the client's ``stream`` id, so a client
+    that re-joined can drop chunks of older streams; the last one has
+    ``done`` set. Raw
+    chunks are read one at a time so a long haul neither blocks the handler
+    nor loads all its rows at once; simplified paths come from path_cache.
+    """
+    chunk = app.config.get('LOCATION_HISTORY_CHUNK', LOCATION_HISTORY_CHUNK)
+    with app.app_context():
+        try:
+            level = path_level(match_id, level, zoom)
+            simplified = simplified_path(match_id, level, since) if level else None
+            offset = 0
+            while True:
+                if simplified is None:
+                    locations = location_history(match_id, since, chunk)
+                else:
+                    locations = simplified[offset:offset + chunk]
+                    offset += chunk
+                if locations:
+                    since = history_cursor(locations[-1])
+                done = len(locations) < chunk
+                server.emit('location_history', {
+                    'match_id': match_id,
+                    'locations': locations,
+                    'cursor': format_history_cursor(since) if since else None,
+                    'level': level,
+                    'stream': stream,
+                    'done': done
+                }, to=sid)
+                if done:
+                    break
+                server.sleep(0)
+        except Exception as e:
+            logging.error(f"Error in stream_location_history: {str(e)}")
+            server.emit('error', {'message': f'위치 기록 전송 중 오류가 발생했습니다: {str(e)}'}, to=sid)
+        finally:
+            db.session.remove()
+
+def complete_match(match):
+    """Mark a delivered match completed and record its lane price unless its acceptance already did"""
+    if match.status not in ('accepted', 'completed'):
+        record_match_price(match)
+    match.status = 'completed'
+    match.tolerance.status = 'completed'
+    match.delivery_request.status = 'completed'
+
+def nearest_available_driver(tolerance):
+    """Nearest eligible driver to the tolerance origin, with its distance in km.
+
+    Only the DRIVER_MATCH_CANDIDATES nearest drivers from the grid are loaded
+    and re-checked against the database. Tolerances saved without origin
+    coordinates are located through the gazetteer by name. If the origin is
+    still unknown, or no indexed driver is eligible, any available driver
+    is used as before.
+    """
+    if tolerance.origin_lat is not None and tolerance.origin_lng is not None:
+        origin = (tolerance.origin_lat, tolerance.origin_lng)
+    else:
+        origin = places.locate(None, tolerance.origin)
+    if origin is not None:
+        hits = ensure_driver_grid().nearest(origin[0], origin[1], k=app.config.get('DRIVER_MATCH_CANDIDATES', 5))
+        if hits:
+            drivers = {d.id: d for d in Driver.query.filter(Driver.id.in_([driver_id for _, driver_id in hits])).all()}
+            for distance, driver_id in hits:
+                driver = drivers.get(driver_id)
+                if driver and driver.status == 'available' and driver.is_active:
+                    return driver, distance
+                # 다른 워커에서 상태가 바뀐 기사는 인덱스에서 제거
+                if driver:
+                    sync_driver(driver)
+                else:
+                    driver_grid.discard(driver_id)
+    return Driver.query.filter_by(status='available').first(), None
+
+def best_tolerance_for(delivery_request):
+    """Cheapest open tolerance that can serve the request under the MATCH_* rules.
+
+    Only tolerances of a compatible container type departing inside the
+    request's pickup window are loaded; they are then indexed by lane (or by
+    origin grid cell when MATCH_ORIGIN_RADIUS_KM / MATCH_DESTINATION_RADIUS_KM
+    are set), so only the nearby postings are compared with the request.
+    """
+    rules = MatchRules.from_config(app.config)
+    posting = RequestPosting.from_model(delivery_request)
+    proposed = db.session.query(Match.tolerance_id).filter(Match.delivery_request_id == delivery_request.id)
+    window = Tolerance.query.filter(
+        Tolerance.status == 'available',
+        Tolerance.container_type.in_(rules.compatibility.slot_types(posting.container_type)),
+        Tolerance.departure_time.between(posting.pickup_time - rules.departure_before_pickup,
+                                         posting.pickup_time + rules.departure_after_pickup),
+        ~Tolerance.id.in_(proposed))
+    index = ToleranceIndex((TolerancePosting.from_model(t) for t in window), rules, places.locate)
+    candidates = index.candidates(posting)
+    if not candidates:
+        return None
+    return Tolerance.query.get(min(candidates, key=lambda t: pair_cost(t, posting)).id)
+
 @app.route('/api/auto-match', methods=['POST'])
 @login_required
 def auto_match():
@@ -612,12 +983,20 @@ def auto_match():
         tolerance_id = data.get('tolerance_id')
         delivery_request_id = data.get('delivery_request_id')
         
-        if not tolerance_id or not delivery_request_id:
-            return jsonify({'error': 'tolerance_id와 delivery_request_id가 필요합니다'}), 400
+        if not delivery_request_id:
+            return jsonify({'error': 'delivery_request_id가 필요합니다'}), 400
         
-        tolerance = Tolerance.query.get_or_404(tolerance_id)
         delivery_request = DeliveryRequest.query.get_or_404(delivery_request_id)
         
+        # tolerance_id가 없으면 조건에 맞는 가장 저렴한 여유운송을 찾는다
+        if tolerance_id:
+            tolerance = Tolerance.query.get_or_404(tolerance_id)
+        else:
+            tolerance = best_tolerance_for(delivery_request)
+            if not tolerance:
+                return jsonify({'error': '조건에 맞는 여유운송이 없습니다'}), 404
+            tolerance_id = tolerance.id
+        
         # Check if tolerance and delivery request are available
         if tolerance.status != 'available':
             return jsonify({'error': '해당 여유운송은 이미 매칭되었습니다'}), 400
@@ -625,8 +1004,8 @@ def auto_match():
         if delivery_request.status != 'pending':
             return jsonify({'error': '해당 배송요청은 이미 처리되었습니다'}), 400
         
-        # Find available driver
-        driver = Driver.query.filter_by(status='available').first()
+        # Find the nearest available driver
+        driver, distance_km = nearest_available_driver(tolerance)
         
         if not driver:
             return jsonify({'error': '사용 가능한 기사가 없습니다'}), 404
@@ -651,7 +1030,18 @@ def auto_match():
         db.session.add(match)
         db.session.commit()
         
-        return jsonify({'success': True, 'message': '자동 매칭이 완료되었습니다'})
+        return jsonify({
+            'success': True,
+            'tolerance_id': tolerance_id,
+            'driver_id': driver.id,
+            'distance_km': round(distance_km, 2) if distance_km is not None else None,
+            'message': '자동 매칭이 완료되었습니다'
+        })
+    
+    except IntegrityError:
+        # 동시 요청으로 같은 쌍이 먼저 생성된 경우 (uq_match_pair)
+        db.session.rollback()
+        return jsonify({'error': '이미 매칭이 존재합니다'}), 400
     
     except Exception as e:
         db.session.rollback()
@@ -788,6 +1178,7 @@ def admin_carriers():
 def admin_drivers():
     if request.method == 'GET':
         drivers = Driver.query.all()
+        latest = position_store.get_many([d.id for d in drivers])
         return jsonify([{
             'id': d.id,
             'user_id': d.user_id,
@@ -796,8 +1187,8 @@ def admin_drivers():
             'vehicle_type': d.vehicle_type,
             'vehicle_number': d.vehicle_number,
             'status': d.status,
-            'current_location_lat': d.current_location_lat,
-            'current_location_lng': d.current_location_lng,
+            'current_location_lat': latest[d.id].latitude if d.id in latest else d.current_location_lat,
+            'current_location_lng': latest[d.id].longitude if d.id in latest else d.current_location_lng,
             'is_active': d.is_active,
             'created_at': d.created_at.isoformat()
         } for d in drivers])
@@ -829,6 +1220,7 @@ def admin_drivers():
         driver.is_active = data.get('is_active', True)
         
         db.session.commit()
+        sync_driver(driver)
         
         return jsonify({'success': True, 'message': '기사 정보가 업데이트되었습니다'})
     
@@ -836,8 +1228,10 @@ def admin_drivers():
         driver_id = request.args.get('id')
         driver = Driver.query.get_or_404(driver_id)
         
+        deleted_id = driver.id
         db.session.delete(driver)
         db.session.commit()
+        driver_grid.discard(deleted_id)
         
         return jsonify({'success': True, 'message': '기사가 삭제되었습니다'})
 
@@ -955,6 +1349,10 @@ def admin_vehicles():
 # Database initialization
 with app.app_context():
     db.create_all()
+    # create_all 은 기존 테이블에 열/인덱스를 추가하지 않는다
+    upgrade_database(db)
+    # 배송 완료 시 레인 가격을 기록하는 테이블 (main.py 의 모델)
+    LanePrice.__table__.create(db.engine, checkfirst=True)
     logging.info("Database tables created")
     
     # Create default admin user if not exists
@@ -1151,6 +1549,7 @@ def handle_connect():
 def handle_disconnect():
     """클라이언트 연결 해제 처리"""
     logging.info(f"Client disconnected: {request.sid}")
+    socket_contexts.drop(request.sid)
     if request.sid in active_connections:
         user_id = active_connections[request.sid]
         del active_connections[request.sid]
@@ -1166,32 +1565,23 @@ def handle_join_tracking(data):
         if not user_id or not match_id:
             emit('error', {'message': 'user_id와 match_id가 필요합니다'})
             return
-        
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user:
-            emit('error', {'message': '유효하지 않은 사용자입니다'})
+        try:
+            # 재연결한 클라이언트는 마지막으로 받은 위치의 커서 (시각, id) 를 보내 그 이후만 받는다
+            since = parse_history_cursor(data.get('since'))
+        except (TypeError, ValueError):
+            emit('error', {'message': '유효하지 않은 since 값입니다'})
             return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
+        try:
+            # level 1-3 또는 지도 zoom 을 주면 단순화한 경로를 받는다
+            level, zoom = parse_path_detail(data.get('level'), data.get('zoom'))
+        except (TypeError, ValueError):
+            emit('error', {'message': '유효하지 않은 level 또는 zoom 값입니다'})
             return
         
-        # 권한 확인 (기사, 운송사, 관리자만 접근 가능)
-        if user.role == 'driver':
-            driver = Driver.query.filter_by(user_id=user_id).first()
-            if not driver or match.driver_id != driver.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role == 'carrier':
-            # 운송사는 자신의 매칭만 볼 수 있음
-            if match.tolerance.carrier_id != user.carrier.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role != 'admin':
-            emit('error', {'message': '권한이 없습니다'})
+        # 권한 확인 (기사, 운송사, 관리자만 접근 가능) 후 연결별 컨텍스트에 저장
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
         
         # 룸 참가
@@ -1205,20 +1595,9 @@ def handle_join_tracking(data):
             'match_id': match_id
         })
         
-        # 기존 위치 데이터 전송
-        locations = LocationPath.query.filter_by(match_id=match_id).order_by(LocationPath.timestamp).all()
-        location_data = [{
-            'latitude': loc.latitude,
-            'longitude': loc.longitude,
-            'timestamp': loc.timestamp.isoformat(),
-            'status': loc.status,
-            'notes': loc.notes
-        } for loc in locations]
-        
-        emit('location_history', {
-            'match_id': match_id,
-            'locations': location_data
-        })
+        # 기존 위치 데이터는 백그라운드에서 나눠 전송 (아직 저장되지 않은 버퍼 포함)
+        socketio.start_background_task(stream_location_history, socketio, request.sid, int(match_id), since,
+                                       level, zoom, data.get('stream'))
         
     except Exception as e:
         logging.error(f"Error in join_tracking: {str(e)}")
@@ -1241,6 +1620,19 @@ def handle_leave_tracking(data):
         logging.error(f"Error in leave_tracking: {str(e)}")
         emit('error', {'message': f'오류가 발생했습니다: {str(e)}'})
 
+@socketio.on('join_auto_match')
+def handle_join_auto_match(data):
+    """자동 매칭 진행 상황 룸 참가 (job_id가 없으면 전체 작업)"""
+    job_id = (data or {}).get('job_id')
+    room = f"auto_match_{job_id}" if job_id else 'auto_match'
+    join_room(room)
+    if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        emit('joined_auto_match', {'room': room, 'updates': 'socket'})
+    else:
+        # 메시지 큐 없이는 main.py 의 진행 상황이 이 서버로 오지 않는다
+        emit('joined_auto_match', {'room': room, 'updates': 'poll',
+                                   'status_url': f"/api/auto-match/jobs/{job_id}" if job_id else None})
+
 @socketio.on('update_location')
 def handle_update_location(data):
     """기사 위치 업데이트"""
@@ -1251,55 +1643,37 @@ def handle_update_location(data):
         longitude = data.get('longitude')
         status = data.get('status', 'in_transit')
         notes = data.get('notes', '')
+        speed = data.get('speed')  # km/h, 없으면 이전 위치로 계산
+        heading = data.get('heading')
         
         # 필수 데이터 검증
         if not all([user_id, match_id, latitude, longitude]):
             emit('error', {'message': '필수 데이터가 누락되었습니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user or user.role != 'driver':
-            emit('error', {'message': '기사만 위치를 업데이트할 수 있습니다'})
+        # 연결별 컨텍스트로 권한 확인 (처음 한 번만 DB 조회)
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
-            return
-        
-        # 기사 권한 확인
-        driver = Driver.query.filter_by(user_id=user_id).first()
-        if not driver or match.driver_id != driver.id:
-            emit('error', {'message': '권한이 없습니다'})
+        if context.role != 'driver':
+            emit('error', {'message': '기사만 위치를 업데이트할 수 있습니다'})
             return
         
-        # 위치 데이터 저장
-        location_path = LocationPath(
-            match_id=match_id,
-            latitude=latitude,
-            longitude=longitude,
-            status=status,
-            notes=notes
-        )
-        
-        db.session.add(location_path)
-        
-        # 기사 현재 위치 업데이트
-        driver.current_location_lat = latitude
-        driver.current_location_lng = longitude
-        
-        db.session.commit()
+        # 위치는 버퍼에 쌓아 일괄 저장하고 기사 현재 위치는 위치 저장소에 둔다 (브로드캐스트는 저장을 기다리지 않는다)
+        point, position = queue_location(context.driver_id, int(match_id), latitude, longitude, status, notes,
+                                         speed, heading)
         
         # 위치 데이터를 룸의 모든 클라이언트에게 브로드캐스트
         location_data = {
             'match_id': match_id,
-            'driver_id': driver.id,
-            'driver_name': user.full_name,
+            'driver_id': context.driver_id,
+            'driver_name': context.full_name,
             'latitude': latitude,
             'longitude': longitude,
-            'timestamp': location_path.timestamp.isoformat(),
+            'speed': position.speed,
+            'heading': position.heading,
+            'timestamp': point['timestamp'].isoformat(),
             'status': status,
             'notes': notes
         }
@@ -1329,42 +1703,30 @@ def handle_request_location(data):
             emit('error', {'message': 'user_id와 match_id가 필요합니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user:
-            emit('error', {'message': '유효하지 않은 사용자입니다'})
-            return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
-            return
-        
         # 권한 확인
-        if user.role == 'driver':
-            driver = Driver.query.filter_by(user_id=user_id).first()
-            if not driver or match.driver_id != driver.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role == 'carrier':
-            if match.tolerance.carrier_id != user.carrier.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role != 'admin':
-            emit('error', {'message': '권한이 없습니다'})
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
         
-        # 기사 현재 위치 조회
-        driver = Driver.query.get(match.driver_id)
-        if driver and driver.current_location_lat and driver.current_location_lng:
+        # 기사 현재 위치 조회 (위치 저장소에 없을 때만 DB)
+        driver_id, driver_name = context.matches[int(match_id)]
+        position = position_store.get(driver_id) if driver_id else None
+        if position is None and driver_id:
+            driver = Driver.query.get(driver_id)
+            if driver and driver.current_location_lat and driver.current_location_lng:
+                position = Position(driver.current_location_lat, driver.current_location_lng, None, None,
+                                    datetime.utcnow())
+        if position is not None:
             location_data = {
                 'match_id': match_id,
-                'driver_id': driver.id,
-                'driver_name': driver.user.full_name,
-                'latitude': driver.current_location_lat,
-                'longitude': driver.current_location_lng,
-                'timestamp': datetime.now().isoformat(),
+                'driver_id': driver_id,
+                'driver_name': driver_name,
+                'latitude': position.latitude,
+                'longitude': position.longitude,
+                'speed': position.speed,
+                'heading': position.heading,
+                'timestamp': position.timestamp.isoformat(),
                 'status': 'current',
                 'notes': '현재 위치'
             }
@@ -1388,38 +1750,26 @@ def handle_delivery_status_update(data):
             emit('error', {'message': '필수 데이터가 누락되었습니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user or user.role != 'driver':
-            emit('error', {'message': '기사만 배송 상태를 업데이트할 수 있습니다'})
-            return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
+        # 연결별 컨텍스트로 기사 권한 확인
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
-        
-        # 기사 권한 확인
-        driver = Driver.query.filter_by(user_id=user_id).first()
-        if not driver or match.driver_id != driver.id:
-            emit('error', {'message': '권한이 없습니다'})
+        if context.role != 'driver':
+            emit('error', {'message': '기사만 배송 상태를 업데이트할 수 있습니다'})
             return
         
-        # 배송 상태 업데이트
+        # 배송 상태 업데이트 (매칭 상태가 바뀌면 권한 캐시에서 빠진다)
         if status == 'delivered':
-            match.status = 'completed'
-            match.tolerance.status = 'completed'
-            match.delivery_request.status = 'completed'
-        
-        db.session.commit()
+            complete_match(Match.query.get(match_id))
+            db.session.commit()
         
         # 상태 변경을 룸의 모든 클라이언트에게 브로드캐스트
         status_data = {
             'match_id': match_id,
             'status': status,
             'timestamp': datetime.now().isoformat(),
-            'driver_name': user.full_name
+            'driver_name': context.full_name
         }
         
         room = f"match_{match_id}"
@@ -0,0 +1,103 @@
+import heapq
+from itertools import count
+
+
+def min_cost_assignment(edges, unassigned_cost=None, max_visits=None):
+    """One-to-one assignment of requests to tolerances on a sparse candidate graph.
+
+    ``edges`` maps each request id to a list of ``(tolerance_id, cost)``
+    candidates. Returns ``{request_id: tolerance_id}`` minimising the total
+    cost plus ``unassigned_cost`` for every request left without a tolerance.
+    When ``unassigned_cost`` is omitted it is set above any possible saving,
+    which yields the maximum number of pairs and, among those, the minimum
+    total cost. Costs must be non-negative.
+
+    This is the Hungarian method run as successive shortest augmenting paths:
+    requests start on their cheapest candidate when it is free, and every
+    other request runs one Dijkstra over reduced costs that stops at the
+    first free tolerance, so a phase only touches the part of the graph it
+    needs. ``max_visits`` bounds how many tolerances one search may settle;
+    a request that hits the bound stays unassigned, which trades exactness
+    on saturated lanes for a bounded run time.
+    """
+    edges = {request_id: candidates for request_id, candidates in edges.items() if candidates}
+    if unassigned_cost is None:
+        # 미배정 비용은 어떤 배정 조합의 총비용 차이보다 커야 한다
+        unassigned_cost = 1.0 + sum(max(cost for _, cost in candidates) for candidates in edges.values())
+
+    u = {}                   # request potentials
+    v = {}                   # tolerance potentials (default 0)
+    request_match = {}       # request_id -> tolerance_id
+    tolerance_match = {}     # tolerance_id -> request_id
+    rows = {}
+
+    for request_id, candidates in edges.items():
+        # 요청마다 전용 "미배정" 열을 두어 모든 요청이 배정 가능한 문제로 만든다
+        rows[request_id] = candidates + [((None, request_id), unassigned_cost)]
+        tolerance_id, cost = min(rows[request_id], key=lambda candidate: candidate[1])
+        u[request_id] = cost
+        if tolerance_id not in tolerance_match:
+            # u = 최소 비용, v = 0 이므로 이 간선은 축소 비용 0 (tight)
+            request_match[request_id] = tolerance_id
+            tolerance_match[tolerance_id] = request_id
+
+    tiebreak = count()
+
+    for source in rows:
+        if source in request_match:
+            continue
+
+        request_dist = {source: 0.0}
+        dist = {}
+        prev = {}
+        done = set()
+        heap = []
+
+        current, current_dist = source, 0.0
+        while True:
+            base = current_dist - u[current]
+            for tolerance_id, cost in rows[current]:
+                if tolerance_id in done:
+                    continue
+                nd = base + cost - v.get(tolerance_id, 0.0)
+                if nd < dist.get(tolerance_id, float('inf')):
+                    dist[tolerance_id] = nd
+                    prev[tolerance_id] = current
+                    heapq.heappush(heap, (nd, next(tiebreak), tolerance_id))
+
+            while True:
+                d, _, tolerance_id = heapq.heappop(heap)
+                if tolerance_id not in done and d <= dist[tolerance_id]:
+                    break
+
+            done.add(tolerance_id)
+            matched_request = tolerance_match.get(tolerance_id)
+            if matched_request is None or (max_visits and len(done) >= max_visits):
+                break
+            # 매칭된 간선은 축소 비용이 0이므로 같은 거리로 요청 쪽에 도달
+            current, current_dist = matched_request, d
+            request_dist[current] = d
+
+        if tolerance_id in tolerance_match:
+            continue
+
+        # 방문한 노드의 포텐셜을 갱신해 축소 비용을 음수가 아니게 유지
+        sink = tolerance_id
+        total = dist[sink]
+        for tolerance_id in done:
+            v[tolerance_id] = v.get(tolerance_id, 0.0) - (total - dist[tolerance_id])
+        for request_id, d in request_dist.items():
+            u[request_id] += total - d
+
+        tolerance_id = sink
+        while True:
+            request_id = prev[tolerance_id]
+            next_tolerance = request_match.get(request_id)
+            request_match[request_id] = tolerance_id
+            tolerance_match[tolerance_id] = request_id
+            if request_id == source:
+                break
+            tolerance_id = next_tolerance
+
+    return {request_id: tolerance_id for request_id, tolerance_id in request_match.items()
+            if not (isinstance(tolerance_id, tuple) and tolerance_id[0] is None)}
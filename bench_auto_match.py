@@ -0,0 +1,207 @@
+"""Benchmark the matching engine on synthetic order books.
+
+Builds tolerances and requests with a realistic lane skew (about half of
+all traffic leaves Laem Chabang) at a fixed number of postings per day, so
+larger books span more days instead of piling onto the same week. Times
+every auto-match mode end to end (index build + scoring, no database) and
+prints one JSON document that can be stored and compared between releases:
+
+    python bench_auto_match.py --sizes 1000 10000 100000 --output bench.json
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from gazetteer import SEED_PLACES, seeded_gazetteer
+from matching import (DEFAULT_RULES, MatchRules, RequestPosting, ToleranceIndex, TolerancePosting,
+                      propose_matches)
+from tours import TourRules, build_tours
+
+# match_service.AUTO_MATCH_MODES (앱/DB 없이 실행하기 위해 따로 둔다)
+MODES = ('all', 'assignment', 'consolidation', 'tours')
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+HUB = '람차방 항구'
+HUB_SHARE = 0.5
+CONTAINER_MIX = {'40ft': 0.55, '20ft': 0.3, '40HC': 0.12, '45ft': 0.03}
+ROWS_PER_DAY = 1500
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+class OrderBookGenerator:
+    """Synthetic open book over the seeded gazetteer places"""
+
+    def __init__(self, size, seed=17, rows_per_day=ROWS_PER_DAY, start=None):
+        self.rng = random.Random(seed)
+        self.start = start or datetime(2025, 7, 7, 0, 0)
+        self.days = max(1, math.ceil(size / rows_per_day))
+        self.places = seeded_gazetteer()
+        names = [seed['name'] for seed in SEED_PLACES]
+        self.place_ids = {name: self.places.resolve_id(name) for name in names}
+        self.others = [name for name in names if name != HUB]
+        self.other_weights = zipf_weights(len(self.others))
+
+    def lane(self):
+        rng = self.rng
+        if rng.random() < HUB_SHARE:
+            origin = HUB
+        else:
+            origin = rng.choices(self.others, self.other_weights)[0]
+        destinations = [name for name in [HUB] + self.others if name != origin]
+        destination = rng.choices(destinations, zipf_weights(len(destinations)))[0]
+        container_type = rng.choices(list(CONTAINER_MIX), list(CONTAINER_MIX.values()))[0]
+        return origin, destination, container_type
+
+    def moment(self):
+        # 업무 시간대(10시 전후)에 몰린 출발/픽업 시각
+        hour = min(23.99, max(0.0, self.rng.gauss(10, 3)))
+        return self.start + timedelta(days=self.rng.randrange(self.days), hours=hour)
+
+    def transit(self, origin, destination):
+        a = self.places.locate(self.place_ids[origin], origin)
+        b = self.places.locate(self.place_ids[destination], destination)
+        km = math.dist(a, b) * 111
+        return timedelta(hours=2 + km / 60)
+
+    def tolerances(self, count):
+        rng = self.rng
+        postings = []
+        for i in range(1, count + 1):
+            origin, destination, container_type = self.lane()
+            departure = self.moment()
+            container_count = rng.choices((1, 2, 3, 4), (0.5, 0.3, 0.15, 0.05))[0]
+            postings.append(TolerancePosting(
+                i, rng.randrange(1, 200), origin, destination, self.place_ids[origin], self.place_ids[destination],
+                departure, departure + self.transit(origin, destination), container_type, container_count, None,
+                rng.randint(200, 600) * 1000, rng.random() < 0.2))
+        return postings
+
+    def requests(self, count):
+        rng = self.rng
+        postings = []
+        for i in range(1, count + 1):
+            origin, destination, container_type = self.lane()
+            pickup = self.moment()
+            postings.append(RequestPosting(
+                i, rng.randrange(1, 200), origin, destination, self.place_ids[origin], self.place_ids[destination],
+                pickup, pickup + self.transit(origin, destination) + timedelta(hours=rng.randint(1, 12)),
+                container_type, rng.choices((1, 2), (0.8, 0.2))[0], rng.randint(200, 600) * 1000))
+        return postings
+
+
+def run_mode(mode, tolerances, requests, rules, locate, max_visits=None):
+    """Proposals of one mode, as the auto-match job would compute them"""
+    if mode == 'tours':
+        tours = build_tours(tolerances, requests, rules, TourRules.from_config({}), locate)
+        return sum(len(tour.legs) for tour in tours)
+    return len(propose_matches(mode, tolerances, requests, [], rules, locate, max_visits=max_visits))
+
+
+def timed(fn, repeat):
+    """(result, seconds of each run) of calling ``fn`` ``repeat`` times"""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - started)
+    return result, seconds
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(sizes=DEFAULT_SIZES, modes=MODES, repeat=1, seed=17, rules=None, max_visits=None,
+              rows_per_day=ROWS_PER_DAY, log=None):
+    rules = rules or DEFAULT_RULES
+    results = []
+    for size in sizes:
+        generator = OrderBookGenerator(size, seed, rows_per_day)
+        tolerances = generator.tolerances(size)
+        requests = generator.requests(size)
+        locate = generator.places.locate if rules.uses_radius else None
+
+        index, join_seconds = timed(lambda: ToleranceIndex(tolerances, rules, locate), 1)
+        candidate_pairs = sum(len(index.candidates(r)) for r in requests)
+        for mode in modes:
+            proposals, seconds = timed(lambda: run_mode(mode, tolerances, requests, rules, locate, max_visits),
+                                       repeat)
+            row = {
+                'size': size,
+                'mode': mode,
+                'tolerances': len(tolerances),
+                'requests': len(requests),
+                'days': generator.days,
+                'candidate_pairs': candidate_pairs,
+                'proposals': proposals,
+                'seconds': round(min(seconds), 4),
+                'seconds_median': round(statistics.median(seconds), 4),
+                'index_seconds': round(join_seconds[0], 4),
+                'runs': repeat
+            }
+            results.append(row)
+            if log:
+                log(f"{size:>7} {mode:<13} {row['seconds']:>9.3f}s  {proposals} proposals")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Rows per side of the order book')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per size and mode (best and median kept)')
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--rows-per-day', type=int, default=ROWS_PER_DAY,
+                        help='Postings per side per day; sets how many days a book spans')
+    parser.add_argument('--origin-radius-km', type=float, default=0)
+    parser.add_argument('--destination-radius-km', type=float, default=0)
+    parser.add_argument('--max-visits', type=int, default=None, help='MATCH_ASSIGNMENT_MAX_VISITS')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    rules = MatchRules.from_config({'MATCH_ORIGIN_RADIUS_KM': args.origin_radius_km,
+                                    'MATCH_DESTINATION_RADIUS_KM': args.destination_radius_km})
+    report = {
+        'benchmark': 'auto_match',
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'rows_per_day': args.rows_per_day,
+        'rules': {
+            'origin_radius_km': rules.origin_radius_km,
+            'destination_radius_km': rules.destination_radius_km,
+            'price_margin': rules.price_margin,
+            'max_visits': args.max_visits
+        },
+        'results': benchmark(args.sizes, args.modes, args.repeat, args.seed, rules, args.max_visits,
+                             args.rows_per_day, log=lambda line: print(line, file=sys.stderr))
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# 테스트 모듈이 app 을 가져오기 전에 임시 DB 를 지정한다 (가져오는 순서와 무관하게)
+os.environ['TEST_DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['DATABASE_URL'] = os.environ['TEST_DATABASE_URL']
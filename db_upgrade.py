@@ -0,0 +1,126 @@
+import logging
+
+from sqlalchemy import UniqueConstraint, inspect, text
+
+
+def add_missing_columns(db):
+    """Add model columns that an existing database does not have yet.
+
+    ``db.create_all()`` only creates missing tables, so columns added to a
+    model later would otherwise break every query against an older database
+    file. Only additive columns that are nullable or have a server default
+    (which fills existing rows) are handled; anything else needs a manual
+    migration.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                if column.nullable:
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                elif column.server_default is not None:
+                    default = column.server_default.arg
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type} NOT NULL DEFAULT {default}'
+                else:
+                    continue
+                connection.execute(text(ddl))
+                added.append(f'{table.name}.{column.name}')
+    if added:
+        logging.info(f"Added columns: {', '.join(added)}")
+    return added
+
+
+# 중복 매칭 중 남길 행: 진행된 상태가 먼저, 같으면 먼저 만든 행
+_MATCH_STATUS_RANK = {'completed': 0, 'accepted': 1, 'pending': 2}
+
+
+def remove_duplicate_matches(db):
+    """Keep one match per (tolerance_id, delivery_request_id) so uq_match_pair can be created.
+
+    Databases created before the constraint may hold the same pair twice.
+    The most advanced match of a pair (completed, accepted, pending, then
+    anything else; lowest id on ties) is kept. Location paths of the
+    removed rows move to it, and slots reserved by removed pending matches
+    go back to their tolerance. Returns the number of rows removed.
+    """
+    inspector = inspect(db.engine)
+    if 'matches' not in inspector.get_table_names():
+        return 0
+    columns = {column['name'] for column in inspector.get_columns('matches')}
+    with db.engine.begin() as connection:
+        rows = connection.execute(text(
+            'SELECT m.id, m.tolerance_id, m.delivery_request_id, m.status, '
+            + ('m.container_count ' if 'container_count' in columns else 'NULL ')
+            + 'FROM matches m JOIN (SELECT tolerance_id, delivery_request_id FROM matches '
+              'GROUP BY tolerance_id, delivery_request_id HAVING COUNT(*) > 1) d '
+              'ON d.tolerance_id = m.tolerance_id AND d.delivery_request_id = m.delivery_request_id')).fetchall()
+        pairs = {}
+        for row in rows:
+            pairs.setdefault((row[1], row[2]), []).append(row)
+        removed = 0
+        for (tolerance_id, _), duplicates in pairs.items():
+            duplicates.sort(key=lambda row: (_MATCH_STATUS_RANK.get(row[3], 3), row[0]))
+            keep = duplicates[0][0]
+            for match_id, _, _, status, container_count in duplicates[1:]:
+                connection.execute(text('UPDATE location_paths SET match_id = :keep WHERE match_id = :match_id'),
+                                   {'keep': keep, 'match_id': match_id})
+                if status == 'pending' and container_count:
+                    connection.execute(text('UPDATE tolerances SET remaining_count = remaining_count + :count '
+                                            'WHERE id = :id AND remaining_count IS NOT NULL'),
+                                       {'count': container_count, 'id': tolerance_id})
+                connection.execute(text('DELETE FROM matches WHERE id = :match_id'), {'match_id': match_id})
+                removed += 1
+    if removed:
+        logging.warning(f"Removed {removed} duplicate matches")
+    return removed
+
+
+def add_missing_indexes(db):
+    """Create model indexes and unique constraints that an existing database does not have yet.
+
+    A unique constraint is created as a unique index of the same name; an
+    index or constraint already present on the same columns under another
+    name counts as present. Duplicate rows must be removed first.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {(tuple(index['column_names']), bool(index['unique']))
+                       for index in inspector.get_indexes(table.name)}
+            present |= {(tuple(constraint['column_names']), True)
+                        for constraint in inspector.get_unique_constraints(table.name)}
+            wanted = [(index.name, tuple(column.name for column in index.columns), bool(index.unique))
+                      for index in table.indexes]
+            wanted += [(constraint.name, tuple(column.name for column in constraint.columns), True)
+                       for constraint in table.constraints
+                       if isinstance(constraint, UniqueConstraint) and constraint.name]
+            for name, column_names, unique in wanted:
+                # 같은 열의 유니크 인덱스는 일반 인덱스도 대신한다
+                if (column_names, unique) in present or (column_names, True) in present:
+                    continue
+                connection.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+                                        f"ON {table.name} ({', '.join(column_names)})"))
+                present.add((column_names, unique))
+                added.append(name)
+    if added:
+        logging.info(f"Added indexes: {', '.join(added)}")
+    return added
+
+
+def upgrade_database(db):
+    """Bring an existing database file up to the models: columns, duplicate matches, then indexes"""
+    add_missing_columns(db)
+    remove_duplicate_matches(db)
+    add_missing_indexes(db)
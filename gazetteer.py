@@ -0,0 +1,140 @@
+import difflib
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+PlaceEntry = namedtuple('PlaceEntry', ['id', 'name', 'latitude', 'longitude'])
+
+# 동부 임해 지역(Eastern Seaboard)과 주요 한국 항만 기본 지명
+SEED_PLACES = [
+    {'name': '람차방 항구', 'latitude': 13.0833, 'longitude': 100.8833,
+     'aliases': ['람차방', '람차방항', 'Laem Chabang', 'Laem Chabang Port', 'LCB', 'THLCH']},
+    {'name': '방콕 항구', 'latitude': 13.7000, 'longitude': 100.5667,
+     'aliases': ['방콕항', '클롱토이', 'Bangkok Port', 'Khlong Toei', 'PAT', 'THBKK']},
+    {'name': '맙타풋 항구', 'latitude': 12.6667, 'longitude': 101.1500,
+     'aliases': ['맙타풋', '맙타풋항', 'Map Ta Phut', 'Map Ta Phut Port', 'THMAT']},
+    {'name': '랏끄라방 ICD', 'latitude': 13.7234, 'longitude': 100.7565,
+     'aliases': ['랏끄라방', '라트크라방 ICD', 'Lat Krabang', 'Lat Krabang ICD', 'LKB']},
+    {'name': '시라차', 'latitude': 13.1737, 'longitude': 100.9311,
+     'aliases': ['씨라차', 'Si Racha', 'Sriracha']},
+    {'name': '촌부리', 'latitude': 13.3611, 'longitude': 100.9847,
+     'aliases': ['Chon Buri', 'Chonburi']},
+    {'name': '라용', 'latitude': 12.6814, 'longitude': 101.2816,
+     'aliases': ['Rayong']},
+    {'name': '파타야', 'latitude': 12.9236, 'longitude': 100.8825,
+     'aliases': ['Pattaya']},
+    {'name': '차청사오', 'latitude': 13.6904, 'longitude': 101.0779,
+     'aliases': ['Chachoengsao']},
+    {'name': '아마타 시티 촌부리', 'latitude': 13.4237, 'longitude': 101.0194,
+     'aliases': ['아마타 나콘', 'Amata City Chonburi', 'Amata Nakorn']},
+    {'name': '이스턴 시보드 산업단지', 'latitude': 13.0465, 'longitude': 101.1055,
+     'aliases': ['ESIE', 'Eastern Seaboard Industrial Estate']},
+    {'name': '수완나품 공항', 'latitude': 13.6900, 'longitude': 100.7501,
+     'aliases': ['수완나품', 'Suvarnabhumi', 'Suvarnabhumi Airport', 'BKK']},
+    {'name': '부산 신항', 'latitude': 35.0750, 'longitude': 128.8170,
+     'aliases': ['부산신항', '신항', 'Busan New Port', 'KRPUS']},
+    {'name': '부산 북항', 'latitude': 35.1040, 'longitude': 129.0400,
+     'aliases': ['부산북항', '부산항', 'Busan North Port']},
+    {'name': '인천 항구', 'latitude': 37.4563, 'longitude': 126.5983,
+     'aliases': ['인천항', '인천 신항', 'Incheon Port', 'KRINC']},
+    {'name': '광양 항구', 'latitude': 34.9000, 'longitude': 127.7000,
+     'aliases': ['광양항', 'Gwangyang Port', 'KRKAN']},
+]
+
+_GENERIC_SUFFIXES = ('항구', '항')
+_RESOLVED_CACHE_SIZE = 10000
+
+
+def normalize_name(name):
+    """지명 비교용 정규화: NFKC, 소문자, 공백/구두점 제거"""
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKC', name).casefold()
+    return re.sub(r'[\s\-_.,()/\'"]+', '', text)
+
+
+class Gazetteer:
+    """In-process cache that resolves free-text place names to canonical places.
+
+    Names and aliases are indexed by their normalized form. A lookup tries
+    the exact form, then the form without a trailing generic suffix, then a
+    difflib close match; every answer (including misses) is memoised so a
+    repeated spelling costs one dict lookup.
+    """
+
+    def __init__(self, fuzzy_cutoff=0.85):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.loaded_at = None
+        self.version = 0
+        self._by_key = {}
+        self._by_id = {}
+        self._resolved = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def load(self, places, loaded_at=None):
+        """Replace the cache with ``(PlaceEntry, aliases)`` rows"""
+        with self._lock:
+            self._by_key = {}
+            self._by_id = {}
+            self._resolved = {}
+            for place, aliases in places:
+                self.add(place, aliases)
+            self.loaded_at = loaded_at
+            self.version += 1
+
+    def add(self, place, aliases=()):
+        with self._lock:
+            self._by_id[place.id] = place
+            for name in (place.name, *aliases):
+                key = normalize_name(name)
+                if key:
+                    self._by_key.setdefault(key, place)
+            self._resolved = {}
+            self.version += 1
+
+    def get(self, place_id):
+        return self._by_id.get(place_id)
+
+    def resolve(self, name):
+        """The PlaceEntry a free-text name refers to, or None"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+            place = self._by_key.get(key)
+            if place is None:
+                for suffix in _GENERIC_SUFFIXES:
+                    if key.endswith(suffix) and key[:-len(suffix)] in self._by_key:
+                        place = self._by_key[key[:-len(suffix)]]
+                        break
+            if place is None:
+                close = difflib.get_close_matches(key, self._by_key, n=1, cutoff=self.fuzzy_cutoff)
+                if close:
+                    place = self._by_key[close[0]]
+            if len(self._resolved) >= _RESOLVED_CACHE_SIZE:
+                self._resolved = {}
+            self._resolved[key] = place
+            return place
+
+    def resolve_id(self, name):
+        place = self.resolve(name)
+        return place.id if place else None
+
+    def locate(self, place_id, name=None):
+        """(lat, lng) of a place id, or of the name when the id is unknown"""
+        place = self.get(place_id) if place_id is not None else self.resolve(name)
+        return (place.latitude, place.longitude) if place else None
+
+
+def seeded_gazetteer():
+    """A Gazetteer over SEED_PLACES, numbered from 1 in list order, for apps without a places table"""
+    book = Gazetteer()
+    book.load((PlaceEntry(i, seed['name'], seed['latitude'], seed['longitude']), seed['aliases'])
+              for i, seed in enumerate(SEED_PLACES, start=1))
+    return book
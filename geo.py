@@ -0,0 +1,128 @@
+import math
+import threading
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """두 좌표 사이의 대권 거리 (km)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class DriverGrid:
+    """In-memory grid index of driver positions.
+
+    Positions are bucketed into ``cell_deg`` x ``cell_deg`` cells. A nearest
+    query scans rings of cells outwards from the query cell and stops as soon
+    as the next ring cannot hold anything closer than the k-th hit, so it
+    touches the drivers around the point instead of the whole fleet.
+    """
+
+    def __init__(self, cell_deg=0.1):
+        self.cell_deg = cell_deg
+        self.loaded_at = None
+        self._cells = defaultdict(set)
+        self._positions = {}
+        self._max_abs_lat = 0.0
+        self._bounds = None  # 사용된 셀의 (min_row, max_row, min_col, max_col), 늘어나기만 한다
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, driver_id):
+        return driver_id in self._positions
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def load(self, positions, loaded_at=None):
+        """Replace the index with ``(driver_id, lat, lng)`` rows"""
+        with self._lock:
+            self._cells = defaultdict(set)
+            self._positions = {}
+            self._max_abs_lat = 0.0
+            self._bounds = None
+            for driver_id, lat, lng in positions:
+                self.update(driver_id, lat, lng)
+            self.loaded_at = loaded_at
+
+    def update(self, driver_id, lat, lng):
+        with self._lock:
+            self.discard(driver_id)
+            self._positions[driver_id] = (lat, lng)
+            row, col = self._cell(lat, lng)
+            self._cells[(row, col)].add(driver_id)
+            self._max_abs_lat = max(self._max_abs_lat, abs(lat))
+            if self._bounds is None:
+                self._bounds = (row, row, col, col)
+            else:
+                min_row, max_row, min_col, max_col = self._bounds
+                self._bounds = (min(min_row, row), max(max_row, row), min(min_col, col), max(max_col, col))
+
+    def discard(self, driver_id):
+        with self._lock:
+            position = self._positions.pop(driver_id, None)
+            if position is None:
+                return
+            cell = self._cell(*position)
+            self._cells[cell].discard(driver_id)
+            if not self._cells[cell]:
+                del self._cells[cell]
+                if not self._cells:
+                    self._bounds = None
+
+    def _ring_lower_bound_km(self, ring, lat):
+        """Smallest possible distance to a driver ``ring + 1`` or more cells away"""
+        delta = math.radians(ring * self.cell_deg)
+        # 경도 방향 간격은 고위도일수록 짧아지므로 가장 높은 위도를 기준으로 한다
+        cos_phi = math.cos(math.radians(min(90.0, max(abs(lat), self._max_abs_lat))))
+        lng_bound = 2 * math.asin(min(1.0, cos_phi * math.sin(min(delta, math.pi) / 2)))
+        return EARTH_RADIUS_KM * min(delta, lng_bound)
+
+    def nearest(self, lat, lng, k=1, max_km=None):
+        """Up to ``k`` ``(distance_km, driver_id)`` pairs closest to the point, nearest first"""
+        with self._lock:
+            if not self._cells or k <= 0:
+                return []
+            row, col = self._cell(lat, lng)
+            # 범위는 제거 시 줄어들지 않으므로 실제보다 넓을 수 있지만 빈 고리만 더 훑는다
+            min_row, max_row, min_col, max_col = self._bounds
+            max_ring = max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+            found = []
+            for ring in range(max_ring + 1):
+                for cell in self._ring_cells(row, col, ring):
+                    for driver_id in self._cells.get(cell, ()):
+                        driver_lat, driver_lng = self._positions[driver_id]
+                        found.append((haversine_km(lat, lng, driver_lat, driver_lng), driver_id))
+                bound = self._ring_lower_bound_km(ring, lat)
+                if max_km is not None and bound > max_km:
+                    break
+                if len(found) >= k:
+                    found.sort()
+                    del found[k:]
+                    if found[-1][0] <= bound:
+                        break
+
+            found.sort()
+            if max_km is not None:
+                found = [hit for hit in found if hit[0] <= max_km]
+            return found[:k]
+
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, c)
+            yield (row + ring, c)
+        for r in range(row - ring + 1, row + ring):
+            yield (r, col - ring)
+            yield (r, col + ring)
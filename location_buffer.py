@@ -0,0 +1,135 @@
+import logging
+import threading
+from datetime import datetime
+
+DEFAULT_FLUSH_ROWS = 500
+DEFAULT_FLUSH_INTERVAL = 0.5  # 초
+# 쓰기가 계속 실패할 때 메모리에 남겨 둘 최대 위치 수 (넘치면 오래된 것부터 버린다)
+DEFAULT_MAX_PENDING = 50000
+
+
+class LocationBuffer:
+    """Write-behind queue for GPS points.
+
+    ``add`` only appends under a lock, so a location update never waits for
+    the database. A background thread hands everything queued to
+    ``writer(points, positions)`` every ``flush_interval`` seconds, or as soon
+    as ``flush_rows`` points are waiting. ``points`` are LocationPath rows in
+    arrival order; ``positions`` maps driver id to its latest (lat, lng), so
+    a driver pinging many times between flushes costs one row update.
+
+    A failed write is logged and its points are queued again in front of
+    newer ones, keeping at most ``max_pending`` points. The batch being
+    written stays visible to ``pending`` and ``position`` until ``writer``
+    returns, so a reader never finds a point in neither the buffer nor the
+    database.
+    """
+
+    def __init__(self, writer, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.writer = writer
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.points = []
+        self.positions = {}
+        # flush 중인 배치 (writer 가 커밋할 때까지 pending/position 에서 보인다)
+        self._inflight = []
+        self._inflight_positions = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, match_id, driver_id, latitude, longitude, status=None, notes=None, timestamp=None):
+        """Queue a point for the next flush and return it (with its timestamp)"""
+        point = {
+            'match_id': match_id,
+            'latitude': latitude,
+            'longitude': longitude,
+            'timestamp': timestamp or datetime.utcnow(),
+            'status': status,
+            'notes': notes
+        }
+        with self._lock:
+            self.points.append(point)
+            if driver_id is not None:
+                self.positions[driver_id] = (latitude, longitude)
+            full = len(self.points) >= self.flush_rows
+        if full:
+            self._wake.set()
+        return point
+
+    def pending(self, match_id):
+        """Queued points of a match not written yet, oldest first"""
+        with self._lock:
+            return [point for point in self._inflight + self.points if point['match_id'] == match_id]
+
+    def position(self, driver_id):
+        """Latest queued (lat, lng) of a driver, or None"""
+        with self._lock:
+            return self.positions.get(driver_id, self._inflight_positions.get(driver_id))
+
+    def flush(self):
+        """Write everything queued so far; returns the number of points written"""
+        with self._flush_lock:
+            with self._lock:
+                points, positions = self.points, self.positions
+                self.points, self.positions = [], {}
+                self._inflight, self._inflight_positions = points, positions
+            if not points and not positions:
+                return 0
+            try:
+                self.writer(points, positions)
+            except Exception as e:
+                logging.error(f"Location flush 오류 ({len(points)} points): {str(e)}")
+                self._requeue(points, positions)
+                return 0
+            with self._lock:
+                self._inflight, self._inflight_positions = [], {}
+            return len(points)
+
+    def _requeue(self, points, positions):
+        with self._lock:
+            self._inflight, self._inflight_positions = [], {}
+            self.points = points + self.points
+            # 실패한 배치 이후에 들어온 위치가 더 최신이다
+            self.positions = {**positions, **self.positions}
+            overflow = len(self.points) - self.max_pending
+            if overflow > 0:
+                del self.points[:overflow]
+                self.dropped += overflow
+                logging.warning(f"Location buffer full, dropped {overflow} oldest points")
+
+    def start(self):
+        """Start the background flusher (once)"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='location-buffer', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break  # 남은 위치는 stop() 이 쓴다
+            self.flush()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still queued"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, 4 * self.flush_interval))
+            self._thread = None
+        return self.flush()
@@ -1,13 +1,25 @@
 from app import app, db
-from models import User, Carrier, Driver, Tolerance, DeliveryRequest, Match, LocationPath
+from models import User, Carrier, Driver, Tolerance, DeliveryRequest, Match, LocationPath, Place, MatchJob
+from match_service import (AUTO_MATCH_MODES, match_partition, simulate_auto_match, match_new_tolerance, match_new_request, sync_tolerance,
+                           sync_request, release_slots, ranked_candidates, ensure_lane_book)
+from matching import free_slots
+from db_upgrade import upgrade_database
+from match_jobs import MatchLockedError, job_payload, progress_updates, run_auto_match_job, submit_auto_match
+from path_service import path_level, path_point, simplified_path, stored_path
+from path_simplify import parse_path_detail
+from place_service import add_place, assign_places, backfill_places, resolve_place, seed_places
+from price_service import backfill_lane_prices, lane_quotes, record_match_price
 from datetime import datetime, timedelta
 from functools import wraps
 import json
+import math
+import click
 import bcrypt
 import jwt
 from flask import render_template, request, jsonify, session, redirect, url_for
 import logging
 import os
+from sqlalchemy.orm.exc import StaleDataError
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -232,14 +244,19 @@ def tolerances():
                 arrival_time=datetime.fromisoformat(data['arrival_time']) if data.get('arrival_time') else None,
                 container_type=data['container_type'],
                 container_count=data.get('container_count', 1),
+                remaining_count=data.get('container_count', 1),
                 is_empty_run=data.get('is_empty_run', False),
                 price=data.get('price', 0)
             )
+            assign_places(tolerance)
             
             db.session.add(tolerance)
             db.session.commit()
             
-            return jsonify({'success': True, 'message': '여유 운송이 등록되었습니다'})
+            # 새 여유 운송만 열린 운송 요청과 바로 매칭
+            matches_created = match_new_tolerance(tolerance)
+            
+            return jsonify({'success': True, 'message': '여유 운송이 등록되었습니다', 'matches_created': matches_created})
         
         elif request.method == 'PUT':
             if user.role != 'carrier':
@@ -261,11 +278,19 @@ def tolerances():
             if tolerance.carrier_id != carrier.id:
                 return jsonify({'error': '이 여유 운송을 수정할 권한이 없습니다'}), 403
             
+            # 합적 매칭에 이미 배정된 슬롯보다 적게 줄일 수 없다
+            if 'container_count' in data and tolerance.remaining_count is not None:
+                reserved = tolerance.container_count - tolerance.remaining_count
+                if data['container_count'] < reserved:
+                    return jsonify({'error': f'이미 배정된 슬롯 {reserved}개보다 적게 줄일 수 없습니다'}), 409
+            
             # 필드 업데이트
             if 'origin' in data:
                 tolerance.origin = data['origin']
             if 'destination' in data:
                 tolerance.destination = data['destination']
+            if 'origin' in data or 'destination' in data:
+                assign_places(tolerance)
             if 'departure_time' in data:
                 tolerance.departure_time = datetime.fromisoformat(data['departure_time'])
             if 'arrival_time' in data:
@@ -273,6 +298,9 @@ def tolerances():
             if 'container_type' in data:
                 tolerance.container_type = data['container_type']
             if 'container_count' in data:
+                # 이미 배정된 슬롯은 유지하고 늘어나거나 줄어든 만큼만 반영
+                if tolerance.remaining_count is not None:
+                    tolerance.remaining_count += data['container_count'] - tolerance.container_count
                 tolerance.container_count = data['container_count']
             if 'is_empty_run' in data:
                 tolerance.is_empty_run = data['is_empty_run']
@@ -282,6 +310,7 @@ def tolerances():
                 tolerance.status = data['status']
             
             db.session.commit()
+            sync_tolerance(tolerance)
             
             return jsonify({'success': True, 'message': '여유 운송이 수정되었습니다'})
         
@@ -314,6 +343,10 @@ def tolerances():
         
         return jsonify(result)
     
+    except StaleDataError:
+        # 다른 워커(자동 매칭 등)가 먼저 같은 행을 바꿨다
+        db.session.rollback()
+        return jsonify({'error': '다른 사용자가 먼저 변경했습니다. 새로고침 후 다시 시도하세요'}), 409
     except Exception as e:
         db.session.rollback()
         print(f"Tolerances 오류: {str(e)}")  # 서버 로그에 오류 출력
@@ -345,11 +378,15 @@ def delivery_requests():
                 cargo_details_json=json.dumps(data.get('cargo_details', {})),
                 budget=data.get('budget', 0)
             )
+            assign_places(delivery_request)
             
             db.session.add(delivery_request)
             db.session.commit()
             
-            return jsonify({'success': True, 'message': '운송 요청이 등록되었습니다'})
+            # 새 운송 요청만 열린 여유 운송과 바로 매칭
+            matches_created = match_new_request(delivery_request)
+            
+            return jsonify({'success': True, 'message': '운송 요청이 등록되었습니다', 'matches_created': matches_created})
         
         elif request.method == 'PUT':
             if user.role != 'carrier':
@@ -376,6 +413,8 @@ def delivery_requests():
                 delivery_request.origin = data['origin']
             if 'destination' in data:
                 delivery_request.destination = data['destination']
+            if 'origin' in data or 'destination' in data:
+                assign_places(delivery_request)
             if 'pickup_time' in data:
                 delivery_request.pickup_time = datetime.fromisoformat(data['pickup_time'])
             if 'delivery_time' in data:
@@ -392,6 +431,7 @@ def delivery_requests():
                 delivery_request.status = data['status']
             
             db.session.commit()
+            sync_request(delivery_request)
             
             return jsonify({'success': True, 'message': '운송 요청이 수정되었습니다'})
         
@@ -424,6 +464,10 @@ def delivery_requests():
         
         return jsonify(result)
     
+    except StaleDataError:
+        # 다른 워커(자동 매칭 등)가 먼저 같은 행을 바꿨다
+        db.session.rollback()
+        return jsonify({'error': '다른 사용자가 먼저 변경했습니다. 새로고침 후 다시 시도하세요'}), 409
     except Exception as e:
         db.session.rollback()
         print(f"Delivery requests 오류: {str(e)}")  # 서버 로그에 오류 출력
@@ -473,6 +517,9 @@ def matches():
                     'vehicle_number': match.driver.vehicle_number if match.driver else None
                 },
                 'status': match.status,
+                'price': match.price,
+                'tour_id': match.tour_id,
+                'tour_seq': match.tour_seq,
                 'created_at': match.created_at.isoformat() if match.created_at else None
             })
         
@@ -495,16 +542,27 @@ def accept_match(match_id):
             if match.tolerance.carrier_id != carrier.id and match.delivery_request.carrier_id != carrier.id:
                 return jsonify({'error': '이 매칭을 수락할 권한이 없습니다'}), 403
         
+        # 처음 수락될 때만 레인 가격 통계에 반영
+        if match.status not in ('accepted', 'completed'):
+            record_match_price(match)
         match.status = 'accepted'
         
         # Update tolerance and request status
-        match.tolerance.status = 'matched'
+        # 합적 매칭은 남은 슬롯이 있으면 여유 운송을 계속 열어 둔다
+        if not match.container_count or free_slots(match.tolerance) <= 0:
+            match.tolerance.status = 'matched'
         match.delivery_request.status = 'matched'
         
         db.session.commit()
+        sync_tolerance(match.tolerance)
+        sync_request(match.delivery_request)
         
         return jsonify({'success': True, 'message': '매칭이 수락되었습니다'})
     
+    except StaleDataError:
+        # 다른 워커(자동 매칭 등)가 먼저 같은 행을 바꿨다
+        db.session.rollback()
+        return jsonify({'error': '다른 사용자가 먼저 변경했습니다. 새로고침 후 다시 시도하세요'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
@@ -524,16 +582,38 @@ def reject_match(match_id):
             if match.tolerance.carrier_id != carrier.id and match.delivery_request.carrier_id != carrier.id:
                 return jsonify({'error': '이 매칭을 거절할 권한이 없습니다'}), 403
         
-        match.status = 'rejected'
-        
-        # Reset tolerance and request status
-        match.tolerance.status = 'available'
-        match.delivery_request.status = 'pending'
+        # 투어는 한 트럭의 연속 운행이므로 한 구간을 거절하면 투어 전체를 거절한다
+        legs = [match]
+        if match.tour_id:
+            legs = Match.query.filter(Match.tour_id == match.tour_id,
+                                      Match.status.notin_(('rejected', 'completed'))).all()
+        
+        for leg in legs:
+            # 대기 중이든 수락됐든 아직 잡고 있는 합적 슬롯은 돌려준다
+            if leg.status not in ('rejected', 'completed'):
+                release_slots(leg)
+            leg.status = 'rejected'
+            
+            # Reset tolerance and request status
+            leg.tolerance.status = 'available'
+            # 요청이 그 사이 다른 매칭으로 수락됐으면 다시 열지 않는다
+            matched_elsewhere = Match.query.filter(Match.delivery_request_id == leg.delivery_request_id,
+                                                   Match.id != leg.id,
+                                                   Match.status.in_(('accepted', 'completed'))).first()
+            if matched_elsewhere is None:
+                leg.delivery_request.status = 'pending'
         
         db.session.commit()
+        sync_tolerance(match.tolerance)
+        for leg in legs:
+            sync_request(leg.delivery_request)
         
-        return jsonify({'success': True, 'message': '매칭이 거절되었습니다'})
+        return jsonify({'success': True, 'message': '매칭이 거절되었습니다', 'rejected': [leg.id for leg in legs]})
     
+    except StaleDataError:
+        # 다른 워커(자동 매칭 등)가 먼저 같은 행을 바꿨다
+        db.session.rollback()
+        return jsonify({'error': '다른 사용자가 먼저 변경했습니다. 새로고침 후 다시 시도하세요'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
@@ -578,17 +658,16 @@ def update_location():
 @app.route('/api/location/path/<int:match_id>')
 @login_required
 def get_location_path(match_id):
-    paths = LocationPath.query.filter_by(match_id=match_id).order_by(LocationPath.timestamp).all()
-    
-    result = []
-    for path in paths:
-        result.append({
-            'latitude': path.latitude,
-            'longitude': path.longitude,
-            'timestamp': path.timestamp.isoformat()
-        })
+    try:
+        level, zoom = parse_path_detail(request.args.get('level'), request.args.get('zoom'))
+    except ValueError:
+        return jsonify({'error': '유효하지 않은 level 또는 zoom 값입니다'}), 400
     
-    return jsonify(result)
+    # level 1-3 (또는 지도 zoom) 이면 단순화한 경로, 없으면 모든 위치
+    level = path_level(match_id, level, zoom)
+    if level:
+        return jsonify(simplified_path(match_id, level))
+    return jsonify([path_point(path) for path in stored_path(match_id)])
 
 @app.route('/api/carriers')
 @login_required
@@ -605,10 +684,150 @@ def get_carriers():
     
     return jsonify(result)
 
+@app.route('/api/delivery-requests/<int:request_id>/candidates')
+@login_required
+def request_candidates(request_id):
+    """Top-k open tolerances for a delivery request, best first"""
+    try:
+        user = request.user
+        delivery_request = DeliveryRequest.query.get(request_id)
+        if not delivery_request:
+            return jsonify({'error': '운송 요청을 찾을 수 없습니다'}), 404
+        
+        if user.role == 'carrier':
+            carrier = Carrier.query.filter_by(user_id=user.id).first()
+            if not carrier or delivery_request.carrier_id != carrier.id:
+                return jsonify({'error': '이 운송 요청의 후보를 조회할 권한이 없습니다'}), 403
+        elif user.role != 'admin':
+            return jsonify({'error': '권한이 없습니다'}), 403
+        
+        k = max(1, min(request.args.get('k', 10, type=int), app.config.get('MATCH_RANKING_MAX_K', 50)))
+        ranked = ranked_candidates(delivery_request, k)
+        carriers = {c.id: c.company_name for c in
+                    Carrier.query.filter(Carrier.id.in_({t.carrier_id for _, t, _ in ranked})).all()} if ranked else {}
+        
+        return jsonify([{
+            'tolerance_id': t.id,
+            'carrier_id': t.carrier_id,
+            'carrier_name': carriers.get(t.carrier_id),
+            'origin': t.origin,
+            'destination': t.destination,
+            'departure_time': t.departure_time.isoformat(),
+            'arrival_time': t.arrival_time.isoformat() if t.arrival_time else None,
+            'container_type': t.container_type,
+            'price': t.price,
+            'score': round(score, 4),
+            **components
+        } for score, t, components in ranked])
+    
+    except Exception as e:
+        return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
+
+@app.route('/api/places', methods=['GET', 'POST'])
+@login_required
+def places():
+    try:
+        if request.method == 'POST':
+            if request.user.role != 'admin':
+                return jsonify({'error': '관리자만 장소를 등록할 수 있습니다'}), 403
+            
+            data = request.get_json()
+            if not data or not data.get('name') or data.get('latitude') is None or data.get('longitude') is None:
+                return jsonify({'error': 'name, latitude, longitude가 필요합니다'}), 400
+            if Place.query.filter_by(name=data['name']).first():
+                return jsonify({'error': '이미 등록된 장소입니다'}), 400
+            
+            place = add_place(data['name'], data['latitude'], data['longitude'], data.get('aliases', []))
+            return jsonify({'success': True, 'id': place.id, 'message': '장소가 등록되었습니다'})
+        
+        # ?q= 로 자유 입력 지명을 표준 장소로 변환
+        query = request.args.get('q')
+        if query is not None:
+            place = resolve_place(query)
+            if not place:
+                return jsonify({'error': f'장소를 찾을 수 없습니다: {query}'}), 404
+            return jsonify(place._asdict())
+        
+        return jsonify([{
+            'id': p.id,
+            'name': p.name,
+            'latitude': p.latitude,
+            'longitude': p.longitude,
+            'aliases': json.loads(p.aliases_json or '[]')
+        } for p in Place.query.order_by(Place.name).all()])
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
+
+@app.route('/api/order-book')
+@login_required
+def order_book():
+    """Best bid (delivery request) and ask (tolerance) of every lane/day order book"""
+    try:
+        result = []
+        for quote in ensure_lane_book().snapshot():
+            # 예산 없는 요청은 어떤 가격이든 받으므로 최고 매수가는 null
+            best_bid = quote.best_bid if quote.best_bid is not None and quote.best_bid != math.inf else None
+            result.append({
+                'origin': quote.origin,
+                'destination': quote.destination,
+                'container_type': quote.container_type,
+                'date': quote.day.isoformat(),
+                'best_bid': best_bid,
+                'bid_orders': quote.bid_orders,
+                'bid_quantity': quote.bid_quantity,
+                'best_ask': quote.best_ask,
+                'ask_orders': quote.ask_orders,
+                'ask_quantity': quote.ask_quantity,
+                'spread': quote.best_ask - best_bid if best_bid is not None and quote.best_ask is not None else None
+            })
+        return jsonify(result)
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
+
+@app.route('/api/lane-prices')
+@login_required
+def lane_prices():
+    """Price statistics of accepted matches per lane, served from memory.
+
+    ?origin=&destination= narrows to one place pair, ?container_type= to one type.
+    """
+    try:
+        origin = request.args.get('origin')
+        destination = request.args.get('destination')
+        if (origin is None) != (destination is None):
+            return jsonify({'error': 'origin 과 destination 을 함께 지정해야 합니다'}), 400
+        
+        return jsonify([{
+            'origin': origin_name,
+            'destination': destination_name,
+            'container_type': lane[2],
+            'count': quote.count,
+            'ewma': round(quote.ewma, 2) if quote.ewma is not None else None,
+            'p10': quote.p10,
+            'p50': quote.p50,
+            'p90': quote.p90,
+            'last_price': quote.last_price
+        } for lane, origin_name, destination_name, quote in lane_quotes(origin, destination,
+                                                                         request.args.get('container_type'))])
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
+
 @app.route('/api/auto-match', methods=['POST'])
 @login_required
 def auto_match():
-    """Basic auto-matching algorithm"""
+    """Queue a background auto-match job.
+
+    Pass "wait": true to run the job inline, or "dry_run": true (with optional
+    "overrides" of MATCH_* settings) to get a simulation report instead.
+    "container_type" limits the run to that type's compatibility group, so
+    jobs on disjoint groups can run on different workers at once.
+    """
     try:
         # 사용자 인증 확인
         if not hasattr(request, 'user') or not request.user:
@@ -619,48 +838,70 @@ def auto_match():
         if user.role != 'admin':
             return jsonify({'error': '관리자만 자동 매칭을 실행할 수 있습니다'}), 403
         
-        # Get available tolerances and pending requests
-        tolerances = Tolerance.query.filter_by(status='available').all()
-        requests = DeliveryRequest.query.filter_by(status='pending').all()
-        
-        matches_created = 0
-        
-        for tolerance in tolerances:
-            for request in requests:
-                # Basic matching criteria
-                if (tolerance.origin == request.origin and 
-                    tolerance.destination == request.destination and
-                    tolerance.container_type == request.container_type and
-                    tolerance.departure_time.date() == request.pickup_time.date()):
-                    
-                    # Check if match already exists
-                    existing_match = Match.query.filter_by(
-                        tolerance_id=tolerance.id,
-                        delivery_request_id=request.id
-                    ).first()
-                    
-                    if not existing_match:
-                        # Create new match
-                        match = Match(
-                            tolerance_id=tolerance.id,
-                            delivery_request_id=request.id,
-                            status='pending'
-                        )
-                        db.session.add(match)
-                        matches_created += 1
-        
-        db.session.commit()
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode', app.config.get('AUTO_MATCH_MODE', 'all'))
+        if mode not in AUTO_MATCH_MODES:
+            return jsonify({'error': f'지원하지 않는 매칭 모드입니다: {mode}'}), 400
+        # 컨테이너 타입을 주면 그 호환 그룹만 잠그고 매칭한다
+        partition = match_partition(data.get('container_type'))
+        
+        if data.get('dry_run'):
+            overrides = data.get('overrides') or {}
+            if not isinstance(overrides, dict) or any(not key.startswith('MATCH_') for key in overrides):
+                return jsonify({'error': 'overrides 는 MATCH_ 설정만 바꿀 수 있습니다'}), 400
+            limit = data.get('limit', 100)
+            if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+                return jsonify({'error': 'limit 은 0 이상의 정수여야 합니다'}), 400
+            return jsonify(simulate_auto_match(mode, overrides, limit=limit))
+        
+        try:
+            if data.get('wait'):
+                job = run_auto_match_job(mode, partition=partition, user_id=user.id)
+            else:
+                job = submit_auto_match(mode, partition=partition, user_id=user.id)
+        except MatchLockedError as e:
+            return jsonify({'error': '이미 실행 중인 자동 매칭이 있습니다', 'job_id': e.job_id}), 409
+        
+        if data.get('wait'):
+            if job.status == 'failed':
+                return jsonify({'error': f'자동 매칭에 실패했습니다: {job.error}', 'job_id': job.id}), 500
+            matches_created = job_payload(job)['stats'].get('matches_created', 0)
+            return jsonify({
+                'success': True,
+                'mode': mode,
+                'job_id': job.id,
+                'matches_created': matches_created,
+                'message': f'{matches_created}개의 매칭이 생성되었습니다'
+            })
         
         return jsonify({
             'success': True,
-            'message': f'{matches_created}개의 매칭이 생성되었습니다'
-        })
+            'mode': mode,
+            'job_id': job.id,
+            'status_url': url_for('auto_match_job', job_id=job.id),
+            # 메시지 큐가 없으면 진행 상황이 푸시되지 않으므로 status_url 을 폴링해야 한다
+            'updates': progress_updates(),
+            'message': '자동 매칭 작업이 시작되었습니다'
+        }), 202
     
     except Exception as e:
         db.session.rollback()
         print(f"Auto-match 오류: {str(e)}")  # 서버 로그에 오류 출력
         return jsonify({'error': f'서버 오류가 발생했습니다: {str(e)}'}), 500
 
+@app.route('/api/auto-match/jobs/<job_id>')
+@login_required
+def auto_match_job(job_id):
+    """Progress, candidate counts and timings of an auto-match job"""
+    if request.user.role != 'admin':
+        return jsonify({'error': '관리자만 자동 매칭 작업을 조회할 수 있습니다'}), 403
+    
+    job = MatchJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': '자동 매칭 작업을 찾을 수 없습니다'}), 404
+    
+    return jsonify(job_payload(job))
+
 @app.route('/api/admin/users', methods=['GET', 'POST', 'PUT', 'DELETE'])
 @login_required
 @role_required('admin')
@@ -1044,11 +1285,58 @@ def admin_statistics():
         'top_carriers': [{'name': name, 'matches': count} for name, count in top_carriers]
     })
 
+def parse_setting(assignment):
+    """KEY=VALUE from the command line; the value is read as JSON when it parses"""
+    key, _, value = assignment.partition('=')
+    try:
+        return key.strip(), json.loads(value)
+    except ValueError:
+        return key.strip(), value
+
+
+@app.cli.command('auto-match')
+@click.option('--mode', type=click.Choice(AUTO_MATCH_MODES), default=None,
+              help='Matching mode (default: AUTO_MATCH_MODE)')
+@click.option('--dry-run', is_flag=True, help='Report what would be matched without writing matches')
+@click.option('--set', 'settings', multiple=True, metavar='KEY=VALUE',
+              help='Override a MATCH_* setting for a dry run, e.g. --set MATCH_PRICE_MARGIN=0.1')
+@click.option('--limit', type=click.IntRange(min=0), default=100, show_default=True,
+              help='Matches and diff pairs listed in the report')
+def auto_match_command(mode, dry_run, settings, limit):
+    """Run auto-match once, or simulate it with --dry-run and print a JSON report"""
+    mode = mode or app.config.get('AUTO_MATCH_MODE', 'all')
+    overrides = dict(parse_setting(setting) for setting in settings)
+    if overrides and not dry_run:
+        raise click.UsageError('--set is only allowed with --dry-run')
+    if any(not key.startswith('MATCH_') for key in overrides):
+        raise click.UsageError('--set only accepts MATCH_* settings')
+    if dry_run:
+        click.echo(json.dumps(simulate_auto_match(mode, overrides, limit=limit), ensure_ascii=False, indent=2))
+    else:
+        try:
+            job = run_auto_match_job(mode)
+        except MatchLockedError as e:
+            raise click.ClickException(f'이미 실행 중인 자동 매칭이 있습니다 (작업 {e.job_id})')
+        if job.status == 'failed':
+            raise click.ClickException(f'자동 매칭에 실패했습니다: {job.error}')
+        click.echo(f"{job_payload(job)['stats'].get('matches_created', 0)}개의 매칭이 생성되었습니다")
+
+
+@app.cli.command('backfill-lane-prices')
+def backfill_lane_prices_command():
+    """Rebuild lane price statistics from all accepted and completed matches"""
+    click.echo(f'{backfill_lane_prices()}개 매칭의 가격을 반영했습니다')
+
+
 # Database initialization
 with app.app_context():
     db.create_all()
+    upgrade_database(db)
     logging.info("Database tables created")
     
+    # 지명 사전 기본 데이터
+    seed_places()
+    
     # Create default admin user if not exists
     if not User.query.filter_by(username='admin').first():
         admin_password = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
@@ -1217,6 +1505,9 @@ with app.app_context():
         db.session.commit()
         logging.info("Sample data created")
     
+    # 장소 ID가 없는 기존 게시물을 지명 사전으로 보완
+    backfill_places()
+    
     logging.info("Database initialization completed")
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import MatchJob, MatchLock
+from match_service import PhaseTimer, run_auto_match
+
+# 자동 매칭 작업 실행기 (워커마다 하나, 요청 스레드와 분리)
+_executor = ThreadPoolExecutor(max_workers=app.config.get('MATCH_JOB_WORKERS', 2),
+                               thread_name_prefix='auto-match')
+_emitter = None
+
+# 단계별 진행률 (단계 시작 시점 기준)
+PHASE_PROGRESS = {'queued': 0.0, 'load': 0.05, 'index': 0.2, 'score': 0.3, 'write': 0.8, 'done': 1.0}
+
+
+class MatchLockedError(Exception):
+    """Another auto-match job holds the partition lock"""
+
+    def __init__(self, partition, job_id):
+        super().__init__(f'partition {partition} is locked by job {job_id}')
+        self.partition = partition
+        self.job_id = job_id
+
+
+def socket_emitter():
+    """Socket.IO emitter bound to SOCKETIO_MESSAGE_QUEUE, or None when it is not configured.
+
+    The tracking server runs in its own process, so progress can only reach
+    its clients through the shared message queue (e.g. redis://).
+    """
+    global _emitter
+    url = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return None
+    if _emitter is None:
+        from flask_socketio import SocketIO
+        _emitter = SocketIO(message_queue=url)
+    return _emitter
+
+
+def progress_updates():
+    """How clients should follow job progress: 'socket' when it is pushed, otherwise 'poll' the status URL"""
+    return 'socket' if socket_emitter() is not None else 'poll'
+
+
+def acquire_lock(partition, job_id):
+    """Take the advisory partition lock in the database.
+
+    The ``all`` partition conflicts with every other partition, so the lock
+    row is inserted first and then checked against the rows it overlaps;
+    of two racing jobs at least one backs off. Stale locks older than
+    MATCH_LOCK_TTL are cleared.
+    """
+    ttl = app.config.get('MATCH_LOCK_TTL', 1800)
+    MatchLock.query.filter(MatchLock.acquired_at < datetime.utcnow() - timedelta(seconds=ttl)) \
+        .delete(synchronize_session=False)
+    db.session.add(MatchLock(partition=partition, job_id=job_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        holder = MatchLock.query.get(partition)
+        raise MatchLockedError(partition, holder.job_id if holder else None)
+
+    overlapping = MatchLock.query.filter(MatchLock.partition != partition)
+    if partition != 'all':
+        overlapping = overlapping.filter(MatchLock.partition == 'all')
+    holder = overlapping.first()
+    if holder is not None:
+        release_lock(partition, job_id)
+        raise MatchLockedError(partition, holder.job_id)
+
+
+def release_lock(partition, job_id):
+    MatchLock.query.filter_by(partition=partition, job_id=job_id).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def job_payload(job):
+    return {
+        'job_id': job.id,
+        'mode': job.mode,
+        'partition': job.partition,
+        'status': job.status,
+        'phase': job.phase,
+        'progress': job.progress,
+        'stats': json.loads(job.stats_json or '{}'),
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def publish(job):
+    """Push the job state to Socket.IO room auto_match_<job_id> and the admin room"""
+    emitter = socket_emitter()
+    if emitter is None:
+        return
+    payload = job_payload(job)
+    try:
+        emitter.emit('auto_match_progress', payload, room=f'auto_match_{job.id}')
+        emitter.emit('auto_match_progress', payload, room='auto_match')
+    except Exception as e:
+        logging.warning(f"Auto-match 진행 상황 전송 실패 ({job.id}): {str(e)}")
+
+
+def _create_job(mode, partition, user_id):
+    job = MatchJob(id=uuid.uuid4().hex, mode=mode, partition=partition, status='queued',
+                   phase='queued', progress=0.0, created_by=user_id)
+    db.session.add(job)
+    db.session.commit()
+    try:
+        acquire_lock(partition, job.id)
+    except MatchLockedError:
+        db.session.delete(job)
+        db.session.commit()
+        raise
+    return job
+
+
+def submit_auto_match(mode, partition='all', user_id=None):
+    """Queue an auto-match job and return it at once.
+
+    Raises MatchLockedError when the partition already has a running job.
+    """
+    job = _create_job(mode, partition, user_id)
+    _executor.submit(_run_job, job.id)
+    return job
+
+
+def run_auto_match_job(mode, partition='all', user_id=None):
+    """Run an auto-match job in this thread under the partition lock and return it once finished.
+
+    Raises MatchLockedError when the partition already has a running job.
+    """
+    job_id = _create_job(mode, partition, user_id).id
+    _run_job(job_id)
+    return MatchJob.query.get(job_id)
+
+
+def _run_job(job_id):
+    with app.app_context():
+        job = MatchJob.query.get(job_id)
+        stats = {}
+
+        def on_progress(phase, **counts):
+            stats.update(counts, timings=progress.timings)
+            job.phase = phase
+            job.progress = PHASE_PROGRESS.get(phase, job.progress)
+            if phase == 'score' and counts.get('partitions'):
+                # 파티션 단위 진행률: score 와 write 사이를 채운다
+                job.progress += (PHASE_PROGRESS['write'] - PHASE_PROGRESS['score']) \
+                    * counts['partitions_done'] / counts['partitions']
+            job.stats_json = json.dumps(stats)
+            db.session.commit()
+            publish(job)
+
+        progress = PhaseTimer(on_progress)
+
+        try:
+            job.status = 'running'
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+            run_auto_match(job.mode, progress=progress, partition=job.partition)
+            job.status = 'completed'
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Auto-match 작업 오류 ({job_id}): {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            stats['timings'] = progress.timings
+            stats['timings']['total'] = round((job.finished_at - job.started_at).total_seconds(), 4) \
+                if job.started_at else 0.0
+            job.stats_json = json.dumps(stats)
+            db.session.commit()
+            publish(job)
+            release_lock(job.partition, job.id)
+            db.session.remove()
@@ -0,0 +1,693 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app import app, db
+from models import Tolerance, DeliveryRequest, Match
+from sqlalchemy import bindparam, case, func, or_
+
+from place_service import ensure_gazetteer
+from matching import (TolerancePosting, RequestPosting, MatchRules, OpenBook, PlacePoints, propose_matches,
+                      score_partition, split_partitions, top_candidates, free_slots)
+from orderbook import DEFAULT_DEPTH, OrderBook
+from price_service import ensure_price_index
+from tours import TourRules, build_tours
+
+# 열린 여유 운송/운송 요청의 프로세스 내 인덱스 (워커마다 하나)
+open_book = OpenBook()
+# 장부를 만들 때 사용한 지명 사전 버전
+_book_places_version = None
+# 레인/날짜별 호가창 (워커마다 하나, MATCH_MARKET_ON_POST 일 때 새 게시물을 체결)
+lane_book = OrderBook()
+
+# 후보 순위 캐시: (request_id, k, 장부 버전) -> (만든 시각, 결과)
+_ranking_cache = OrderedDict()
+_ranking_lock = threading.Lock()
+_reliability = {'loaded_at': None, 'scores': {}}
+
+
+def match_rules():
+    """Time-window rules from the MATCH_* config keys"""
+    return MatchRules.from_config(app.config)
+
+
+def load_open_book(container_types=None, include_full=False):
+    """Snapshots of available tolerances with free slots and pending delivery requests, loaded column-wise.
+
+    ``container_types`` limits the load to one auto-match partition.
+    ``include_full`` also loads available tolerances with no free slot left.
+    """
+    tolerance_columns = [getattr(Tolerance, field) for field in TolerancePosting._fields]
+    request_columns = [getattr(DeliveryRequest, field) for field in RequestPosting._fields]
+    tolerance_query = db.session.query(*tolerance_columns).filter(Tolerance.status == 'available')
+    if not include_full:
+        tolerance_query = tolerance_query.filter(
+            or_(Tolerance.remaining_count.is_(None), Tolerance.remaining_count > 0))
+    request_query = db.session.query(*request_columns).filter(DeliveryRequest.status == 'pending')
+    if container_types is not None:
+        tolerance_query = tolerance_query.filter(Tolerance.container_type.in_(container_types))
+        request_query = request_query.filter(DeliveryRequest.container_type.in_(container_types))
+    return [TolerancePosting(*row) for row in tolerance_query], [RequestPosting(*row) for row in request_query]
+
+
+def reload_open_book(rules=None):
+    """Reload the in-memory book from the database and return the loaded postings"""
+    global _book_places_version
+    places = ensure_gazetteer()
+    tolerances, requests = load_open_book()
+    open_book.load(tolerances, requests, loaded_at=time.monotonic(), rules=rules or match_rules(),
+                   locate=places.locate)
+    _book_places_version = places.version
+    return tolerances, requests
+
+
+def ensure_open_book():
+    """Load the in-memory book on first use and reload it once it is older than MATCH_BOOK_MAX_AGE.
+
+    Other gunicorn workers change the book too, so the age bound keeps each
+    worker's copy from drifting too far from the database. A gazetteer
+    change also forces a reload, since lanes are keyed on places.
+    """
+    max_age = app.config.get('MATCH_BOOK_MAX_AGE', 300)
+    if (open_book.loaded_at is None or time.monotonic() - open_book.loaded_at > max_age
+            or ensure_gazetteer().version != _book_places_version):
+        reload_open_book()
+    return open_book
+
+
+def reload_lane_book():
+    """Rebuild the lane order books from the database.
+
+    Requests already filled in the market (a pending match with a price)
+    stay out until that match is rejected.
+    """
+    tolerances, requests = load_open_book()
+    filled = {request_id for (request_id,) in db.session.query(Match.delivery_request_id).filter(
+        Match.status == 'pending', Match.price.isnot(None))}
+    lane_book.load(tolerances, [r for r in requests if r.id not in filled], loaded_at=time.monotonic(),
+                   depth=app.config.get('MATCH_MARKET_DEPTH', DEFAULT_DEPTH))
+    return lane_book
+
+
+def ensure_lane_book():
+    """Load the lane order books on first use and reload them once older than MATCH_BOOK_MAX_AGE"""
+    max_age = app.config.get('MATCH_BOOK_MAX_AGE', 300)
+    if lane_book.loaded_at is None or time.monotonic() - lane_book.loaded_at > max_age:
+        reload_lane_book()
+    return lane_book
+
+
+def existing_matches():
+    """(tolerance_id, delivery_request_id, status) of matches within the open book, in one query"""
+    return db.session.query(Match.tolerance_id, Match.delivery_request_id, Match.status) \
+        .join(Tolerance, Match.tolerance_id == Tolerance.id) \
+        .join(DeliveryRequest, Match.delivery_request_id == DeliveryRequest.id) \
+        .filter(Tolerance.status == 'available', DeliveryRequest.status == 'pending') \
+        .all()
+
+
+def pending_reservations():
+    """Slots reserved by pending consolidated proposals, per tolerance id"""
+    return dict(db.session.query(Match.tolerance_id, func.sum(Match.container_count))
+                .filter(Match.status == 'pending', Match.container_count.isnot(None))
+                .group_by(Match.tolerance_id))
+
+
+def without_reservations(tolerances, reserved):
+    """Tolerance snapshots with ``reserved`` slots given back, keeping those with a free slot"""
+    released = [t._replace(remaining_count=t.remaining_count + reserved[t.id])
+                if t.id in reserved and t.remaining_count is not None else t for t in tolerances]
+    return [t for t in released if free_slots(t) > 0]
+
+
+def insert_matches(rows):
+    """Insert match rows with one multi-row statement.
+
+    Rows that collide with the (tolerance_id, delivery_request_id) unique
+    constraint are skipped, so two concurrent runs cannot create duplicates.
+    Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(Match.__table__).on_conflict_do_nothing()
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(Match.__table__).on_conflict_do_nothing()
+    else:
+        stmt = Match.__table__.insert()
+
+    result = db.session.execute(stmt, rows)
+    return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(rows)
+
+
+def match_row(tolerance, delivery_request, container_count=None, tour_id=None, tour_seq=None, price=None):
+    return {
+        'tolerance_id': tolerance.id,
+        'delivery_request_id': delivery_request.id,
+        'status': 'pending',
+        'container_count': container_count,
+        'tour_id': tour_id,
+        'tour_seq': tour_seq,
+        'price': price
+    }
+
+
+def reserve_slots(allocated):
+    """Decrement remaining_count by the slots allocated per tolerance, in one executemany"""
+    if not allocated:
+        return
+    table = Tolerance.__table__
+    stmt = table.update() \
+        .where(table.c.id == bindparam('tolerance_id')) \
+        .values(remaining_count=func.coalesce(table.c.remaining_count, table.c.container_count)
+                - bindparam('allocated'),
+                version_id=table.c.version_id + 1)
+    db.session.execute(stmt, [{'tolerance_id': tolerance_id, 'allocated': count}
+                              for tolerance_id, count in allocated.items()])
+
+
+def claim_requests(postings):
+    """Ids of the request snapshots still pending at their loaded version, bumping that version.
+
+    Each claim is one conditional UPDATE, so of two runs that loaded the
+    same row only the first to write gets it.
+    """
+    table = DeliveryRequest.__table__
+    stmt = table.update() \
+        .where(table.c.id == bindparam('posting_id'), table.c.version_id == bindparam('version'),
+               table.c.status == 'pending') \
+        .values(version_id=table.c.version_id + 1)
+    return {posting.id for posting in postings
+            if db.session.execute(stmt, {'posting_id': posting.id, 'version': posting.version_id}).rowcount}
+
+
+def claim_tolerances(postings, allocated):
+    """Ids of the tolerance snapshots still available at their loaded version, bumping that version.
+
+    ``allocated`` slots per tolerance are reserved from remaining_count in
+    the same conditional UPDATE, which also requires them to still be free.
+    """
+    table = Tolerance.__table__
+    free = func.coalesce(table.c.remaining_count, table.c.container_count)
+    current = (table.c.id == bindparam('posting_id'), table.c.version_id == bindparam('version'),
+               table.c.status == 'available')
+    touch = table.update().where(*current).values(version_id=table.c.version_id + 1)
+    reserve = table.update().where(*current, free >= bindparam('allocated')) \
+        .values(version_id=table.c.version_id + 1, remaining_count=free - bindparam('allocated'))
+    claimed = set()
+    for posting in postings:
+        params = {'posting_id': posting.id, 'version': posting.version_id}
+        if allocated.get(posting.id):
+            result = db.session.execute(reserve, dict(params, allocated=allocated[posting.id]))
+        else:
+            result = db.session.execute(touch, params)
+        if result.rowcount:
+            claimed.add(posting.id)
+    return claimed
+
+
+def release_slots(match):
+    """Give a consolidated match's reserved slots back to its tolerance"""
+    if match.container_count:
+        tolerance = match.tolerance
+        tolerance.remaining_count = free_slots(tolerance) + match.container_count
+
+
+AUTO_MATCH_MODES = ('all', 'assignment', 'consolidation', 'tours')
+# 한 게시물에 하나의 제안만 허용하는 모드: 쓰기 전에 게시물을 선점한다
+CLAIMING_MODES = ('assignment', 'consolidation', 'tours')
+
+
+ScoredBook = namedtuple('ScoredBook', ['rows', 'proposals', 'matches', 'book'])
+
+
+class PhaseTimer:
+    """``progress`` callback that records how long each phase took, in seconds.
+
+    A phase ends when the next one is reported; ``on_progress`` (if given)
+    is called with every report as well.
+    """
+
+    def __init__(self, on_progress=None):
+        self.timings = {}
+        self.stats = {}
+        self.on_progress = on_progress
+        self._phase = None
+        self._started = time.perf_counter()
+
+    def __call__(self, phase, **stats):
+        now = time.perf_counter()
+        if phase != self._phase:
+            if self._phase is not None:
+                self.timings[self._phase] = round(now - self._started, 4)
+            self._phase, self._started = phase, now
+        self.stats.update(stats)
+        if self.on_progress:
+            self.on_progress(phase, **stats)
+
+
+def match_partition(container_type):
+    """Auto-match partition (lock name) of a container type: its group of compatible types"""
+    if container_type in (None, 'all'):
+        return 'all'
+    return match_rules().compatibility.group(container_type)
+
+
+def run_auto_match(mode='all', progress=None, partition='all'):
+    """Match the open book and return the number of matches created.
+
+    ``all`` proposes every new compatible pair. ``assignment`` proposes at
+    most one match per posting, chosen by a global minimum-cost assignment.
+    ``consolidation`` packs several requests into each tolerance's free
+    slots and reserves them in ``remaining_count``. ``tours`` chains
+    requests behind each empty run into multi-leg tours (see tours.py).
+    All but ``all`` leave out requests that already have a pending proposal.
+
+    ``progress(phase, **stats)`` is called as the run enters each phase
+    (load, index, score, write, done). With MATCH_PARTITION_WORKERS above
+    one the score phase is split into independent partitions scored in a
+    process pool; all proposals are still written in one transaction.
+
+    ``partition`` (see match_partition) limits the run to one group of
+    compatible container types, so runs on different partitions can go in
+    parallel. Runs that overlap anyway cannot double-book a posting: the
+    exclusive modes claim every posting with a conditional version UPDATE
+    before writing, and the unique pair constraint drops duplicate pairs.
+    """
+    report = progress or (lambda phase, **stats: None)
+    scored = score_open_book(mode, app.config, report, partition=partition)
+    report('write', candidates=len(scored.rows))
+    matches_created = write_proposals(scored.proposals, scored.rows, claim=mode in CLAIMING_MODES)
+    report('done', matches_created=matches_created)
+    return matches_created
+
+
+def score_open_book(mode, config, report, dry_run=False, partition='all'):
+    """Load, index and score the open book under the MATCH_* settings in ``config``.
+
+    A full run rebuilds this worker's open book. A dry run or a partition
+    run indexes a private copy, so the live book keeps its rules and
+    postings. A dry run also scores as if no proposal were pending
+    (rejected pairs stay excluded), with the slots pending proposals
+    reserved given back, so the result can be compared with the current
+    proposals.
+    """
+    global _book_places_version
+    report('load')
+    rules = MatchRules.from_config(config)
+    places = ensure_gazetteer()
+    container_types = None if partition == 'all' else rules.compatibility.members(partition)
+    tolerances, requests = load_open_book(container_types, include_full=dry_run)
+    if dry_run:
+        # 대기 중인 제안도 다시 계획하므로 그 제안이 잡아 둔 슬롯은 비어 있는 것으로 본다
+        tolerances = without_reservations(tolerances, pending_reservations())
+    matches = existing_matches()
+
+    report('index', tolerances=len(tolerances), requests=len(requests))
+    private = dry_run or container_types is not None
+    book = OpenBook() if private else open_book
+    book.load(tolerances, requests, loaded_at=time.monotonic(), rules=rules, locate=places.locate)
+    if not private:
+        _book_places_version = places.version
+
+    report('score')
+    scored_matches = [m for m in matches if m[2] != 'pending'] if dry_run else matches
+    if mode == 'tours':
+        # 투어는 파티션 경계를 넘나들므로 한 프로세스에서 만든다
+        tours = propose_tours(tolerances, requests, scored_matches, rules, TourRules.from_config(config),
+                              book.locate)
+        rows, proposals = tour_rows(tours)
+        return ScoredBook(rows, proposals, matches, book)
+
+    max_visits = config.get('MATCH_ASSIGNMENT_MAX_VISITS')
+    workers = config.get('MATCH_PARTITION_WORKERS', 1)
+    if workers > 1:
+        proposals = propose_in_partitions(mode, tolerances, requests, scored_matches, rules, workers,
+                                          max_visits, report, book.locate)
+    else:
+        proposals = propose_matches(mode, tolerances, requests, scored_matches, rules, book.locate,
+                                    max_visits=max_visits)
+    return ScoredBook([match_row(t, r, count) for t, r, count in proposals], proposals, matches, book)
+
+
+def simulate_auto_match(mode='all', overrides=None, limit=100):
+    """Dry-run auto-match against the current open book without writing anything.
+
+    ``overrides`` replace MATCH_* settings for this run only, so rule sets
+    can be compared. Returns the candidate pairs evaluated, the matches that
+    would be proposed (the first ``limit`` listed), their diff against the
+    pending proposals and per-phase timings. Pending proposals are re-planned
+    along with everything else, so their reserved slots count as free.
+    """
+    timer = PhaseTimer()
+    started = time.perf_counter()
+    scored = score_open_book(mode, dict(app.config, **(overrides or {})), timer, dry_run=True)
+
+    timer('diff')
+    candidate_pairs = sum(len(scored.book.tolerance_candidates(r)) for r in scored.book.requests)
+    proposed = {(row['tolerance_id'], row['delivery_request_id']) for row in scored.rows}
+    pending = {(tolerance_id, request_id) for tolerance_id, request_id, status in scored.matches
+               if status == 'pending'}
+    added = sorted(proposed - pending)
+    removed = sorted(pending - proposed)
+    timer('done')
+    timer.timings['total'] = round(time.perf_counter() - started, 4)
+
+    return {
+        'mode': mode,
+        'dry_run': True,
+        'overrides': overrides or {},
+        'tolerances': timer.stats.get('tolerances', 0),
+        'requests': timer.stats.get('requests', 0),
+        'candidate_pairs': candidate_pairs,
+        'matches_proposed': len(scored.rows),
+        'matches': scored.rows[:limit],
+        'diff': {
+            'added': len(added),
+            'removed': len(removed),
+            'unchanged': len(proposed & pending),
+            'added_pairs': [list(pair) for pair in added[:limit]],
+            'removed_pairs': [list(pair) for pair in removed[:limit]]
+        },
+        'timings': timer.timings
+    }
+
+
+def propose_in_partitions(mode, tolerances, requests, matches, rules, workers, max_visits=None, report=None,
+                          locate=None):
+    """propose_matches over independent partitions scored in a ProcessPoolExecutor.
+
+    Each worker gets the postings of its partitions, the existing matches
+    that touch them and a picklable snapshot of the place coordinates; the
+    id triples it returns are mapped back to the loaded postings here.
+    """
+    partitions = split_partitions(tolerances, requests, rules,
+                                  workers * app.config.get('MATCH_PARTITIONS_PER_WORKER', 4))
+    locate = PlacePoints.snapshot(locate or open_book.locate, tolerances + requests) if rules.uses_radius else None
+    tolerances_by_id = {t.id: t for t in tolerances}
+    requests_by_id = {r.id: r for r in requests}
+
+    results = [None] * len(partitions)
+    # 자식 프로세스는 matching 의 순수 함수만 실행하므로 DB 세션/앱 상태를 건드리지 않는다
+    with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as pool:
+        futures = {}
+        for i, (part_tolerances, part_requests) in enumerate(partitions):
+            ids = {t.id for t in part_tolerances}
+            request_ids = {r.id for r in part_requests}
+            part_matches = [m for m in matches if m[0] in ids or m[1] in request_ids]
+            futures[pool.submit(score_partition, mode, part_tolerances, part_requests, part_matches,
+                                rules, locate, max_visits)] = i
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if report:
+                report('score', partitions=len(partitions), partitions_done=done)
+
+    return [(tolerances_by_id[tolerance_id], requests_by_id[request_id], count)
+            for result in results for tolerance_id, request_id, count in result]
+
+
+def write_proposals(proposals, rows=None, claim=False):
+    """Insert proposed matches (or the given match rows), reserve consolidated slots and commit.
+
+    With ``claim`` every request and then every tolerance is claimed at its
+    loaded version first; proposals (and whole tours) using a posting that
+    another run or user changed since the load are dropped.
+    """
+    if rows is None:
+        rows = [match_row(t, r, count) for t, r, count in proposals]
+
+    claimed_tolerances = None
+    if claim and proposals:
+        claimed = claim_requests({r.id: r for _, r, _ in proposals}.values())
+        proposals, rows = _keep_claimed(proposals, rows, lambda t, r: r.id in claimed)
+        allocated = _allocated_slots(proposals)
+        claimed_tolerances = claim_tolerances({t.id: t for t, _, _ in proposals}.values(), allocated)
+        proposals, rows = _keep_claimed(proposals, rows, lambda t, r: t.id in claimed_tolerances)
+    allocated = _allocated_slots(proposals)
+
+    matches_created = insert_matches(rows)
+    if claimed_tolerances is None:
+        reserve_slots(allocated)
+    db.session.commit()
+
+    reserved = {}
+    for tolerance, _, _ in proposals:
+        if tolerance.id in allocated and tolerance.id not in reserved:
+            reserved[tolerance.id] = tolerance._replace(
+                remaining_count=free_slots(tolerance) - allocated[tolerance.id],
+                version_id=tolerance.version_id + 1 if tolerance.version_id is not None else None)
+    for posting in reserved.values():
+        sync_tolerance_posting(posting)
+    return matches_created
+
+
+def _allocated_slots(proposals):
+    allocated = {}
+    for tolerance, _, count in proposals:
+        if count:
+            allocated[tolerance.id] = allocated.get(tolerance.id, 0) + count
+    return allocated
+
+
+def _keep_claimed(proposals, rows, keep):
+    """Proposals and rows passing ``keep(tolerance, request)``; a tour losing any leg is dropped whole"""
+    kept = {(t.id, r.id) for t, r, _ in proposals if keep(t, r)}
+    broken_tours = {row['tour_id'] for row in rows
+                    if row['tour_id'] and (row['tolerance_id'], row['delivery_request_id']) not in kept}
+    rows = [row for row in rows if (row['tolerance_id'], row['delivery_request_id']) in kept
+            and row['tour_id'] not in broken_tours]
+    kept = {(row['tolerance_id'], row['delivery_request_id']) for row in rows}
+    return [(t, r, count) for t, r, count in proposals if (t.id, r.id) in kept], rows
+
+
+def propose_tours(tolerances, requests, matches, rules, tour_rules=None, locate=None):
+    """Tours over the open book, leaving out postings that already have a pending proposal"""
+    seen = {(tolerance_id, request_id) for tolerance_id, request_id, _ in matches}
+    proposed_tolerances = {tolerance_id for tolerance_id, _, status in matches if status == 'pending'}
+    proposed_requests = {request_id for _, request_id, status in matches if status == 'pending'}
+    return build_tours([t for t in tolerances if t.id not in proposed_tolerances],
+                       [r for r in requests if r.id not in proposed_requests],
+                       rules, tour_rules or TourRules.from_config(app.config), locate or open_book.locate,
+                       skip=seen)
+
+
+def tour_rows(tours):
+    """Match rows for every leg of each tour, sharing one tour_id, and their proposals"""
+    rows = []
+    proposals = []
+    for tour in tours:
+        tour_id = uuid.uuid4().hex
+        for seq, delivery_request in enumerate(tour.legs, start=1):
+            rows.append(match_row(tour.tolerance, delivery_request, tour_id=tour_id, tour_seq=seq))
+            proposals.append((tour.tolerance, delivery_request, None))
+    return rows, proposals
+
+
+def load_counterparts(posting, rules):
+    """Open postings of the other side in ``posting``'s container-type and time window, from the database.
+
+    Incremental matching pairs against these rather than this worker's
+    book, which can be up to MATCH_BOOK_MAX_AGE old and miss postings made
+    on other workers. Without an origin radius the query also keeps to the
+    posting's origin place; the lane index then applies the full rules.
+    """
+    exact_origin = rules.origin_radius_km <= 0 and posting.origin_place_id is not None
+    if isinstance(posting, TolerancePosting):
+        query = db.session.query(*[getattr(DeliveryRequest, field) for field in RequestPosting._fields]).filter(
+            DeliveryRequest.status == 'pending',
+            DeliveryRequest.container_type.in_(rules.compatibility.request_types(posting.container_type)),
+            DeliveryRequest.pickup_time.between(posting.departure_time - rules.departure_after_pickup,
+                                                posting.departure_time + rules.departure_before_pickup))
+        if exact_origin:
+            query = query.filter(DeliveryRequest.origin_place_id == posting.origin_place_id)
+        return [RequestPosting(*row) for row in query]
+    query = db.session.query(*[getattr(Tolerance, field) for field in TolerancePosting._fields]).filter(
+        Tolerance.status == 'available',
+        or_(Tolerance.remaining_count.is_(None), Tolerance.remaining_count > 0),
+        Tolerance.container_type.in_(rules.compatibility.slot_types(posting.container_type)),
+        Tolerance.departure_time.between(posting.pickup_time - rules.departure_before_pickup,
+                                         posting.pickup_time + rules.departure_after_pickup))
+    if exact_origin:
+        query = query.filter(Tolerance.origin_place_id == posting.origin_place_id)
+    return [TolerancePosting(*row) for row in query]
+
+
+def match_posted(tolerances, requests):
+    """Propose and write matches for one new posting and its counterparts under AUTO_MATCH_MODE.
+
+    ``all`` writes every candidate pair; the exclusive modes propose as a
+    full run would over these postings (skipping those that already have a
+    pending proposal) and claim them before writing. ``tours`` proposes
+    nothing here, so a single-leg match cannot take an empty run the next
+    full run would chain into a tour.
+    """
+    mode = app.config.get('AUTO_MATCH_MODE', 'all')
+    if mode == 'tours' or not tolerances or not requests:
+        return 0
+    matches = db.session.query(Match.tolerance_id, Match.delivery_request_id, Match.status).filter(
+        or_(Match.tolerance_id.in_([t.id for t in tolerances]),
+            Match.delivery_request_id.in_([r.id for r in requests]))).all()
+    proposals = propose_matches(mode, tolerances, requests, matches, match_rules(), ensure_gazetteer().locate,
+                                max_visits=app.config.get('MATCH_ASSIGNMENT_MAX_VISITS'))
+    return write_proposals(proposals, claim=mode in CLAIMING_MODES)
+
+
+def match_new_tolerance(tolerance):
+    """Match a newly posted tolerance against the open requests in its window only.
+
+    Matching is best-effort: the tolerance is already committed, so a
+    failure here is logged and reported as zero matches. The request path
+    never (re)loads the worker's open book; a book already loaded is only
+    extended with the postings read here.
+    """
+    if not app.config.get('AUTO_MATCH_ON_POST', True):
+        return 0
+    try:
+        posting = TolerancePosting.from_model(tolerance)
+        requests = load_counterparts(posting, match_rules())
+        if open_book.loaded_at is not None:
+            # 다른 워커가 올린 요청도 이 워커의 장부에 반영
+            for delivery_request in requests:
+                open_book.add_request(delivery_request)
+            open_book.add_tolerance(posting)
+        if app.config.get('MATCH_MARKET_ON_POST', False):
+            return write_fills(ensure_lane_book().add_tolerance(posting))
+        if lane_book.loaded_at is not None:
+            lane_book.rest_tolerance(posting)
+        return match_posted([posting], requests)
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Incremental match 오류 (tolerance {tolerance.id}): {str(e)}")
+        return 0
+
+
+def match_new_request(delivery_request):
+    """Match a newly posted delivery request against the open tolerances in its window only"""
+    if not app.config.get('AUTO_MATCH_ON_POST', True):
+        return 0
+    try:
+        posting = RequestPosting.from_model(delivery_request)
+        tolerances = load_counterparts(posting, match_rules())
+        if open_book.loaded_at is not None:
+            for tolerance in tolerances:
+                open_book.add_tolerance(tolerance)
+            open_book.add_request(posting)
+        if app.config.get('MATCH_MARKET_ON_POST', False):
+            return write_fills(ensure_lane_book().add_request(posting))
+        if lane_book.loaded_at is not None:
+            lane_book.rest_request(posting)
+        return match_posted(tolerances, [posting])
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Incremental match 오류 (request {delivery_request.id}): {str(e)}")
+        return 0
+
+
+def write_fills(fills):
+    """Write market fills as pending matches at the traded price, reserving their slots.
+
+    Fills are claimed like exclusive auto-match proposals; if another worker
+    took one of the orders first, this worker's lane books are stale and
+    are reloaded.
+    """
+    if not fills:
+        return 0
+    proposals = [(fill.tolerance, fill.delivery_request, fill.slots) for fill in fills]
+    rows = [match_row(fill.tolerance, fill.delivery_request, fill.slots, price=round(fill.price))
+            for fill in fills]
+    matches_created = write_proposals(proposals, rows, claim=True)
+    if matches_created < len(fills):
+        reload_lane_book()
+    return matches_created
+
+
+def sync_tolerance(tolerance):
+    """Reflect an edited or status-changed tolerance in the in-memory books"""
+    if tolerance.status == 'available':
+        sync_tolerance_posting(TolerancePosting.from_model(tolerance))
+        return
+    if open_book.loaded_at is not None:
+        open_book.discard_tolerance(tolerance.id)
+    if lane_book.loaded_at is not None:
+        lane_book.discard_tolerance(tolerance.id)
+
+
+def sync_tolerance_posting(posting):
+    """Keep an open tolerance in the books only while it has free slots"""
+    if open_book.loaded_at is not None:
+        if free_slots(posting) > 0:
+            open_book.add_tolerance(posting)
+        else:
+            open_book.discard_tolerance(posting.id)
+    if lane_book.loaded_at is not None:
+        lane_book.rest_tolerance(posting)
+
+
+def sync_request(delivery_request):
+    """Reflect an edited or status-changed delivery request in the in-memory books"""
+    pending = delivery_request.status == 'pending'
+    if open_book.loaded_at is not None:
+        if pending:
+            open_book.add_request(RequestPosting.from_model(delivery_request))
+        else:
+            open_book.discard_request(delivery_request.id)
+    if lane_book.loaded_at is not None:
+        if pending:
+            lane_book.rest_request(RequestPosting.from_model(delivery_request))
+        else:
+            lane_book.discard_request(delivery_request.id)
+
+
+def carrier_reliability():
+    """Share of each carrier's decided matches that were accepted or completed, smoothed to 0.5.
+
+    Recomputed with one grouped query at most every MATCH_HISTORY_MAX_AGE seconds.
+    """
+    max_age = app.config.get('MATCH_HISTORY_MAX_AGE', 600)
+    if _reliability['loaded_at'] is None or time.monotonic() - _reliability['loaded_at'] > max_age:
+        good = func.sum(case((Match.status.in_(('accepted', 'completed')), 1), else_=0))
+        decided = func.sum(case((Match.status.in_(('accepted', 'completed', 'rejected')), 1), else_=0))
+        rows = db.session.query(Tolerance.carrier_id, good, decided) \
+            .join(Match, Match.tolerance_id == Tolerance.id) \
+            .group_by(Tolerance.carrier_id).all()
+        _reliability['scores'] = {carrier_id: ((good or 0) + 1) / ((decided or 0) + 2)
+                                  for carrier_id, good, decided in rows}
+        _reliability['loaded_at'] = time.monotonic()
+    return _reliability['scores']
+
+
+def ranked_candidates(delivery_request, k=10):
+    """Top-k open tolerances for a delivery request as ``(score, TolerancePosting, components)``.
+
+    Results are cached for MATCH_RANKING_CACHE_SECONDS per request, k,
+    open-book version and price-index version, so any change to the book or
+    a newly accepted price invalidates them.
+    """
+    book = ensure_open_book()
+    prices = ensure_price_index()
+    key = (delivery_request.id, k, book.version, prices.version)
+    ttl = app.config.get('MATCH_RANKING_CACHE_SECONDS', 30)
+    with _ranking_lock:
+        hit = _ranking_cache.get(key)
+        if hit and time.monotonic() - hit[0] <= ttl:
+            _ranking_cache.move_to_end(key)
+            return hit[1]
+
+    posting = RequestPosting.from_model(delivery_request)
+    rejected = {tolerance_id for (tolerance_id,) in db.session.query(Match.tolerance_id).filter(
+        Match.delivery_request_id == delivery_request.id, Match.status == 'rejected')}
+    ranked = top_candidates(book.tolerance_candidates(posting), posting, k, book.locate,
+                            carrier_reliability(), skip=rejected, lane_price=prices.reference)
+
+    with _ranking_lock:
+        _ranking_cache[key] = (time.monotonic(), ranked)
+        while len(_ranking_cache) > app.config.get('MATCH_RANKING_CACHE_SIZE', 1024):
+            _ranking_cache.popitem(last=False)
+    return ranked
@@ -0,0 +1,728 @@
+import heapq
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from assignment import min_cost_assignment
+from gazetteer import normalize_name
+from geo import EARTH_RADIUS_KM, haversine_km
+
+
+class TolerancePosting(namedtuple('TolerancePosting', [
+        'id', 'carrier_id', 'origin', 'destination', 'origin_place_id', 'destination_place_id',
+        'departure_time', 'arrival_time',
+        'container_type', 'container_count', 'remaining_count', 'price', 'is_empty_run', 'version_id'],
+        defaults=(None,))):
+    """Immutable snapshot of an open Tolerance used by the matching engine"""
+    __slots__ = ()
+
+    @classmethod
+    def from_model(cls, tolerance):
+        return cls(*(getattr(tolerance, field, None) for field in cls._fields))
+
+
+class RequestPosting(namedtuple('RequestPosting', [
+        'id', 'carrier_id', 'origin', 'destination', 'origin_place_id', 'destination_place_id',
+        'pickup_time', 'delivery_time',
+        'container_type', 'container_count', 'budget', 'version_id'], defaults=(None,))):
+    """Immutable snapshot of a pending DeliveryRequest used by the matching engine"""
+    __slots__ = ()
+
+    @classmethod
+    def from_model(cls, delivery_request):
+        return cls(*(getattr(delivery_request, field, None) for field in cls._fields))
+
+
+# 여유 슬롯 타입 -> {실을 수 있는 요청 컨테이너 타입: 슬롯당 컨테이너 수}
+CONTAINER_COMPATIBILITY = {
+    '20ft': {'20ft': 1},
+    '40ft': {'40ft': 1, '20ft': 2},
+    '40HC': {'40HC': 1, '40ft': 1, '20ft': 2},
+    '45ft': {'45ft': 1},
+}
+
+
+class ContainerCompatibility:
+    """Which request container types fit a tolerance slot type, and how many per slot.
+
+    Both directions of the table are precomputed, so an index probe gets the
+    compatible lane types from one dict lookup. Types missing from the table
+    only fit themselves, one per slot.
+    """
+
+    def __init__(self, table=None):
+        table = CONTAINER_COMPATIBILITY if table is None else table
+        self._per_slot = {}
+        carries = defaultdict(set)
+        carried_by = defaultdict(set)
+        parent = {}
+
+        def root(container_type):
+            while parent.setdefault(container_type, container_type) != container_type:
+                container_type = parent[container_type]
+            return container_type
+
+        for slot_type, fits in table.items():
+            for request_type, per_slot in fits.items():
+                self._per_slot[(slot_type, request_type)] = per_slot
+                carries[slot_type].add(request_type)
+                carried_by[request_type].add(slot_type)
+                a, b = sorted((root(slot_type), root(request_type)))
+                parent[b] = a
+        self._carries = {t: tuple(sorted(types)) for t, types in carries.items()}
+        self._carried_by = {t: tuple(sorted(types)) for t, types in carried_by.items()}
+        self._groups = {t: root(t) for t in list(parent)}
+
+    def request_types(self, slot_type):
+        """Request container types a tolerance of ``slot_type`` can carry"""
+        return self._carries.get(slot_type, (slot_type,))
+
+    def slot_types(self, request_type):
+        """Tolerance container types that can carry a ``request_type`` request"""
+        return self._carried_by.get(request_type, (request_type,))
+
+    def per_slot(self, slot_type, request_type):
+        if slot_type == request_type:
+            return self._per_slot.get((slot_type, request_type), 1)
+        return self._per_slot.get((slot_type, request_type), 0)
+
+    def slots_needed(self, tolerance, delivery_request):
+        """Tolerance slots a request takes, e.g. 3 x 20ft on a 40ft chassis needs 2"""
+        per_slot = self.per_slot(tolerance.container_type, delivery_request.container_type) or 1
+        return -(-(delivery_request.container_count or 1) // per_slot)
+
+    def group(self, container_type):
+        """Representative of the set of types that can ever pair with ``container_type``"""
+        return self._groups.get(container_type, container_type)
+
+    def members(self, container_type):
+        """Every type in the group of ``container_type``"""
+        group = self.group(container_type)
+        return tuple(sorted(t for t, g in self._groups.items() if g == group)) or (container_type,)
+
+
+DEFAULT_COMPATIBILITY = ContainerCompatibility()
+
+
+class MatchRules(namedtuple('MatchRules', [
+        'departure_before_pickup', 'departure_after_pickup', 'arrival_slack',
+        'origin_radius_km', 'destination_radius_km', 'compatibility', 'price_margin'],
+        defaults=(DEFAULT_COMPATIBILITY, None))):
+    """Time-window and distance rules for pairing a tolerance with a delivery request.
+
+    A tolerance may depart between ``departure_before_pickup`` before and
+    ``departure_after_pickup`` after the requested pickup, and must arrive no
+    later than ``arrival_slack`` after the requested delivery time. With a
+    non-zero radius, origins (or destinations) within that many km of each
+    other match instead of requiring the same place. ``compatibility`` says
+    which container types a tolerance's slots can carry. With a
+    ``price_margin`` (0.2 = 20%), a tolerance priced above the request's
+    budget plus that margin is not a candidate; None disables the cut.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            departure_before_pickup=timedelta(minutes=config.get('MATCH_DEPARTURE_BEFORE_PICKUP_MINUTES', 120)),
+            departure_after_pickup=timedelta(minutes=config.get('MATCH_DEPARTURE_AFTER_PICKUP_MINUTES', 120)),
+            arrival_slack=timedelta(minutes=config.get('MATCH_ARRIVAL_SLACK_MINUTES', 0)),
+            origin_radius_km=config.get('MATCH_ORIGIN_RADIUS_KM', 0),
+            destination_radius_km=config.get('MATCH_DESTINATION_RADIUS_KM', 0),
+            compatibility=ContainerCompatibility(config.get('MATCH_CONTAINER_COMPATIBILITY')),
+            price_margin=config.get('MATCH_PRICE_MARGIN', 0.2)
+        )
+
+    def price_cap(self, delivery_request):
+        """Highest tolerance price worth proposing for a request"""
+        if self.price_margin is None or not delivery_request.budget:
+            return math.inf
+        return delivery_request.budget * (1 + self.price_margin)
+
+    def budget_floor(self, tolerance):
+        """Lowest request budget a tolerance's price can still be proposed to"""
+        if self.price_margin is None or not tolerance.price:
+            return -math.inf
+        return tolerance.price / (1 + self.price_margin)
+
+    @property
+    def uses_radius(self):
+        return self.origin_radius_km > 0 or self.destination_radius_km > 0
+
+
+DEFAULT_RULES = MatchRules.from_config({})
+
+
+def lane_key(origin, destination, container_type):
+    """매칭 레인 키 (출발지, 도착지, 컨테이너 타입)"""
+    return (origin, destination, container_type)
+
+
+def place_key(place_id, name):
+    """장소 ID가 있으면 ID, 없으면 정규화한 지명"""
+    return place_id if place_id is not None else normalize_name(name)
+
+
+def posting_lane(posting):
+    """Lane of a tolerance or request, keyed by gazetteer place ids where resolved"""
+    # app_simple 의 모델에는 장소 ID 열이 없다
+    return lane_key(place_key(getattr(posting, 'origin_place_id', None), posting.origin),
+                    place_key(getattr(posting, 'destination_place_id', None), posting.destination),
+                    posting.container_type)
+
+
+def arrives_in_time(tolerance, delivery_request, rules):
+    """도착 시간이 배송 희망 시간 + 여유 이내인지 확인 (둘 중 하나라도 없으면 통과)"""
+    if tolerance.arrival_time is None or delivery_request.delivery_time is None:
+        return True
+    return tolerance.arrival_time <= delivery_request.delivery_time + rules.arrival_slack
+
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+class _LaneIndex:
+    """Postings grouped by lane, each lane kept sorted by time.
+
+    Window queries are two bisects plus the size of the answer, and add or
+    discard by id costs one bisect and a list insert/delete.
+
+    Subclasses with a ``_value`` (price or budget) also keep each lane sorted
+    by value. A query bounded on both time and value bisects both lists and
+    scans only the smaller slice, checking the other bound per posting.
+
+    With radius rules and a ``locate(place_id, name) -> (lat, lng)`` callable,
+    lanes are (origin grid cell, container type) instead. Cells are one
+    origin radius high, so a radius query probes the neighbouring cells only
+    and the join stays proportional to the nearby postings. Postings whose
+    origin cannot be located keep a lane of their own place key.
+    """
+
+    def __init__(self, postings=(), rules=None, locate=None):
+        self.rules = rules or DEFAULT_RULES
+        self.locate = locate if self.rules.uses_radius else None
+        self._cell_deg = self.rules.origin_radius_km / KM_PER_DEGREE if self.rules.origin_radius_km > 0 else None
+        self._lanes = defaultdict(list)
+        self._values = defaultdict(list)
+        self._postings = {}
+        for posting in postings:
+            self._postings[posting.id] = posting
+            lane = self._lane(posting)
+            self._lanes[lane].append((self._time(posting), posting.id))
+            if self._priced:
+                self._values[lane].append((self._value(posting), posting.id))
+        for entries in self._lanes.values():
+            entries.sort()
+        for entries in self._values.values():
+            entries.sort()
+
+    def __len__(self):
+        return len(self._postings)
+
+    def __contains__(self, posting_id):
+        return posting_id in self._postings
+
+    def __iter__(self):
+        return iter(self._postings.values())
+
+    def get(self, posting_id):
+        return self._postings.get(posting_id)
+
+    # 가격/예산 정렬 목록을 유지할지 여부
+    _priced = False
+
+    def _time(self, posting):
+        raise NotImplementedError
+
+    def _value(self, posting):
+        raise NotImplementedError
+
+    def _origin_point(self, posting):
+        return self.locate(posting.origin_place_id, posting.origin)
+
+    def _lane(self, posting):
+        if self.locate is None:
+            return posting_lane(posting)
+        point = self._origin_point(posting) if self._cell_deg else None
+        if point is None:
+            return (place_key(posting.origin_place_id, posting.origin), posting.container_type)
+        return ((math.floor(point[0] / self._cell_deg), math.floor(point[1] / self._cell_deg)),
+                posting.container_type)
+
+    def _probe_lanes(self, posting, container_types=None):
+        """Lanes that can hold a counterpart of ``posting``, for each of ``container_types``"""
+        lanes = self._near_lanes(posting)
+        if container_types is None:
+            return lanes
+        # 레인 키의 마지막 요소가 컨테이너 타입
+        return [lane[:-1] + (container_type,) for lane in lanes for container_type in container_types]
+
+    def _near_lanes(self, posting):
+        lane = self._lane(posting)
+        if self.locate is None or not isinstance(lane[0], tuple):
+            return [lane]
+        (row, col), container_type = lane
+        lat = self._origin_point(posting)[0]
+        # 고위도일수록 같은 거리 안에 들어가는 경도 칸 수가 늘어난다
+        cos_phi = math.cos(math.radians(min(90.0, abs(lat) + self._cell_deg)))
+        ratio = math.sin(math.radians(self._cell_deg) / 2) / cos_phi if cos_phi > 0 else 2.0
+        if ratio >= 1:
+            span = math.ceil(180 / self._cell_deg)
+        else:
+            span = math.ceil(math.degrees(2 * math.asin(ratio)) / self._cell_deg)
+        return [((row + dr, col + dc), container_type)
+                for dr in (-1, 0, 1) for dc in range(-span, span + 1)]
+
+    def _near(self, a, b):
+        """Whether the origins and destinations of two postings are close enough to match"""
+        if self.locate is None:
+            return True
+        rules = self.rules
+        return (self._places_near(a.origin_place_id, a.origin, b.origin_place_id, b.origin,
+                                  rules.origin_radius_km)
+                and self._places_near(a.destination_place_id, a.destination,
+                                      b.destination_place_id, b.destination, rules.destination_radius_km))
+
+    def _places_near(self, a_id, a_name, b_id, b_name, radius_km):
+        if radius_km > 0:
+            a_point = self.locate(a_id, a_name)
+            b_point = self.locate(b_id, b_name)
+            if a_point is not None and b_point is not None:
+                return haversine_km(*a_point, *b_point) <= radius_km
+        return place_key(a_id, a_name) == place_key(b_id, b_name)
+
+    def add(self, posting):
+        self.discard(posting.id)
+        lane = self._lane(posting)
+        insort(self._lanes[lane], (self._time(posting), posting.id))
+        if self._priced:
+            insort(self._values[lane], (self._value(posting), posting.id))
+        self._postings[posting.id] = posting
+
+    def discard(self, posting_id):
+        posting = self._postings.pop(posting_id, None)
+        if posting is None:
+            return None
+        lane = self._lane(posting)
+        entries = self._lanes[lane]
+        del entries[bisect_left(entries, (self._time(posting), posting_id))]
+        if not entries:
+            del self._lanes[lane]
+        if self._priced:
+            values = self._values[lane]
+            del values[bisect_left(values, (self._value(posting), posting_id))]
+            if not values:
+                del self._values[lane]
+        return posting
+
+    def window(self, lane, start, end, low=-math.inf, high=math.inf):
+        """Postings on ``lane`` whose time falls within [start, end] and value within [low, high]"""
+        entries = self._lanes.get(lane)
+        if not entries:
+            return []
+        lo = bisect_left(entries, (start,))
+        hi = bisect_right(entries, (end, math.inf))
+        if not self._priced or (low == -math.inf and high == math.inf):
+            return [self._postings[posting_id] for _, posting_id in entries[lo:hi]]
+
+        values = self._values[lane]
+        value_lo = bisect_left(values, (low, -math.inf))
+        value_hi = bisect_right(values, (high, math.inf))
+        if hi - lo <= value_hi - value_lo:
+            return [self._postings[posting_id] for _, posting_id in entries[lo:hi]
+                    if low <= self._value(self._postings[posting_id]) <= high]
+        # 가격 조건이 더 좁으면 가격 구간을 훑고 시간 순으로 되돌린다
+        window = [(self._time(posting), posting_id, posting) for _, posting_id in values[value_lo:value_hi]
+                  for posting in (self._postings[posting_id],) if start <= self._time(posting) <= end]
+        window.sort(key=lambda item: item[:2])
+        return [posting for _, _, posting in window]
+
+    def near_window(self, posting, start, end, container_types=None, low=-math.inf, high=math.inf):
+        """Postings close to ``posting`` whose time falls within [start, end]"""
+        return [candidate for lane in self._probe_lanes(posting, container_types)
+                for candidate in self.window(lane, start, end, low, high) if self._near(candidate, posting)]
+
+
+class ToleranceIndex(_LaneIndex):
+    """Open tolerances by lane, sorted by departure time.
+
+    A delivery request only probes its own lane for departures inside its
+    pickup window, so a full auto-match run costs O((T + R) log T + candidate
+    pairs) instead of O(T x R).
+    """
+
+    _priced = True
+
+    def _time(self, tolerance):
+        return tolerance.departure_time
+
+    def _value(self, tolerance):
+        # 가격이 없으면 어떤 예산에도 들어간다
+        return tolerance.price or 0
+
+    def candidates(self, delivery_request):
+        """Tolerances that can serve the delivery request under the time-window and price rules"""
+        rules = self.rules
+        window = self.near_window(
+            delivery_request,
+            delivery_request.pickup_time - rules.departure_before_pickup,
+            delivery_request.pickup_time + rules.departure_after_pickup,
+            rules.compatibility.slot_types(delivery_request.container_type),
+            high=rules.price_cap(delivery_request))
+        return [t for t in window if arrives_in_time(t, delivery_request, rules)]
+
+
+class RequestIndex(_LaneIndex):
+    """Pending delivery requests by lane, sorted by pickup time and by budget"""
+
+    _priced = True
+
+    def _time(self, delivery_request):
+        return delivery_request.pickup_time
+
+    def _value(self, delivery_request):
+        # 예산이 없으면 어떤 가격이든 받는다
+        return delivery_request.budget or math.inf
+
+    def candidates(self, tolerance):
+        """Delivery requests the tolerance can serve under the time-window and price rules"""
+        rules = self.rules
+        window = self.near_window(
+            tolerance,
+            tolerance.departure_time - rules.departure_after_pickup,
+            tolerance.departure_time + rules.departure_before_pickup,
+            rules.compatibility.request_types(tolerance.container_type),
+            low=rules.budget_floor(tolerance))
+        return [r for r in window if arrives_in_time(tolerance, r, rules)]
+
+
+def candidate_pairs(tolerances, requests, rules=None, locate=None):
+    """Yield every (tolerance, request) pair that satisfies the matching rules"""
+    index = ToleranceIndex(tolerances, rules, locate)
+    for delivery_request in requests:
+        for tolerance in index.candidates(delivery_request):
+            yield tolerance, delivery_request
+
+
+# 배정 비용 가중치: 예산 대비 초과 가격 비율 1.0 = 픽업 시간 차이 10시간
+PRICE_GAP_WEIGHT = 1.0
+SLACK_WEIGHT_PER_HOUR = 0.1
+# 더 큰 슬롯에 싣는 경우 (예: 40ft 에 20ft) 같은 타입을 우선하도록 하는 비용
+CONTAINER_UPGRADE_WEIGHT = 0.05
+
+
+def pair_cost(tolerance, delivery_request):
+    """Assignment cost of a pair: relative price over budget plus pickup/departure slack"""
+    cost = 0.0
+    if tolerance.price and delivery_request.budget:
+        cost += PRICE_GAP_WEIGHT * max(0, tolerance.price - delivery_request.budget) / delivery_request.budget
+    if tolerance.container_type != delivery_request.container_type:
+        cost += CONTAINER_UPGRADE_WEIGHT
+    slack_hours = abs((tolerance.departure_time - delivery_request.pickup_time).total_seconds()) / 3600
+    return cost + SLACK_WEIGHT_PER_HOUR * slack_hours
+
+
+# 후보 순위 가중치: 출발지+도착지 거리 10km = 픽업 시간 차이 1시간, 운송사 이력 0~1
+DISTANCE_WEIGHT_PER_KM = 0.01
+HISTORY_WEIGHT = 0.5
+# 레인 과거 체결가(중앙값) 대비 초과 비율 1.0 = 픽업 시간 차이 5시간
+LANE_PRICE_WEIGHT = 0.5
+
+
+def candidate_score(tolerance, delivery_request, locate=None, reliability=None, lane_price=None):
+    """Ranking score of a tolerance for a request (lower is better) and its components.
+
+    Adds origin/destination distance, the carrier's track record
+    (``reliability[carrier_id]`` in 0..1) and, with ``lane_price(lane)``
+    returning a reference price, how far the tolerance's price is above what
+    the request's lane has historically traded at.
+    """
+    slack_hours = abs((tolerance.departure_time - delivery_request.pickup_time).total_seconds()) / 3600
+    price_gap = 0.0
+    if tolerance.price and delivery_request.budget:
+        price_gap = max(0, tolerance.price - delivery_request.budget) / delivery_request.budget
+    distance_km = 0.0
+    if locate is not None:
+        for a_id, a_name, b_id, b_name in (
+                (tolerance.origin_place_id, tolerance.origin, delivery_request.origin_place_id, delivery_request.origin),
+                (tolerance.destination_place_id, tolerance.destination,
+                 delivery_request.destination_place_id, delivery_request.destination)):
+            a, b = locate(a_id, a_name), locate(b_id, b_name)
+            if a is not None and b is not None:
+                distance_km += haversine_km(*a, *b)
+    history = reliability.get(tolerance.carrier_id, 0.5) if reliability is not None else 0.5
+    lane_price_gap = 0.0
+    # 가격 기록은 요청의 레인으로 쌓이므로 (record_match_price) 같은 키로 찾는다
+    reference = lane_price(posting_lane(delivery_request)) if lane_price is not None else None
+    if tolerance.price and reference:
+        lane_price_gap = max(0, float(tolerance.price) - reference) / reference
+
+    score = (PRICE_GAP_WEIGHT * price_gap + SLACK_WEIGHT_PER_HOUR * slack_hours
+             + DISTANCE_WEIGHT_PER_KM * distance_km + HISTORY_WEIGHT * (1 - history)
+             + LANE_PRICE_WEIGHT * lane_price_gap)
+    if tolerance.container_type != delivery_request.container_type:
+        score += CONTAINER_UPGRADE_WEIGHT
+    return score, {
+        'slack_hours': round(slack_hours, 2),
+        'price_gap': round(price_gap, 4),
+        'distance_km': round(distance_km, 2),
+        'carrier_reliability': round(history, 3),
+        'lane_price': reference,
+        'lane_price_gap': round(lane_price_gap, 4)
+    }
+
+
+def top_candidates(candidates, delivery_request, k, locate=None, reliability=None, skip=frozenset(),
+                   lane_price=None):
+    """The ``k`` best-scoring ``(score, tolerance, components)`` for a request, best first.
+
+    Candidates are scored in one pass through a bounded heap, so ranking
+    costs O(n log k) however many tolerances the request's lanes hold.
+    """
+    scored = ((candidate_score(t, delivery_request, locate, reliability, lane_price), t) for t in candidates
+              if t.id not in skip)
+    best = heapq.nsmallest(k, scored, key=lambda item: (item[0][0], item[1].id))
+    return [(score, tolerance, components) for (score, components), tolerance in best]
+
+
+def assigned_pairs(tolerances, requests, rules=None, skip=frozenset(), max_visits=None, locate=None):
+    """Globally cheapest one-to-one pairing of tolerances and requests.
+
+    Only candidate edges found through the lane index are considered, and
+    pairs in ``skip`` (e.g. already proposed or rejected) are left out.
+    """
+    index = ToleranceIndex(tolerances, rules, locate)
+    requests_by_id = {}
+    edges = {}
+    for delivery_request in requests:
+        requests_by_id[delivery_request.id] = delivery_request
+        edges[delivery_request.id] = [
+            (tolerance.id, pair_cost(tolerance, delivery_request))
+            for tolerance in index.candidates(delivery_request)
+            if (tolerance.id, delivery_request.id) not in skip
+        ]
+    assignment = min_cost_assignment(edges, max_visits=max_visits)
+    return [(index.get(tolerance_id), requests_by_id[request_id])
+            for request_id, tolerance_id in assignment.items()]
+
+
+def free_slots(tolerance):
+    """Container slots of a tolerance that are not yet reserved"""
+    if tolerance.remaining_count is None:
+        return tolerance.container_count or 0
+    return tolerance.remaining_count
+
+
+def pack_requests(candidates, capacity, cost=None, slots=None):
+    """0/1 knapsack: the subset of requests that fills the most slots within ``capacity``.
+
+    ``slots(request)`` is the slots a request takes (its container count by
+    default). Ties on filled slots are broken by the lowest total ``cost``.
+    Runs in O(len(candidates) x capacity), and capacities are a handful of slots.
+    """
+    # best[c] = (채운 슬롯, -비용, 선택한 요청들) — 용량 c 이내의 최선
+    best = [(0, 0.0, ())] * (capacity + 1)
+    for delivery_request in candidates:
+        weight = slots(delivery_request) if slots else delivery_request.container_count or 1
+        if weight > capacity:
+            continue
+        item_cost = cost(delivery_request) if cost else 0.0
+        for c in range(capacity, weight - 1, -1):
+            filled, neg_cost, chosen = best[c - weight]
+            option = (filled + weight, neg_cost - item_cost, chosen + (delivery_request,))
+            if option[:2] > best[c][:2]:
+                best[c] = option
+    return list(best[capacity][2])
+
+
+def consolidated_allocations(tolerances, requests, rules=None, skip=frozenset(), locate=None):
+    """Pack several compatible requests into the free slots of each tolerance.
+
+    Tolerances are filled in departure order and each request is allocated
+    at most once. Returns ``(tolerance, request, slots)`` triples, where a
+    smaller container type may share a slot (2 x 20ft per 40ft slot).
+    """
+    compatibility = (rules or DEFAULT_RULES).compatibility
+    index = RequestIndex(requests, rules, locate)
+    allocations = []
+    for tolerance in sorted(tolerances, key=lambda t: (t.departure_time, t.id)):
+        capacity = free_slots(tolerance)
+        if capacity <= 0:
+            continue
+        candidates = [r for r in index.candidates(tolerance) if (tolerance.id, r.id) not in skip]
+        slots = {r.id: compatibility.slots_needed(tolerance, r) for r in candidates}
+        for delivery_request in pack_requests(candidates, capacity, cost=lambda r: pair_cost(tolerance, r),
+                                              slots=lambda r: slots[r.id]):
+            index.discard(delivery_request.id)
+            allocations.append((tolerance, delivery_request, slots[delivery_request.id]))
+    return allocations
+
+
+def propose_matches(mode, tolerances, requests, matches, rules=None, locate=None, max_visits=None):
+    """New ``(tolerance, request, container_count)`` proposals for one auto-match run.
+
+    ``matches`` are the existing ``(tolerance_id, request_id, status)`` rows;
+    their pairs are never proposed again. ``container_count`` is only set in
+    ``consolidation`` mode. Pure computation, no database access.
+    """
+    seen = {(tolerance_id, request_id) for tolerance_id, request_id, _ in matches}
+    proposed_tolerances = {tolerance_id for tolerance_id, _, status in matches if status == 'pending'}
+    proposed_requests = {request_id for _, request_id, status in matches if status == 'pending'}
+
+    if mode == 'consolidation':
+        return consolidated_allocations(
+            tolerances, [r for r in requests if r.id not in proposed_requests], rules, skip=seen, locate=locate)
+
+    if mode == 'assignment':
+        pairs = assigned_pairs(
+            [t for t in tolerances if t.id not in proposed_tolerances],
+            [r for r in requests if r.id not in proposed_requests],
+            rules, skip=seen, max_visits=max_visits, locate=locate)
+    else:
+        pairs = candidate_pairs(tolerances, requests, rules, locate)
+
+    proposals = []
+    for tolerance, delivery_request in pairs:
+        pair = (tolerance.id, delivery_request.id)
+        if pair in seen:
+            continue
+        seen.add(pair)
+        proposals.append((tolerance, delivery_request, None))
+    return proposals
+
+
+def partition_key(posting, rules=None):
+    """Key of the independent matching partition a posting belongs to.
+
+    Postings only pair within one group of compatible container types and,
+    unless an origin radius is set, within one origin place, so no candidate
+    pair ever crosses two keys.
+    """
+    rules = rules or DEFAULT_RULES
+    group = rules.compatibility.group(posting.container_type)
+    if rules.origin_radius_km > 0:
+        return (group,)
+    return (place_key(posting.origin_place_id, posting.origin), group)
+
+
+def split_partitions(tolerances, requests, rules=None, count=1):
+    """Group postings into at most ``count`` independent partitions of similar size.
+
+    Returns ``(tolerances, requests)`` pairs. Whole partition keys are placed
+    largest first onto the currently lightest partition, weighing a key by
+    its tolerance x request product since that bounds its candidate pairs.
+    """
+    groups = defaultdict(lambda: ([], []))
+    for tolerance in tolerances:
+        groups[partition_key(tolerance, rules)][0].append(tolerance)
+    for delivery_request in requests:
+        groups[partition_key(delivery_request, rules)][1].append(delivery_request)
+
+    def weight(group):
+        return len(group[0]) * len(group[1]) + len(group[0]) + len(group[1])
+
+    partitions = [([], []) for _ in range(max(1, min(count, len(groups))))]
+    loads = [0] * len(partitions)
+    for key, group in sorted(groups.items(), key=lambda item: (-weight(item[1]), repr(item[0]))):
+        i = loads.index(min(loads))
+        partitions[i][0].extend(group[0])
+        partitions[i][1].extend(group[1])
+        loads[i] += weight(group)
+    return partitions
+
+
+class PlacePoints:
+    """Picklable ``locate(place_id, name)`` over a fixed snapshot of coordinates"""
+
+    def __init__(self, by_id=None, by_name=None):
+        self.by_id = by_id or {}
+        self.by_name = by_name or {}
+
+    @classmethod
+    def snapshot(cls, locate, postings):
+        points = cls()
+        for posting in postings:
+            for place_id, name in ((posting.origin_place_id, posting.origin),
+                                   (posting.destination_place_id, posting.destination)):
+                if place_id is not None:
+                    if place_id not in points.by_id:
+                        points.by_id[place_id] = locate(place_id, name)
+                else:
+                    key = normalize_name(name)
+                    if key not in points.by_name:
+                        points.by_name[key] = locate(None, name)
+        return points
+
+    def __call__(self, place_id, name=None):
+        if place_id is not None:
+            return self.by_id.get(place_id)
+        return self.by_name.get(normalize_name(name))
+
+
+def score_partition(mode, tolerances, requests, matches, rules=None, locate=None, max_visits=None):
+    """propose_matches for one partition, as ``(tolerance_id, request_id, count)`` for cheap pickling.
+
+    Runs in ProcessPoolExecutor workers, so it must stay a module-level function.
+    """
+    return [(tolerance.id, delivery_request.id, count) for tolerance, delivery_request, count
+            in propose_matches(mode, tolerances, requests, matches, rules, locate, max_visits)]
+
+
+class OpenBook:
+    """In-memory index of every open tolerance and delivery request.
+
+    New postings are matched against the opposite side only, so matching a
+    single POST costs one lane window query instead of a full rescan. ``version``
+    is bumped on every change and can be used as a cache key.
+    """
+
+    def __init__(self, rules=None, locate=None):
+        self.rules = rules or DEFAULT_RULES
+        self.locate = locate
+        self.tolerances = ToleranceIndex(rules=self.rules, locate=locate)
+        self.requests = RequestIndex(rules=self.rules, locate=locate)
+        self.version = 0
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    def load(self, tolerances, requests, loaded_at=None, rules=None, locate=None):
+        with self._lock:
+            if rules is not None:
+                self.rules = rules
+            if locate is not None:
+                self.locate = locate
+            self.tolerances = ToleranceIndex(tolerances, self.rules, self.locate)
+            self.requests = RequestIndex(requests, self.rules, self.locate)
+            self.version += 1
+            self.loaded_at = loaded_at
+
+    def add_tolerance(self, tolerance):
+        """Add an open tolerance and return the pending requests it matches"""
+        with self._lock:
+            self.tolerances.add(tolerance)
+            self.version += 1
+            return self.requests.candidates(tolerance)
+
+    def tolerance_candidates(self, delivery_request):
+        """Open tolerances a request matches, without adding the request"""
+        with self._lock:
+            return self.tolerances.candidates(delivery_request)
+
+    def add_request(self, delivery_request):
+        """Add a pending request and return the open tolerances it matches"""
+        with self._lock:
+            self.requests.add(delivery_request)
+            self.version += 1
+            return self.tolerances.candidates(delivery_request)
+
+    def discard_tolerance(self, tolerance_id):
+        with self._lock:
+            if self.tolerances.discard(tolerance_id) is not None:
+                self.version += 1
+
+    def discard_request(self, request_id):
+        with self._lock:
+            if self.requests.discard(request_id) is not None:
+                self.version += 1
@@ -64,16 +64,22 @@ class Tolerance(db.Model):
     carrier_id = db.Column(db.Integer, db.ForeignKey('carriers.id'), nullable=False)
     origin = db.Column(db.String(100), nullable=False)
     destination = db.Column(db.String(100), nullable=False)
+    origin_place_id = db.Column(db.Integer, db.ForeignKey('places.id'), index=True)
+    destination_place_id = db.Column(db.Integer, db.ForeignKey('places.id'), index=True)
     departure_time = db.Column(db.DateTime, nullable=False)
     arrival_time = db.Column(db.DateTime, nullable=False)
     container_type = db.Column(db.String(20), nullable=False)  # 20ft, 40ft, etc.
     container_count = db.Column(db.Integer, nullable=False)
+    remaining_count = db.Column(db.Integer)  # Unallocated slots; None means container_count
     is_empty_run = db.Column(db.Boolean, default=False)
     price = db.Column(db.Integer)  # Price in KRW
     status = db.Column(db.String(20), default='available')  # available, matched, completed, cancelled
     special_requirements = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Optimistic lock
+    
+    __mapper_args__ = {'version_id_col': version_id}
     
     # Relationships
     matches = db.relationship('Match', backref='tolerance', lazy=True)
@@ -85,6 +91,8 @@ class DeliveryRequest(db.Model):
     carrier_id = db.Column(db.Integer, db.ForeignKey('carriers.id'), nullable=False)
     origin = db.Column(db.String(100), nullable=False)
     destination = db.Column(db.String(100), nullable=False)
+    origin_place_id = db.Column(db.Integer, db.ForeignKey('places.id'), index=True)
+    destination_place_id = db.Column(db.Integer, db.ForeignKey('places.id'), index=True)
     pickup_time = db.Column(db.DateTime, nullable=False)
     delivery_time = db.Column(db.DateTime, nullable=False)
     container_type = db.Column(db.String(20), nullable=False)
@@ -95,12 +103,18 @@ class DeliveryRequest(db.Model):
     special_requirements = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Optimistic lock
+    
+    __mapper_args__ = {'version_id_col': version_id}
     
     # Relationships
     matches = db.relationship('Match', backref='delivery_request', lazy=True)
 
 class Match(db.Model):
     __tablename__ = 'matches'
+    __table_args__ = (
+        db.UniqueConstraint('tolerance_id', 'delivery_request_id', name='uq_match_pair'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tolerance_id = db.Column(db.Integer, db.ForeignKey('tolerances.id'), nullable=False)
@@ -108,8 +122,14 @@ class Match(db.Model):
     driver_id = db.Column(db.Integer, db.ForeignKey('drivers.id'))
     status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected, completed, cancelled
     price = db.Column(db.Integer)  # Final agreed price
+    container_count = db.Column(db.Integer)  # Slots reserved on the tolerance (consolidation)
+    tour_id = db.Column(db.String(32), index=True)  # Multi-leg tour this match is a leg of
+    tour_seq = db.Column(db.Integer)  # Leg number within the tour, from 1
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Optimistic lock
+    
+    __mapper_args__ = {'version_id_col': version_id}
     
     # Relationships
     driver = db.relationship('Driver', backref='matches')
@@ -124,4 +144,49 @@ class LocationPath(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20))  # pickup, in_transit, delivered
-    notes = db.Column(db.Text) 
\ No newline at end of file
+    notes = db.Column(db.Text)
+
+class Place(db.Model):
+    __tablename__ = 'places'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # Canonical name
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    aliases_json = db.Column(db.Text)  # JSON list of alternative spellings
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MatchJob(db.Model):
+    __tablename__ = 'match_jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    mode = db.Column(db.String(20), nullable=False)
+    partition = db.Column(db.String(100), nullable=False, default='all')
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed
+    phase = db.Column(db.String(20))  # load, match, write
+    progress = db.Column(db.Float, default=0.0)  # 0.0 - 1.0
+    stats_json = db.Column(db.Text)  # JSON: counts and per-phase timings
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class MatchLock(db.Model):
+    __tablename__ = 'match_locks'
+    
+    partition = db.Column(db.String(100), primary_key=True)  # One running auto-match per partition
+    job_id = db.Column(db.String(32), db.ForeignKey('match_jobs.id'), nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class LanePrice(db.Model):
+    __tablename__ = 'lane_prices'
+    
+    lane = db.Column(db.String(255), primary_key=True)  # JSON of matching.posting_lane
+    origin = db.Column(db.String(100), nullable=False)
+    destination = db.Column(db.String(100), nullable=False)
+    container_type = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)  # Accepted matches ever priced on this lane
+    ewma = db.Column(db.Float)
+    recent_json = db.Column(db.Text)  # JSON list of the last MATCH_PRICE_WINDOW prices, oldest first
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,316 @@
+import heapq
+import itertools
+import math
+import threading
+from collections import namedtuple
+
+from matching import free_slots, place_key
+
+# 한 운송 요청을 체결할 때 살펴볼 최대 호가 수 (수량이 안 맞는 호가는 건너뛴다)
+DEFAULT_DEPTH = 8
+
+Fill = namedtuple('Fill', ['tolerance', 'delivery_request', 'slots', 'price'])
+
+Quote = namedtuple('Quote', [
+    'lane', 'origin', 'destination', 'container_type', 'day',
+    'best_bid', 'bid_orders', 'bid_quantity', 'best_ask', 'ask_orders', 'ask_quantity'])
+
+_Order = namedtuple('_Order', ['posting', 'limit', 'quantity', 'stamp'])
+
+
+def ask_limit(tolerance):
+    """Price a tolerance asks for its slots (no price = free)"""
+    return float(tolerance.price or 0)
+
+
+def bid_limit(delivery_request):
+    """Most a delivery request pays (no budget = any price)"""
+    return float(delivery_request.budget) if delivery_request.budget else math.inf
+
+
+def book_lane(posting, moment):
+    """(출발지, 도착지, 컨테이너 타입, 날짜) 호가창 키"""
+    return (place_key(posting.origin_place_id, posting.origin),
+            place_key(posting.destination_place_id, posting.destination),
+            posting.container_type, moment.date())
+
+
+class _Side:
+    """One side of a lane book: a heap in price-time priority with lazy deletion.
+
+    Cancelled and filled orders are only dropped from ``live``; their heap
+    entries are skipped once they reach the top, so cancel is O(1) and the
+    heap is rebuilt when dead entries outnumber live ones.
+    """
+
+    def __init__(self, sign):
+        self.sign = sign  # 1: 낮은 가격 우선 (ask), -1: 높은 가격 우선 (bid)
+        self.heap = []
+        self.live = {}
+        self.quantity = 0
+
+    def __len__(self):
+        return len(self.live)
+
+    def _entry(self, order):
+        return (self.sign * order.limit, order.stamp, order.posting.id)
+
+    def _is_live(self, entry):
+        order = self.live.get(entry[2])
+        return order is not None and order.stamp == entry[1]
+
+    def load(self, orders):
+        self.live = {order.posting.id: order for order in orders}
+        self.heap = [self._entry(order) for order in orders]
+        heapq.heapify(self.heap)
+        self.quantity = sum(order.quantity for order in orders)
+
+    def push(self, order):
+        self.discard(order.posting.id)
+        self.live[order.posting.id] = order
+        self.quantity += order.quantity
+        heapq.heappush(self.heap, self._entry(order))
+
+    def discard(self, posting_id):
+        order = self.live.pop(posting_id, None)
+        if order is not None:
+            self.quantity -= order.quantity
+            if len(self.heap) > 2 * len(self.live) + 16:
+                self.heap = [entry for entry in self.heap if self._is_live(entry)]
+                heapq.heapify(self.heap)
+        return order
+
+    def top(self):
+        """Best live order, or None"""
+        while self.heap and not self._is_live(self.heap[0]):
+            heapq.heappop(self.heap)
+        return self.live[self.heap[0][2]] if self.heap else None
+
+    def best(self, crosses, fits, depth):
+        """Best order whose limit ``crosses`` and whose quantity ``fits``, looking at most ``depth`` deep"""
+        skipped = []
+        found = None
+        while len(skipped) < depth:
+            order = self.top()
+            if order is None or not crosses(order.limit):
+                break
+            if fits(order.quantity):
+                found = order
+                break
+            skipped.append(heapq.heappop(self.heap))
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return found
+
+    def fill(self, order, quantity):
+        """Take ``quantity`` from a live order; a partly filled order keeps its priority"""
+        self.quantity -= quantity
+        if quantity >= order.quantity:
+            del self.live[order.posting.id]
+        else:
+            self.live[order.posting.id] = order._replace(quantity=order.quantity - quantity)
+
+
+class LaneBook:
+    """Asks (tolerances) and bids (delivery requests) of one lane and day"""
+
+    def __init__(self, origin, destination):
+        self.origin = origin
+        self.destination = destination
+        self.asks = _Side(1)
+        self.bids = _Side(-1)
+
+    def __bool__(self):
+        return bool(self.asks) or bool(self.bids)
+
+    def cross_ask(self, tolerance, order, depth):
+        """Fill a new ask against resting bids; returns (fills, slots left)"""
+        fills = []
+        left = order.quantity
+        while left > 0:
+            bid = self.bids.best(lambda limit: limit >= order.limit, lambda quantity: quantity <= left, depth)
+            if bid is None:
+                break
+            self.bids.fill(bid, bid.quantity)
+            left -= bid.quantity
+            price = bid.limit if bid.limit != math.inf else order.limit
+            fills.append(Fill(tolerance, bid.posting, bid.quantity, price))
+        return fills, left
+
+    def cross_bid(self, delivery_request, order, depth):
+        """Fill a new bid, all or none, from the best resting ask with enough free slots"""
+        ask = self.asks.best(lambda limit: limit <= order.limit, lambda quantity: quantity >= order.quantity,
+                             depth)
+        if ask is None:
+            return []
+        self.asks.fill(ask, order.quantity)
+        return [Fill(ask.posting, delivery_request, order.quantity, ask.limit)]
+
+
+class OrderBook:
+    """Price-time priority order books, one per (origin, destination, container type, day).
+
+    A tolerance is an ask for its free slots at its price and a delivery
+    request is a bid for its containers up to its budget. A new posting
+    crosses the opposite side of its lane at the resting orders' prices,
+    best price first and oldest first within a price; what is left rests.
+    Each fill is a few heap operations, so a posting costs O(log n) in the
+    size of its lane. A bid is filled whole by one tolerance; asks too
+    small for it are skipped, looking at most ``depth`` asks deep.
+
+    Orders loaded from the database or re-rested after an edit do not
+    cross; only new postings do.
+    """
+
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self.lanes = {}
+        self.version = 0
+        self.loaded_at = None
+        self._ask_lanes = {}
+        self._bid_lanes = {}
+        self._stamps = itertools.count()
+        self._lock = threading.RLock()
+
+    def _lane(self, key, posting):
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = LaneBook(posting.origin, posting.destination)
+        return lane
+
+    def _ask(self, tolerance):
+        return _Order(tolerance, ask_limit(tolerance), free_slots(tolerance), next(self._stamps))
+
+    def _bid(self, delivery_request):
+        return _Order(delivery_request, bid_limit(delivery_request), delivery_request.container_count or 1,
+                      next(self._stamps))
+
+    def load(self, tolerances, requests, loaded_at=None, depth=None):
+        """Rebuild every lane from snapshots; time priority follows posting id"""
+        with self._lock:
+            if depth is not None:
+                self.depth = depth
+            self.lanes = {}
+            self._ask_lanes = {}
+            self._bid_lanes = {}
+            asks = {}
+            bids = {}
+            for tolerance in sorted(tolerances, key=lambda t: t.id):
+                if free_slots(tolerance) > 0:
+                    key = book_lane(tolerance, tolerance.departure_time)
+                    self._lane(key, tolerance)
+                    asks.setdefault(key, []).append(self._ask(tolerance))
+                    self._ask_lanes[tolerance.id] = key
+            for delivery_request in sorted(requests, key=lambda r: r.id):
+                key = book_lane(delivery_request, delivery_request.pickup_time)
+                self._lane(key, delivery_request)
+                bids.setdefault(key, []).append(self._bid(delivery_request))
+                self._bid_lanes[delivery_request.id] = key
+            for key, lane in self.lanes.items():
+                lane.asks.load(asks.get(key, []))
+                lane.bids.load(bids.get(key, []))
+            self.version += 1
+            self.loaded_at = loaded_at
+
+    def add_tolerance(self, tolerance):
+        """Cross a new tolerance against its lane's bids and rest the slots left; returns the fills"""
+        with self._lock:
+            self._discard(self._ask_lanes, tolerance.id, 'asks')
+            key = book_lane(tolerance, tolerance.departure_time)
+            lane = self._lane(key, tolerance)
+            order = self._ask(tolerance)
+            fills, left = lane.cross_ask(tolerance, order, self.depth)
+            for fill in fills:
+                self._bid_lanes.pop(fill.delivery_request.id, None)
+            if left > 0:
+                lane.asks.push(order._replace(quantity=left))
+                self._ask_lanes[tolerance.id] = key
+            self._prune(key)
+            self.version += 1
+            return fills
+
+    def add_request(self, delivery_request):
+        """Cross a new delivery request against its lane's asks, resting it if unfilled; returns the fills"""
+        with self._lock:
+            self._discard(self._bid_lanes, delivery_request.id, 'bids')
+            key = book_lane(delivery_request, delivery_request.pickup_time)
+            lane = self._lane(key, delivery_request)
+            order = self._bid(delivery_request)
+            fills = lane.cross_bid(delivery_request, order, self.depth)
+            for fill in fills:
+                if fill.tolerance.id not in lane.asks.live:
+                    self._ask_lanes.pop(fill.tolerance.id, None)
+            if not fills:
+                lane.bids.push(order)
+                self._bid_lanes[delivery_request.id] = key
+            self._prune(key)
+            self.version += 1
+            return fills
+
+    def rest_tolerance(self, tolerance):
+        """Put an edited tolerance back without crossing.
+
+        It keeps its time priority if its lane and price are unchanged and
+        its free slots did not grow.
+        """
+        with self._lock:
+            self._rest(self._ask_lanes, 'asks', tolerance, self._ask(tolerance),
+                       book_lane(tolerance, tolerance.departure_time))
+
+    def rest_request(self, delivery_request):
+        """Put an edited delivery request back without crossing (see rest_tolerance)"""
+        with self._lock:
+            self._rest(self._bid_lanes, 'bids', delivery_request, self._bid(delivery_request),
+                       book_lane(delivery_request, delivery_request.pickup_time))
+
+    def _rest(self, lanes, side_name, posting, order, key):
+        if order.quantity <= 0:
+            self._discard(lanes, posting.id, side_name)
+            self.version += 1
+            return
+        if lanes.get(posting.id) == key:
+            current = getattr(self.lanes[key], side_name).live.get(posting.id)
+            if current is not None and current.limit == order.limit and current.quantity >= order.quantity:
+                side = getattr(self.lanes[key], side_name)
+                side.quantity -= current.quantity - order.quantity
+                side.live[posting.id] = order._replace(stamp=current.stamp)
+                self.version += 1
+                return
+        self._discard(lanes, posting.id, side_name)
+        getattr(self._lane(key, posting), side_name).push(order)
+        lanes[posting.id] = key
+        self.version += 1
+
+    def discard_tolerance(self, tolerance_id):
+        with self._lock:
+            if self._discard(self._ask_lanes, tolerance_id, 'asks') is not None:
+                self.version += 1
+
+    def discard_request(self, request_id):
+        with self._lock:
+            if self._discard(self._bid_lanes, request_id, 'bids') is not None:
+                self.version += 1
+
+    def _discard(self, lanes, posting_id, side_name):
+        key = lanes.pop(posting_id, None)
+        if key is None:
+            return None
+        order = getattr(self.lanes[key], side_name).discard(posting_id)
+        self._prune(key)
+        return order
+
+    def _prune(self, key):
+        if not self.lanes[key]:
+            del self.lanes[key]
+
+    def snapshot(self):
+        """Best bid and ask of every lane with open orders, ordered by lane"""
+        with self._lock:
+            quotes = []
+            for key in sorted(self.lanes, key=lambda key: (str(key[0]), str(key[1]), key[2], key[3])):
+                lane = self.lanes[key]
+                bid, ask = lane.bids.top(), lane.asks.top()
+                quotes.append(Quote(key, lane.origin, lane.destination, key[2], key[3],
+                                    bid.limit if bid else None, len(lane.bids), lane.bids.quantity,
+                                    ask.limit if ask else None, len(lane.asks), lane.asks.quantity))
+            return quotes
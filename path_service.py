@@ -0,0 +1,45 @@
+from app import app
+from models import LocationPath
+from path_simplify import DEFAULT_MAX_PATHS, DEFAULT_TOLERANCES, PathCache, PathLevels, choose_level
+
+# 최근 조회한 매칭 경로의 상세 수준별 단순화 결과 (워커마다 하나)
+path_cache = PathCache(max_paths=app.config.get('PATH_CACHE_SIZE', DEFAULT_MAX_PATHS))
+
+
+def path_point(location):
+    """One stored location as sent by /api/location/path"""
+    return {
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'timestamp': location.timestamp.isoformat()
+    }
+
+
+def stored_path(match_id, after=None):
+    """Stored locations of a match after ``after`` (exclusive), oldest first"""
+    query = LocationPath.query.filter_by(match_id=match_id)
+    if after is not None:
+        query = query.filter(LocationPath.timestamp > after)
+    return query.order_by(LocationPath.timestamp, LocationPath.id).all()
+
+
+def cached_path(match_id):
+    """The match's path at every detail level, built on first use and caught up from the database on every call"""
+    paths = path_cache.get(match_id)
+    if paths is None:
+        paths = PathLevels(app.config.get('PATH_TOLERANCES_M', DEFAULT_TOLERANCES))
+    for location in stored_path(match_id, paths.cursor):
+        paths.add(path_point(location), location.timestamp)
+    path_cache.put(match_id, paths)
+    return paths
+
+
+def path_level(match_id, level=None, zoom=None):
+    """Detail level to send for a requested ``level`` or map ``zoom`` (0 = every point)"""
+    return choose_level(level, zoom, lambda: cached_path(match_id),
+                        app.config.get('PATH_TOLERANCES_M', DEFAULT_TOLERANCES))
+
+
+def simplified_path(match_id, level):
+    """Path of a match at detail ``level`` (1 = finest), oldest first"""
+    return cached_path(match_id).points(level)
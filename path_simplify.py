@@ -0,0 +1,188 @@
+import math
+import threading
+from collections import OrderedDict
+
+# 상세 수준 1, 2, 3 의 허용 오차 (m); 수준 0 은 원본 경로
+DEFAULT_TOLERANCES = (10.0, 40.0, 160.0)
+DEFAULT_MAX_PATHS = 256
+# 줌 0 에서 적도 기준 픽셀당 거리 (m, 256px 타일)
+METERS_PER_PIXEL_Z0 = 156543.03392
+METERS_PER_DEG_LAT = 110574.0
+METERS_PER_DEG_LNG = 111320.0
+
+
+def segment_distance_m(point, start, end):
+    """``point`` 에서 선분 start-end 까지의 거리 (m, 좁은 영역의 등장방형 투영)"""
+    scale = METERS_PER_DEG_LNG * math.cos(math.radians(start['latitude']))
+    px = (point['longitude'] - start['longitude']) * scale
+    py = (point['latitude'] - start['latitude']) * METERS_PER_DEG_LAT
+    ex = (end['longitude'] - start['longitude']) * scale
+    ey = (end['latitude'] - start['latitude']) * METERS_PER_DEG_LAT
+    length_sq = ex * ex + ey * ey
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, (px * ex + py * ey) / length_sq))
+    return math.hypot(px - t * ex, py - t * ey)
+
+
+def level_for_zoom(zoom, latitude=0.0, tolerances=DEFAULT_TOLERANCES):
+    """Coarsest detail level whose tolerance stays under two screen pixels at a web-map zoom"""
+    pixel_m = METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / 2 ** zoom
+    level = 0
+    for i, tolerance in enumerate(tolerances, start=1):
+        if tolerance <= 2 * pixel_m:
+            level = i
+    return level
+
+
+def parse_path_detail(level=None, zoom=None):
+    """(level, zoom) sent by a client as numbers or None; ValueError if malformed"""
+    level = int(level) if level not in (None, '') else None
+    zoom = float(zoom) if zoom not in (None, '') else None
+    if (level is not None and level < 0) or (zoom is not None and not 0 <= zoom <= 30):
+        raise ValueError('detail out of range')
+    return level, zoom
+
+
+def choose_level(level=None, zoom=None, paths=None, tolerances=DEFAULT_TOLERANCES):
+    """Detail level to send: ``level`` as asked, else the level for a map ``zoom``, else 0 (every point).
+
+    ``paths`` returns the match's PathLevels and is only called for a zoom.
+    """
+    if level is not None:
+        return min(level, len(tolerances))
+    if zoom is not None:
+        return paths().level_for_zoom(zoom)
+    return 0
+
+
+class StreamingSimplifier:
+    """Path simplified to ``tolerance_m``, one point at a time.
+
+    Sleeve-fitting form of Douglas-Peucker: the last kept point anchors a
+    sector of directions that keeps every point since then within the
+    tolerance of the segment to the newest point. When a new point falls
+    outside that sector, or comes back closer to the anchor than a point
+    already passed, the previous point is kept and becomes the anchor.
+    Each point costs O(1). The newest point is always part of the result
+    but may be dropped again by later points.
+    """
+
+    def __init__(self, tolerance_m):
+        self.tolerance_m = tolerance_m
+        self.kept = []
+        self.last = None
+        self._reset()
+
+    def _reset(self):
+        self._ref = None  # 첫 제약 점의 방향 (rad), 섹터는 이 방향 기준 상대 각도
+        self._lo = self._hi = 0.0
+        self._far = 0.0  # 허용 오차 밖 점 중 기준점에서 가장 먼 거리
+
+    def _polar(self, point):
+        anchor = self.kept[-1]
+        x = (point['longitude'] - anchor['longitude']) * METERS_PER_DEG_LNG * math.cos(math.radians(anchor['latitude']))
+        y = (point['latitude'] - anchor['latitude']) * METERS_PER_DEG_LAT
+        return math.hypot(x, y), math.atan2(y, x)
+
+    def _relative(self, angle):
+        return (angle - self._ref + math.pi) % (2 * math.pi) - math.pi
+
+    def _fits(self, distance, angle):
+        if self._ref is None:
+            return True
+        return distance >= self._far and self._lo <= self._relative(angle) <= self._hi
+
+    def _constrain(self, distance, angle):
+        if distance <= self.tolerance_m:
+            return
+        width = math.asin(self.tolerance_m / distance)
+        if self._ref is None:
+            self._ref, self._lo, self._hi = angle, -width, width
+        else:
+            relative = self._relative(angle)
+            self._lo = max(self._lo, relative - width)
+            self._hi = min(self._hi, relative + width)
+        self._far = max(self._far, distance)
+
+    def add(self, point):
+        if not self.kept:
+            self.kept.append(point)
+            return
+        distance, angle = self._polar(point)
+        if self.last is not None and not self._fits(distance, angle):
+            self.kept.append(self.last)
+            self._reset()
+            distance, angle = self._polar(point)
+        self._constrain(distance, angle)
+        self.last = point
+
+    def points(self):
+        return self.kept + ([self.last] if self.last is not None else [])
+
+
+class PathLevels:
+    """A match's path kept at every detail level, updated point by point.
+
+    Points are location history dicts (``latitude``, ``longitude``,
+    ``timestamp``...); ``cursor`` is the datetime of the newest one, and
+    points not newer than it are ignored.
+    """
+
+    def __init__(self, tolerances=DEFAULT_TOLERANCES):
+        self.levels = [StreamingSimplifier(tolerance) for tolerance in tolerances]
+        self.raw_count = 0
+        self.cursor = None
+        self._lock = threading.Lock()
+
+    def add(self, point, timestamp):
+        with self._lock:
+            if self.cursor is not None and timestamp <= self.cursor:
+                return False
+            self.cursor = timestamp
+            self.raw_count += 1
+            for level in self.levels:
+                level.add(point)
+            return True
+
+    def level_for_zoom(self, zoom):
+        with self._lock:
+            latitude = self.levels[0].points()[-1]['latitude'] if self.raw_count else 0.0
+        return level_for_zoom(zoom, latitude, [level.tolerance_m for level in self.levels])
+
+    def points(self, level):
+        """Simplified path at ``level`` (1 = finest), oldest first"""
+        level = max(1, min(level, len(self.levels)))
+        with self._lock:
+            return self.levels[level - 1].points()
+
+
+class PathCache:
+    """PathLevels of the most recently used ``max_paths`` matches"""
+
+    def __init__(self, max_paths=DEFAULT_MAX_PATHS):
+        self.max_paths = max_paths
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def get(self, match_id):
+        with self._lock:
+            paths = self._paths.get(match_id)
+            if paths is not None:
+                self._paths.move_to_end(match_id)
+            return paths
+
+    def put(self, match_id, paths):
+        with self._lock:
+            self._paths[match_id] = paths
+            self._paths.move_to_end(match_id)
+            while len(self._paths) > self.max_paths:
+                self._paths.popitem(last=False)
+
+    def add_point(self, match_id, point, timestamp):
+        """Extend a cached path with a new point (uncached paths are built on their next read)"""
+        with self._lock:
+            paths = self._paths.get(match_id)
+        if paths is not None:
+            paths.add(point, timestamp)
@@ -0,0 +1,73 @@
+import json
+import logging
+import time
+
+from app import app, db
+from models import Place, Tolerance, DeliveryRequest
+from gazetteer import Gazetteer, PlaceEntry, SEED_PLACES
+from sqlalchemy import or_
+
+# 지명 → 장소 캐시 (워커마다 하나)
+gazetteer = Gazetteer()
+
+
+def place_rows():
+    """(PlaceEntry, aliases) for every place in the gazetteer table"""
+    return [(PlaceEntry(p.id, p.name, p.latitude, p.longitude), json.loads(p.aliases_json or '[]'))
+            for p in Place.query.all()]
+
+
+def ensure_gazetteer():
+    """Load the gazetteer cache on first use and reload it once it is older than GAZETTEER_MAX_AGE"""
+    max_age = app.config.get('GAZETTEER_MAX_AGE', 3600)
+    if gazetteer.loaded_at is None or time.monotonic() - gazetteer.loaded_at > max_age:
+        gazetteer.load(place_rows(), loaded_at=time.monotonic())
+    return gazetteer
+
+
+def resolve_place(name):
+    """Canonical PlaceEntry for a free-text place name, or None"""
+    return ensure_gazetteer().resolve(name)
+
+
+def assign_places(posting):
+    """Set origin_place_id/destination_place_id of a tolerance or request from its names"""
+    book = ensure_gazetteer()
+    posting.origin_place_id = book.resolve_id(posting.origin)
+    posting.destination_place_id = book.resolve_id(posting.destination)
+
+
+def seed_places():
+    """Insert the built-in Eastern Seaboard places when the table is empty"""
+    if Place.query.first():
+        return 0
+    for seed in SEED_PLACES:
+        db.session.add(Place(name=seed['name'], latitude=seed['latitude'], longitude=seed['longitude'],
+                             aliases_json=json.dumps(seed['aliases'], ensure_ascii=False)))
+    db.session.commit()
+    gazetteer.loaded_at = None
+    logging.info(f"Seeded {len(SEED_PLACES)} places")
+    return len(SEED_PLACES)
+
+
+def backfill_places():
+    """Resolve place ids of postings created before their place was in the gazetteer"""
+    updated = 0
+    for model in (Tolerance, DeliveryRequest):
+        unresolved = or_(model.origin_place_id.is_(None), model.destination_place_id.is_(None))
+        for posting in model.query.filter(unresolved).all():
+            assign_places(posting)
+            updated += posting.origin_place_id is not None or posting.destination_place_id is not None
+    db.session.commit()
+    return updated
+
+
+def add_place(name, latitude, longitude, aliases=()):
+    """Create a place and make it resolvable in this worker immediately"""
+    place = Place(name=name, latitude=latitude, longitude=longitude,
+                  aliases_json=json.dumps(list(aliases), ensure_ascii=False))
+    db.session.add(place)
+    db.session.commit()
+    ensure_gazetteer().add(PlaceEntry(place.id, place.name, place.latitude, place.longitude), aliases)
+    backfill_places()
+    return place
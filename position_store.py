@@ -0,0 +1,179 @@
+import json
+import logging
+import math
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from geo import haversine_km
+
+DEFAULT_WRITE_INTERVAL = 30.0  # 초
+DEFAULT_KEY_PREFIX = 'driver_position:'
+
+# speed: km/h, heading: 북쪽 기준 시계 방향 각도 (0-360), timestamp: UTC datetime
+Position = namedtuple('Position', ['latitude', 'longitude', 'speed', 'heading', 'timestamp'])
+
+
+def bearing_deg(lat1, lng1, lat2, lng2):
+    """첫 좌표에서 둘째 좌표로 가는 초기 방위각 (도)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_lambda = math.radians(lng2 - lng1)
+    y = math.sin(d_lambda) * math.cos(phi2)
+    x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lambda)
+    return math.degrees(math.atan2(y, x)) % 360
+
+
+class LocalPositionBackend:
+    """Latest positions in this process's memory (single node, and tests)"""
+
+    def __init__(self):
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def get(self, driver_id):
+        with self._lock:
+            return self._positions.get(driver_id)
+
+    def get_many(self, driver_ids):
+        with self._lock:
+            return {driver_id: self._positions[driver_id] for driver_id in driver_ids if driver_id in self._positions}
+
+    def put(self, driver_id, position):
+        with self._lock:
+            self._positions[driver_id] = position
+
+
+class RedisPositionBackend:
+    """Latest positions in Redis, shared by every node pointing at the same server.
+
+    Needs the ``redis`` package; each driver is one JSON string under
+    ``key_prefix + driver_id``.
+    """
+
+    def __init__(self, url, key_prefix=DEFAULT_KEY_PREFIX):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def _key(self, driver_id):
+        return f'{self.key_prefix}{driver_id}'
+
+    @staticmethod
+    def _load(raw):
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        data['timestamp'] = datetime.fromisoformat(data['timestamp'])
+        return Position(**data)
+
+    def get(self, driver_id):
+        return self._load(self.client.get(self._key(driver_id)))
+
+    def get_many(self, driver_ids):
+        driver_ids = list(driver_ids)
+        if not driver_ids:
+            return {}
+        raws = self.client.mget([self._key(driver_id) for driver_id in driver_ids])
+        return {driver_id: self._load(raw) for driver_id, raw in zip(driver_ids, raws) if raw is not None}
+
+    def put(self, driver_id, position):
+        data = position._asdict()
+        data['timestamp'] = position.timestamp.isoformat()
+        self.client.set(self._key(driver_id), json.dumps(data))
+
+
+def position_backend(url=None):
+    """Backend for DRIVER_POSITION_STORE_URL: Redis for ``redis://`` URLs, else this process's memory"""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisPositionBackend(url)
+    return LocalPositionBackend()
+
+
+class PositionStore:
+    """Latest position, speed and heading of every driver, keyed by driver id.
+
+    ``update`` and ``get`` only touch the backend, so current-location reads
+    never hit the database. Positions updated on this node are written back
+    to the drivers table through ``writer({driver_id: (lat, lng)})`` at most
+    every ``write_interval`` seconds by a background thread; a failed write
+    is logged and retried with the next one. When the client does not send
+    speed or heading they are derived from the previous position.
+    """
+
+    def __init__(self, writer, backend=None, write_interval=DEFAULT_WRITE_INTERVAL):
+        self.writer = writer
+        self.backend = backend or LocalPositionBackend()
+        self.write_interval = write_interval
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def update(self, driver_id, latitude, longitude, speed=None, heading=None, timestamp=None):
+        """Record a driver's position and return it as a Position"""
+        timestamp = timestamp or datetime.utcnow()
+        if speed is None or heading is None:
+            previous = self.backend.get(driver_id)
+            if previous is not None and previous.timestamp < timestamp:
+                if speed is None:
+                    hours = (timestamp - previous.timestamp).total_seconds() / 3600
+                    speed = haversine_km(previous.latitude, previous.longitude, latitude, longitude) / hours
+                if heading is None:
+                    if (previous.latitude, previous.longitude) != (latitude, longitude):
+                        heading = bearing_deg(previous.latitude, previous.longitude, latitude, longitude)
+                    else:
+                        heading = previous.heading  # 정지 중에는 마지막 방향 유지
+        position = Position(latitude, longitude, speed, heading, timestamp)
+        self.backend.put(driver_id, position)
+        with self._lock:
+            self._dirty[driver_id] = (latitude, longitude)
+        return position
+
+    def get(self, driver_id):
+        """Latest Position of a driver, or None"""
+        return self.backend.get(driver_id)
+
+    def get_many(self, driver_ids):
+        """``{driver_id: Position}`` for the drivers that have one"""
+        return self.backend.get_many(driver_ids)
+
+    def write_back(self):
+        """Write positions updated since the last write-back; returns the number of drivers written"""
+        with self._write_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return 0
+            try:
+                self.writer(dirty)
+            except Exception as e:
+                logging.error(f"Driver position write-back 오류 ({len(dirty)} drivers): {str(e)}")
+                with self._lock:
+                    # 실패한 뒤에 들어온 위치가 더 최신이다
+                    self._dirty = {**dirty, **self._dirty}
+                return 0
+            return len(dirty)
+
+    def start(self):
+        """Start the background write-back (once)"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='position-store', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.write_interval):
+            self.write_back()
+
+    def stop(self):
+        """Stop the write-back thread and write whatever is still pending"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        return self.write_back()
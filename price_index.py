@@ -0,0 +1,108 @@
+import threading
+from bisect import bisect_left, insort
+from collections import deque, namedtuple
+
+# 레인마다 백분위를 계산할 최근 체결 가격 수
+DEFAULT_WINDOW = 200
+DEFAULT_ALPHA = 0.2
+
+LaneQuote = namedtuple('LaneQuote', ['count', 'ewma', 'p10', 'p50', 'p90', 'last_price'])
+
+
+class LanePriceStats:
+    """Running price statistics of one lane.
+
+    ``count`` and the EWMA cover every price ever added; percentiles are
+    over the last ``window`` prices, kept both in arrival order and sorted,
+    so an update is a bisect plus a bounded list insert.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, alpha=DEFAULT_ALPHA, count=0, ewma=None, recent=()):
+        self.window = window
+        self.alpha = alpha
+        self.count = count
+        self.ewma = ewma
+        self.recent = deque(recent[-window:] if window else (), maxlen=window)
+        self.sorted = sorted(self.recent)
+
+    def add(self, price):
+        price = float(price)
+        self.count += 1
+        self.ewma = price if self.ewma is None else self.alpha * price + (1 - self.alpha) * self.ewma
+        if len(self.recent) == self.window:
+            oldest = self.recent[0]
+            del self.sorted[bisect_left(self.sorted, oldest)]
+        self.recent.append(price)
+        insort(self.sorted, price)
+
+    def percentile(self, q):
+        """Nearest-rank percentile (0-100) of the recent prices, or None"""
+        if not self.sorted:
+            return None
+        rank = max(1, -(-q * len(self.sorted) // 100))
+        return self.sorted[min(len(self.sorted), int(rank)) - 1]
+
+    def quote(self):
+        return LaneQuote(self.count, self.ewma, self.percentile(10), self.percentile(50), self.percentile(90),
+                         self.recent[-1] if self.recent else None)
+
+    def state(self):
+        """(count, ewma, recent prices oldest first) to persist"""
+        return self.count, self.ewma, list(self.recent)
+
+
+class PriceIndex:
+    """Price statistics of accepted matches per lane, held in memory.
+
+    ``reference(lane)`` is the median of the lane's recent prices, the
+    price a new posting on that lane is compared with. ``version`` is bumped
+    on every change and can be used as a cache key.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, alpha=DEFAULT_ALPHA):
+        self.window = window
+        self.alpha = alpha
+        self.lanes = {}
+        self.version = 0
+        self.loaded_at = None
+        self._lock = threading.RLock()
+
+    def stats(self, count=0, ewma=None, recent=()):
+        return LanePriceStats(self.window, self.alpha, count, ewma, recent)
+
+    def load(self, states, loaded_at=None, window=None, alpha=None):
+        """Replace every lane from ``{lane: (count, ewma, recent)}``"""
+        with self._lock:
+            if window is not None:
+                self.window = window
+            if alpha is not None:
+                self.alpha = alpha
+            self.lanes = {lane: self.stats(*state) for lane, state in states.items()}
+            self.version += 1
+            self.loaded_at = loaded_at
+
+    def add(self, lane, price):
+        with self._lock:
+            stats = self.lanes.get(lane)
+            if stats is None:
+                stats = self.lanes[lane] = self.stats()
+            stats.add(price)
+            self.version += 1
+            return stats
+
+    def put(self, lane, state):
+        """Set one lane from a persisted ``(count, ewma, recent)``"""
+        with self._lock:
+            self.lanes[lane] = self.stats(*state)
+            self.version += 1
+
+    def quote(self, lane):
+        with self._lock:
+            stats = self.lanes.get(lane)
+            return stats.quote() if stats is not None else None
+
+    def reference(self, lane):
+        """Median recent price of a lane, or None without history"""
+        with self._lock:
+            stats = self.lanes.get(lane)
+            return stats.percentile(50) if stats is not None else None
@@ -0,0 +1,140 @@
+import json
+import logging
+import time
+
+from sqlalchemy.orm import object_session
+
+from app import app, db
+from models import LanePrice, Match
+from matching import place_key, posting_lane
+from place_service import ensure_gazetteer
+from price_index import DEFAULT_ALPHA, DEFAULT_WINDOW, PriceIndex
+
+# 레인별 체결 가격 통계 (워커마다 하나, lane_prices 테이블에서 읽는다)
+price_index = PriceIndex()
+# 레인 키 -> (출발지, 도착지) 표시 이름
+_lane_labels = {}
+
+
+def lane_id(lane):
+    """Primary key of a lane in the lane_prices table"""
+    return json.dumps(list(lane), ensure_ascii=False)
+
+
+def load_price_index(session=None):
+    """Reload every lane's statistics from the lane_prices table (one row per lane)"""
+    states = {}
+    labels = {}
+    for row in (session or db.session).query(LanePrice).all():
+        lane = tuple(json.loads(row.lane))
+        states[lane] = (row.count, row.ewma, json.loads(row.recent_json or '[]'))
+        labels[lane] = (row.origin, row.destination)
+    price_index.load(states, loaded_at=time.monotonic(), window=app.config.get('MATCH_PRICE_WINDOW', DEFAULT_WINDOW),
+                     alpha=app.config.get('MATCH_PRICE_EWMA_ALPHA', DEFAULT_ALPHA))
+    _lane_labels.clear()
+    _lane_labels.update(labels)
+    return price_index
+
+
+def ensure_price_index(session=None):
+    """Load the price index on first use and reload it once it is older than MATCH_PRICE_INDEX_MAX_AGE.
+
+    Other workers record prices too; the reload picks up their lanes.
+    """
+    max_age = app.config.get('MATCH_PRICE_INDEX_MAX_AGE', 60)
+    if price_index.loaded_at is None or time.monotonic() - price_index.loaded_at > max_age:
+        load_price_index(session)
+    return price_index
+
+
+def match_price(match):
+    """Agreed price of a match, or the tolerance's asking price when none was agreed"""
+    price = match.price or match.tolerance.price
+    return float(price) if price else None
+
+
+def _lane_row(session, lane, delivery_request):
+    """The lane's row locked for update, created empty on first use"""
+    key = lane_id(lane)
+    row = session.query(LanePrice).filter_by(lane=key).with_for_update().first()
+    if row is not None:
+        return row
+    values = {'lane': key, 'origin': delivery_request.origin, 'destination': delivery_request.destination,
+              'container_type': delivery_request.container_type, 'count': 0}
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        # 다른 워커가 같은 레인을 동시에 처음 만들 수 있다
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        session.execute(insert(LanePrice.__table__).values(**values).on_conflict_do_nothing())
+    else:
+        session.execute(LanePrice.__table__.insert().values(**values))
+    return session.query(LanePrice).filter_by(lane=key).with_for_update().first()
+
+
+def record_match_price(match):
+    """Add an accepted match's price to its lane, in the caller's transaction.
+
+    The lane is the delivery request's (origin, destination, container
+    type). Its persisted row is read-modified-written under a row lock and
+    the in-memory index takes the same state; if the caller then rolls back,
+    the next reload corrects the index. Returns the lane, or None when the
+    match has no price.
+
+    The lane_prices row is written through the match's own session, so
+    matches of the tracking server's models (app_simple) work too.
+    """
+    price = match_price(match)
+    if price is None:
+        return None
+    session = object_session(match) or db.session
+    delivery_request = match.delivery_request
+    lane = posting_lane(delivery_request)
+    row = _lane_row(session, lane, delivery_request)
+    stats = ensure_price_index(session).stats(row.count or 0, row.ewma, json.loads(row.recent_json or '[]'))
+    stats.add(price)
+    row.count, row.ewma, recent = stats.state()
+    row.recent_json = json.dumps(recent)
+    price_index.put(lane, stats.state())
+    _lane_labels[lane] = (row.origin, row.destination)
+    return lane
+
+
+def lane_quotes(origin=None, destination=None, container_type=None):
+    """``[(lane, origin, destination, LaneQuote)]`` from memory, optionally for one place pair or type"""
+    index = ensure_price_index()
+    lanes = list(index.lanes)
+    if origin is not None and destination is not None:
+        places = ensure_gazetteer()
+        origin_key = place_key(places.resolve_id(origin), origin)
+        destination_key = place_key(places.resolve_id(destination), destination)
+        lanes = [lane for lane in lanes if lane[0] == origin_key and lane[1] == destination_key]
+    if container_type is not None:
+        lanes = [lane for lane in lanes if lane[2] == container_type]
+    result = []
+    for lane in sorted(lanes, key=lambda lane: tuple(str(part) for part in lane)):
+        quote = index.quote(lane)
+        if quote is not None:
+            labels = _lane_labels.get(lane, (str(lane[0]), str(lane[1])))
+            result.append((lane, labels[0], labels[1], quote))
+    return result
+
+
+def backfill_lane_prices():
+    """Rebuild lane_prices from every accepted or completed match, oldest first.
+
+    One-off scan of the matches table for databases that had matches
+    before the price index existed; afterwards prices are recorded as
+    matches are accepted.
+    """
+    LanePrice.query.delete()
+    price_index.load({}, loaded_at=time.monotonic(), window=app.config.get('MATCH_PRICE_WINDOW', DEFAULT_WINDOW),
+                     alpha=app.config.get('MATCH_PRICE_EWMA_ALPHA', DEFAULT_ALPHA))
+    recorded = 0
+    for match in Match.query.filter(Match.status.in_(('accepted', 'completed'))).order_by(Match.id).all():
+        recorded += record_match_price(match) is not None
+    db.session.commit()
+    logging.info(f"Recorded prices of {recorded} matches")
+    return recorded
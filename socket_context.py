@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_MAX_AGE = 300  # 초
+
+# matches: match_id -> (매칭 기사 id, 기사 이름)
+TrackingContext = namedtuple('TrackingContext', ['user_id', 'role', 'full_name', 'driver_id', 'matches',
+                                                 'authorized_at'])
+
+
+class SocketContexts:
+    """Authorized tracking context of every Socket.IO connection, keyed by sid.
+
+    A connection is checked against the database once per match (on
+    join_tracking, or its first event for that match); later events are
+    authorized from the context alone. ``invalidate_match`` drops a match
+    from every context after its status or driver changes, and contexts
+    older than ``max_age`` are re-checked, which bounds how long a change
+    made by another process can go unnoticed.
+    """
+
+    def __init__(self, max_age=DEFAULT_MAX_AGE, clock=time.monotonic):
+        self.max_age = max_age
+        self.clock = clock
+        self._contexts = {}
+        self._sids_by_match = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def get(self, sid, user_id, match_id):
+        """Context of ``sid`` if it is authorized for ``match_id`` as ``user_id``, else None"""
+        with self._lock:
+            context = self._contexts.get(sid)
+            if context is None or context.user_id != user_id or match_id not in context.matches:
+                return None
+            if self.clock() - context.authorized_at > self.max_age:
+                self._drop(sid)
+                return None
+            return context
+
+    def allow(self, sid, user, driver_id, match_id, match_driver):
+        """Record that ``user`` may follow ``match_id``; ``match_driver`` is the match's (driver id, name)"""
+        with self._lock:
+            context = self._contexts.get(sid)
+            if context is None or context.user_id != user.id:
+                if context is not None:
+                    self._drop(sid)
+                context = TrackingContext(user.id, user.role, user.full_name, driver_id, {}, self.clock())
+            matches = dict(context.matches)
+            matches[match_id] = match_driver
+            context = context._replace(matches=matches)
+            self._contexts[sid] = context
+            self._sids_by_match.setdefault(match_id, set()).add(sid)
+            return context
+
+    def drop(self, sid):
+        """Forget a connection (on disconnect)"""
+        with self._lock:
+            self._drop(sid)
+
+    def _drop(self, sid):
+        context = self._contexts.pop(sid, None)
+        if context is None:
+            return
+        for match_id in context.matches:
+            sids = self._sids_by_match.get(match_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._sids_by_match[match_id]
+
+    def invalidate_match(self, match_id):
+        """Make every connection re-check ``match_id`` on its next event"""
+        with self._lock:
+            for sid in self._sids_by_match.pop(match_id, ()):
+                context = self._contexts.get(sid)
+                if context is not None:
+                    matches = {m: d for m, d in context.matches.items() if m != match_id}
+                    self._contexts[sid] = context._replace(matches=matches)
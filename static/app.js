@@ -757,22 +757,46 @@ async function autoMatch() {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-            }
+            },
+            body: JSON.stringify({})
         });
         
         const data = await response.json();
         
-        if (data.success) {
-            showAlert(data.message, 'success');
+        if (!data.success) {
+            showAlert(data.error || '자동 매칭에 실패했습니다.', 'danger');
+            return;
+        }
+        
+        showAlert(data.message, 'info');
+        const job = await waitForAutoMatchJob(data.status_url);
+        
+        if (job.status === 'completed') {
+            showAlert(`${job.stats.matches_created}개의 매칭이 생성되었습니다`, 'success');
             loadMatches();
         } else {
-            showAlert(data.error || '자동 매칭에 실패했습니다.', 'danger');
+            showAlert(job.error || '자동 매칭에 실패했습니다.', 'danger');
         }
     } catch (error) {
         showAlert('서버 오류가 발생했습니다.', 'danger');
     }
 }
 
+// Poll a background auto-match job until it finishes
+async function waitForAutoMatchJob(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+        if (job.error && !job.status) {
+            return {status: 'failed', error: job.error};
+        }
+        if (job.status === 'completed' || job.status === 'failed') {
+            return job;
+        }
+    }
+}
+
 // Update location (for drivers)
 function updateLocation() {
     if (navigator.geolocation) {
@@ -0,0 +1,79 @@
+import itertools
+import random
+import unittest
+
+from assignment import min_cost_assignment
+
+
+def brute_force(edges, unassigned_cost=None):
+    """(pair count, total cost) of the best assignment by exhaustive search"""
+    requests = list(edges)
+    best = (0, 0.0)
+    best_total = None
+    for choice in itertools.product(*[[None] + [t for t, _ in edges[r]] for r in requests]):
+        used = [t for t in choice if t is not None]
+        if len(used) != len(set(used)):
+            continue
+        cost = sum(dict(edges[r])[t] for r, t in zip(requests, choice) if t is not None)
+        if unassigned_cost is not None:
+            penalty = unassigned_cost * (len(requests) - len(used))
+            if best_total is None or cost + penalty < best_total - 1e-9:
+                best, best_total = (len(used), cost), cost + penalty
+        elif len(used) > best[0] or (len(used) == best[0] and cost < best[1]):
+            best = (len(used), cost)
+    return best
+
+
+class AssignmentTestCase(unittest.TestCase):
+
+    def test_prefers_globally_cheaper_assignment(self):
+        """Test that a greedy first pick is undone when it blocks a cheaper total"""
+        edges = {
+            1: [('a', 1.0), ('b', 2.0)],
+            2: [('a', 1.5)],
+        }
+        self.assertEqual(min_cost_assignment(edges), {1: 'b', 2: 'a'})
+
+    def test_each_posting_used_at_most_once(self):
+        """Test that no tolerance is assigned to two requests"""
+        edges = {r: [('a', float(r))] for r in range(5)}
+        assignment = min_cost_assignment(edges)
+        self.assertEqual(len(assignment), 1)
+        self.assertEqual(assignment, {0: 'a'})
+
+    def test_matches_brute_force_on_random_graphs(self):
+        """Test optimality against exhaustive search on small sparse graphs"""
+        rng = random.Random(7)
+        for _ in range(200):
+            tolerances = list(range(rng.randint(1, 5)))
+            edges = {}
+            for request_id in range(rng.randint(1, 5)):
+                picks = rng.sample(tolerances, rng.randint(0, len(tolerances)))
+                edges[request_id] = [(t, round(rng.uniform(0, 10), 2)) for t in picks]
+
+            assignment = min_cost_assignment(edges)
+            self.assertEqual(len(set(assignment.values())), len(assignment))
+            cost = sum(dict(edges[r])[t] for r, t in assignment.items())
+            count, best_cost = brute_force(edges)
+            self.assertEqual(len(assignment), count)
+            self.assertAlmostEqual(cost, best_cost, places=6)
+
+    def test_unassigned_cost_matches_brute_force(self):
+        """Test that a finite unassigned cost minimises cost plus penalty"""
+        rng = random.Random(11)
+        for _ in range(200):
+            tolerances = list(range(rng.randint(1, 4)))
+            edges = {}
+            for request_id in range(rng.randint(1, 5)):
+                picks = rng.sample(tolerances, rng.randint(0, len(tolerances)))
+                edges[request_id] = [(t, round(rng.uniform(0, 10), 2)) for t in picks]
+
+            assignment = min_cost_assignment(edges, unassigned_cost=4.0)
+            cost = sum(dict(edges[r])[t] for r, t in assignment.items())
+            penalty = 4.0 * (len(edges) - len(assignment))
+            count, best_cost = brute_force(edges, unassigned_cost=4.0)
+            self.assertAlmostEqual(cost + penalty, best_cost + 4.0 * (len(edges) - count), places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from db_upgrade import upgrade_database
+
+# 제약 없이 만든 예전 스키마
+OLD_SCHEMA = (
+    'CREATE TABLE tolerances (id INTEGER PRIMARY KEY, remaining_count INTEGER)',
+    'CREATE TABLE matches (id INTEGER PRIMARY KEY, tolerance_id INTEGER NOT NULL, '
+    'delivery_request_id INTEGER NOT NULL, status VARCHAR(20))',
+    'CREATE TABLE location_paths (id INTEGER PRIMARY KEY, match_id INTEGER NOT NULL)',
+)
+
+
+def make_db():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+
+    class Tolerance(db.Model):
+        __tablename__ = 'tolerances'
+        id = db.Column(db.Integer, primary_key=True)
+        remaining_count = db.Column(db.Integer)
+
+    class Match(db.Model):
+        __tablename__ = 'matches'
+        __table_args__ = (
+            db.UniqueConstraint('tolerance_id', 'delivery_request_id', name='uq_match_pair'),
+        )
+        id = db.Column(db.Integer, primary_key=True)
+        tolerance_id = db.Column(db.Integer, nullable=False)
+        delivery_request_id = db.Column(db.Integer, nullable=False)
+        status = db.Column(db.String(20))
+        container_count = db.Column(db.Integer)
+        tour_id = db.Column(db.String(32), index=True)
+
+    class LocationPath(db.Model):
+        __tablename__ = 'location_paths'
+        id = db.Column(db.Integer, primary_key=True)
+        match_id = db.Column(db.Integer, nullable=False)
+
+    return app, db
+
+
+class UpgradeDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app, self.db = make_db()
+        self.context = self.app.app_context()
+        self.context.push()
+        with self.db.engine.begin() as connection:
+            for ddl in OLD_SCHEMA:
+                connection.execute(text(ddl))
+            connection.execute(text("INSERT INTO tolerances VALUES (1, 0)"))
+            connection.execute(text("INSERT INTO matches VALUES (1, 1, 5, 'pending'), (2, 1, 5, 'accepted'), "
+                                    "(3, 1, 5, 'rejected'), (4, 1, 6, 'pending')"))
+            connection.execute(text("INSERT INTO location_paths VALUES (1, 1), (2, 3)"))
+
+    def tearDown(self):
+        self.context.pop()
+
+    def query(self, sql):
+        with self.db.engine.connect() as connection:
+            return connection.execute(text(sql)).fetchall()
+
+    def test_duplicates_are_removed_before_the_unique_index(self):
+        """Test that one match per pair survives, its paths follow it and duplicates are then refused"""
+        upgrade_database(self.db)
+
+        self.assertEqual(self.query('SELECT id, status FROM matches ORDER BY id'), [(2, 'accepted'), (4, 'pending')])
+        self.assertEqual(self.query('SELECT match_id FROM location_paths'), [(2,), (2,)])
+        with self.assertRaises(IntegrityError):
+            with self.db.engine.begin() as connection:
+                connection.execute(text("INSERT INTO matches (tolerance_id, delivery_request_id, status) "
+                                        "VALUES (1, 5, 'pending')"))
+
+    def test_upgrade_adds_columns_and_indexes_once(self):
+        """Test that a second upgrade finds nothing left to add"""
+        upgrade_database(self.db)
+        names = {row[1] for row in self.query("PRAGMA index_list('matches')")}
+        self.assertTrue({'uq_match_pair', 'ix_matches_tour_id'} <= names)
+
+        upgrade_database(self.db)
+        self.assertEqual(len(self.query("PRAGMA index_list('matches')")), len(names))
+
+
+if __name__ == '__main__':
+    unittest.main()
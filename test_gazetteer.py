@@ -0,0 +1,40 @@
+import unittest
+
+from gazetteer import PlaceEntry, normalize_name, seeded_gazetteer
+
+
+class GazetteerTestCase(unittest.TestCase):
+
+    def test_normalize_ignores_case_spacing_and_punctuation(self):
+        """Test that spelling variants share one normalized key"""
+        self.assertEqual(normalize_name(' Laem-Chabang  PORT '), normalize_name('laem chabang port'))
+        self.assertEqual(normalize_name('부산 신항'), normalize_name('부산신항'))
+
+    def test_aliases_and_suffixes_resolve_to_canonical_place(self):
+        """Test that English names, aliases and '항' variants find the same place"""
+        book = seeded_gazetteer()
+        expected = book.resolve('람차방 항구')
+
+        for name in ('람차방항', 'Laem Chabang', 'LCB', '람차방'):
+            self.assertEqual(book.resolve(name), expected)
+        self.assertEqual(book.resolve('인천 항').name, '인천 항구')
+
+    def test_fuzzy_match_and_unknown_names(self):
+        """Test that a near-duplicate spelling resolves and an unrelated name does not"""
+        book = seeded_gazetteer()
+
+        self.assertEqual(book.resolve('Laem Chabnag Port').name, '람차방 항구')
+        self.assertIsNone(book.resolve('서울 물류센터'))
+        self.assertIsNone(book.resolve(''))
+
+    def test_add_makes_place_resolvable(self):
+        """Test that a newly added place is found without a reload"""
+        book = seeded_gazetteer()
+        self.assertIsNone(book.resolve('Bang Pakong ICD'))
+
+        book.add(PlaceEntry(99, '방파꽁 ICD', 13.5, 100.99), ['Bang Pakong ICD'])
+        self.assertEqual(book.resolve_id('Bang Pakong ICD'), 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
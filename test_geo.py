@@ -0,0 +1,61 @@
+import random
+import unittest
+
+from geo import DriverGrid, haversine_km
+
+
+class DriverGridTestCase(unittest.TestCase):
+
+    def test_haversine_known_distance(self):
+        """Test the Laem Chabang to Bangkok distance is about 86 km"""
+        self.assertAlmostEqual(haversine_km(13.0833, 100.8833, 13.7563, 100.5018), 85.6, delta=1.0)
+
+    def test_nearest_matches_brute_force(self):
+        """Test that ring search returns the same k nearest as a full scan"""
+        rng = random.Random(3)
+        points = {i: (rng.uniform(12.0, 14.5), rng.uniform(99.5, 102.0)) for i in range(500)}
+        grid = DriverGrid(cell_deg=0.05)
+        grid.load((i, lat, lng) for i, (lat, lng) in points.items())
+
+        for _ in range(50):
+            lat, lng = rng.uniform(11.5, 15.0), rng.uniform(99.0, 102.5)
+            expected = sorted((haversine_km(lat, lng, *p), i) for i, p in points.items())[:5]
+            actual = grid.nearest(lat, lng, k=5)
+            self.assertEqual([i for _, i in actual], [i for _, i in expected])
+
+    def test_update_moves_and_discard_removes(self):
+        """Test that a moved driver is found at its new cell and a discarded one is gone"""
+        grid = DriverGrid()
+        grid.load([(1, 13.08, 100.88), (2, 35.07, 128.81)])
+
+        grid.update(2, 13.10, 100.90)
+        self.assertEqual([i for _, i in grid.nearest(13.08, 100.88, k=2)], [1, 2])
+
+        grid.discard(1)
+        self.assertEqual([i for _, i in grid.nearest(13.09, 100.89, k=2)], [2])
+        self.assertEqual(len(grid), 1)
+
+    def test_max_km_limits_results(self):
+        """Test that drivers beyond max_km are not returned"""
+        grid = DriverGrid()
+        grid.load([(1, 13.08, 100.88), (2, 37.45, 126.59)])
+
+        self.assertEqual([i for _, i in grid.nearest(13.0, 100.9, k=2, max_km=50)], [1])
+
+    def test_nearest_after_edge_driver_leaves(self):
+        """Test that queries stay correct once the driver that set the grid bounds is gone"""
+        grid = DriverGrid()
+        grid.load([(1, 13.08, 100.88), (2, 37.45, 126.59)])
+        grid.discard(2)
+        grid.update(3, 13.20, 100.95)
+
+        self.assertEqual([i for _, i in grid.nearest(13.0, 100.9, k=3)], [1, 3])
+        grid.discard(1)
+        grid.discard(3)
+        self.assertEqual(grid.nearest(13.0, 100.9), [])
+        grid.update(4, 13.10, 100.90)
+        self.assertEqual([i for _, i in grid.nearest(37.0, 126.0)], [4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import threading
+import unittest
+
+from location_buffer import LocationBuffer
+
+
+class RecordingWriter:
+
+    def __init__(self, fail=0):
+        self.batches = []
+        self.fail = fail
+        self.written = threading.Event()
+
+    def __call__(self, points, positions):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('database is locked')
+        self.batches.append((list(points), dict(positions)))
+        self.written.set()
+
+
+class LocationBufferTestCase(unittest.TestCase):
+
+    def test_flush_batches_points_and_keeps_latest_position(self):
+        """Test that one flush writes every queued point and one position per driver"""
+        writer = RecordingWriter()
+        buffer = LocationBuffer(writer, flush_rows=100)
+        for i in range(5):
+            buffer.add(1, 7, 13.0 + i, 100.0, 'in_transit')
+        buffer.add(2, 8, 14.0, 101.0)
+
+        self.assertEqual([p['latitude'] for p in buffer.pending(1)], [13.0, 14.0, 15.0, 16.0, 17.0])
+        self.assertEqual(buffer.position(7), (17.0, 100.0))
+        self.assertEqual(buffer.flush(), 6)
+        points, positions = writer.batches[0]
+        self.assertEqual(len(points), 6)
+        self.assertEqual(positions, {7: (17.0, 100.0), 8: (14.0, 101.0)})
+        self.assertEqual((len(buffer), buffer.pending(1), buffer.flush()), (0, [], 0))
+
+    def test_failed_write_is_retried_before_newer_points(self):
+        """Test that a failed batch is queued again in order, bounded by max_pending"""
+        writer = RecordingWriter(fail=1)
+        buffer = LocationBuffer(writer, max_pending=3)
+        buffer.add(1, 7, 1.0, 1.0)
+        buffer.add(1, 7, 2.0, 2.0)
+        self.assertEqual(buffer.flush(), 0)
+        buffer.add(1, 7, 3.0, 3.0)
+        buffer.add(1, 7, 4.0, 4.0)
+
+        self.assertEqual(buffer.dropped, 0)
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual([p['latitude'] for p in writer.batches[0][0]], [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(writer.batches[0][1], {7: (4.0, 4.0)})
+
+        writer.fail = 1
+        for i in range(4):
+            buffer.add(1, 7, float(i), 0.0)
+        buffer.flush()
+        buffer.add(1, 7, 9.0, 0.0)
+        self.assertEqual([p['latitude'] for p in buffer.pending(1)], [1.0, 2.0, 3.0, 9.0])
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_background_flush_on_row_count_and_stop(self):
+        """Test that reaching flush_rows wakes the flusher and stop writes the rest"""
+        writer = RecordingWriter()
+        buffer = LocationBuffer(writer, flush_rows=3, flush_interval=60).start()
+        for i in range(3):
+            buffer.add(1, 7, float(i), 0.0)
+        self.assertTrue(writer.written.wait(5))
+        buffer.add(1, 7, 9.0, 0.0)
+
+        self.assertEqual(buffer.stop(), 1)
+        self.assertEqual([len(points) for points, _ in writer.batches], [3, 1])
+
+    def test_points_being_written_stay_pending(self):
+        """Test that a batch is still returned by pending and position until the slow writer returns"""
+        started, release = threading.Event(), threading.Event()
+
+        def slow_writer(points, positions):
+            started.set()
+            release.wait(5)
+
+        buffer = LocationBuffer(slow_writer)
+        buffer.add(1, 7, 13.0, 100.0)
+        flusher = threading.Thread(target=buffer.flush)
+        flusher.start()
+        self.assertTrue(started.wait(5))
+        buffer.add(1, 7, 14.0, 100.0)
+
+        self.assertEqual([p['latitude'] for p in buffer.pending(1)], [13.0, 14.0])
+        self.assertEqual(buffer.position(7), (14.0, 100.0))
+        release.set()
+        flusher.join(5)
+        self.assertEqual([p['latitude'] for p in buffer.pending(1)], [14.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
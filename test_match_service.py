@@ -0,0 +1,420 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+# app 을 가져오기 전에 임시 DB 를 지정한다 (pytest 에서는 conftest.py 가 먼저 지정한다)
+TEST_DATABASE_URL = os.environ.setdefault(
+    'TEST_DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'match_service.db'))
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+from app import app, db
+from models import Carrier, DeliveryRequest, LocationPath, Match, MatchJob, MatchLock, Tolerance, User
+import main
+import match_jobs
+import match_service
+import path_service
+from path_simplify import PathCache
+from tours import Tour
+
+T0 = datetime(2026, 11, 2, 9, 0)
+
+
+class MatchServiceTestCase(unittest.TestCase):
+    """Tests against a throwaway SQLite database through the real models"""
+
+    config = {}
+
+    @classmethod
+    def setUpClass(cls):
+        # 설정값은 다른 테스트가 바꿀 수 있으므로 실제 엔진의 URL 을 확인한다
+        with app.app_context():
+            url = db.engine.url.render_as_string(hide_password=False)
+        if url != TEST_DATABASE_URL:
+            raise unittest.SkipTest('app was imported with another database')
+
+    def setUp(self):
+        self.saved_config = {key: app.config[key] for key in self.config if key in app.config}
+        app.config.update(self.config)
+        self.context = app.app_context()
+        self.context.push()
+        self.addCleanup(self.cleanup)
+        db.drop_all()
+        db.create_all()
+        user = User(username='carrier', email='carrier@example.com', password_hash='x', role='carrier',
+                    full_name='운송사')
+        db.session.add(user)
+        db.session.flush()
+        self.carrier = Carrier(user_id=user.id, company_name='테스트 운송', business_license='123',
+                               contact_person='담당자', phone='010', email='carrier@example.com')
+        db.session.add(self.carrier)
+        db.session.commit()
+        match_service.open_book.load([], [], loaded_at=None)
+        match_service.lane_book.loaded_at = None
+
+    def cleanup(self):
+        db.session.remove()
+        self.context.pop()
+        for key in self.config:
+            app.config.pop(key, None)
+        app.config.update(self.saved_config)
+
+    def tolerance(self, departure=T0, **fields):
+        values = dict(carrier_id=self.carrier.id, origin='람차방', destination='방콕', departure_time=departure,
+                      arrival_time=departure + timedelta(hours=6), container_type='40ft', container_count=1,
+                      price=100000)
+        values.update(fields)
+        tolerance = Tolerance(**values)
+        db.session.add(tolerance)
+        db.session.commit()
+        return tolerance
+
+    def request(self, pickup=T0, **fields):
+        values = dict(carrier_id=self.carrier.id, origin='람차방', destination='방콕', pickup_time=pickup,
+                      delivery_time=pickup + timedelta(hours=8), container_type='40ft', container_count=1,
+                      budget=100000)
+        values.update(fields)
+        delivery_request = DeliveryRequest(**values)
+        db.session.add(delivery_request)
+        db.session.commit()
+        return delivery_request
+
+    def pairs(self):
+        return sorted((m.tolerance_id, m.delivery_request_id) for m in Match.query.all())
+
+
+class IncrementalMatchTestCase(MatchServiceTestCase):
+
+    config = {'AUTO_MATCH_MODE': 'all', 'AUTO_MATCH_ON_POST': True}
+
+    def test_new_request_sees_tolerance_missing_from_this_workers_book(self):
+        """Test that a POST matches postings made since this worker loaded its book"""
+        match_service.ensure_open_book()
+        tolerance = self.tolerance()  # 다른 워커가 올린 여유 운송
+        self.tolerance(departure=T0 + timedelta(days=3))  # 시간 창 밖
+
+        delivery_request = self.request()
+        self.assertEqual(match_service.match_new_request(delivery_request), 1)
+        self.assertEqual(self.pairs(), [(tolerance.id, delivery_request.id)])
+
+    def test_posting_does_not_reload_the_open_book(self):
+        """Test that a POST neither loads a missing book nor reloads a stale one"""
+        tolerance = self.tolerance()
+        self.assertEqual(match_service.match_new_request(self.request()), 1)
+        self.assertIsNone(match_service.open_book.loaded_at)
+
+        match_service.ensure_open_book()
+        match_service.open_book.loaded_at -= 3600
+        loaded_at = match_service.open_book.loaded_at
+        delivery_request = self.request()
+        self.assertEqual(match_service.match_new_request(delivery_request), 1)
+        self.assertEqual(match_service.open_book.loaded_at, loaded_at)
+        self.assertIn(delivery_request.id, match_service.open_book.requests)
+
+    def test_assignment_mode_proposes_one_match_per_posting(self):
+        """Test that incremental matching in assignment mode writes one match per posting"""
+        app.config['AUTO_MATCH_MODE'] = 'assignment'
+        tolerances = [self.tolerance(departure=T0 + timedelta(minutes=10 * i)) for i in range(3)]
+
+        first = self.request()
+        self.assertEqual(match_service.match_new_request(first), 1)
+        second = self.request()
+        self.assertEqual(match_service.match_new_request(second), 1)
+
+        pairs = self.pairs()
+        self.assertEqual(sorted(r for _, r in pairs), [first.id, second.id])
+        self.assertEqual(len({t for t, _ in pairs}), 2)
+        self.assertTrue({t for t, _ in pairs} <= {t.id for t in tolerances})
+
+
+
+class ClaimTestCase(MatchServiceTestCase):
+    """Two runs that loaded the same open book and write one after the other"""
+
+    def snapshot(self):
+        tolerances, requests = match_service.load_open_book()
+        return {t.id: t for t in tolerances}, {r.id: r for r in requests}
+
+    def test_second_run_loses_the_request(self):
+        """Test that a request claimed by one run is dropped from an overlapping run"""
+        first, second = self.tolerance(), self.tolerance()
+        delivery_request = self.request()
+        tolerances, requests = self.snapshot()
+
+        won = match_service.write_proposals([(tolerances[first.id], requests[delivery_request.id], None)],
+                                            claim=True)
+        lost = match_service.write_proposals([(tolerances[second.id], requests[delivery_request.id], None)],
+                                             claim=True)
+        self.assertEqual((won, lost), (1, 0))
+        self.assertEqual(self.pairs(), [(first.id, delivery_request.id)])
+
+    def test_reserved_slots_are_not_overbooked(self):
+        """Test that two runs cannot reserve more slots of a tolerance than it has"""
+        tolerance = self.tolerance(container_count=3, remaining_count=3)
+        first, second = self.request(container_count=2), self.request(container_count=2)
+        tolerances, requests = self.snapshot()
+
+        won = match_service.write_proposals([(tolerances[tolerance.id], requests[first.id], 2)], claim=True)
+        lost = match_service.write_proposals([(tolerances[tolerance.id], requests[second.id], 2)], claim=True)
+        self.assertEqual((won, lost), (1, 0))
+        self.assertEqual(self.pairs(), [(tolerance.id, first.id)])
+        self.assertEqual(db.session.get(Tolerance, tolerance.id).remaining_count, 1)
+
+    def test_tour_losing_a_leg_is_dropped_whole(self):
+        """Test that a tour is not written leg by leg when another run took one of its requests"""
+        empty_run = self.tolerance(is_empty_run=True)
+        other = self.tolerance()
+        legs = [self.request(), self.request(pickup=T0 + timedelta(hours=10))]
+        tolerances, requests = self.snapshot()
+        tour = Tour(tolerances[empty_run.id], [requests[r.id] for r in legs], 0.0, 0.0, 0.0, 0.0)
+
+        self.assertEqual(match_service.write_proposals([(tolerances[other.id], requests[legs[1].id], None)],
+                                                       claim=True), 1)
+        rows, proposals = match_service.tour_rows([tour])
+        self.assertEqual(match_service.write_proposals(proposals, rows, claim=True), 0)
+
+        self.assertEqual(self.pairs(), [(other.id, legs[1].id)])
+        self.assertEqual(db.session.get(Tolerance, empty_run.id).version_id, tolerances[empty_run.id].version_id)
+
+
+class DryRunTestCase(MatchServiceTestCase):
+
+    def test_consolidation_dry_run_keeps_valid_pending_proposals(self):
+        """Test that a dry run re-plans with the slots of pending proposals given back"""
+        tolerance = self.tolerance(container_count=3, remaining_count=1)
+        proposed = self.request(container_count=2)
+        self.request(container_count=1)
+        db.session.add(Match(tolerance_id=tolerance.id, delivery_request_id=proposed.id, container_count=2,
+                             status='pending'))
+        db.session.commit()
+
+        report = match_service.simulate_auto_match('consolidation')
+        self.assertEqual(report['diff']['removed'], 0)
+        self.assertEqual(report['matches_proposed'], 2)
+
+    def test_dry_run_limit_must_be_a_count(self):
+        """Test that the dry-run route refuses a limit that is not a non-negative integer"""
+        admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin', full_name='관리자')
+        db.session.add(admin)
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['token'] = main.generate_token(admin.id, 'admin')
+
+        for limit in (-1, '10', 2.5):
+            response = client.post('/api/auto-match', json={'dry_run': True, 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+        response = client.post('/api/auto-match', json={'dry_run': True, 'limit': 0})
+        self.assertEqual(response.status_code, 200, response.get_json())
+
+
+class RouteTestCase(MatchServiceTestCase):
+    """Requests to main.py routes as the test carrier"""
+
+    def client(self):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['token'] = main.generate_token(self.carrier.user_id, 'carrier')
+        return client
+
+
+class RejectMatchTestCase(RouteTestCase):
+
+    def test_rejecting_one_leg_rejects_the_tour(self):
+        """Test that rejecting a tour leg rejects every leg and reopens all its postings"""
+        tolerance = self.tolerance(is_empty_run=True)
+        legs = [self.request(), self.request(pickup=T0 + timedelta(hours=10))]
+        matches = [Match(tolerance_id=tolerance.id, delivery_request_id=r.id, tour_id='tour', tour_seq=seq,
+                         status='pending') for seq, r in enumerate(legs, start=1)]
+        db.session.add_all(matches)
+        for delivery_request in legs:
+            delivery_request.status = 'matched'
+        db.session.commit()
+
+        response = self.client().post(f'/api/matches/{matches[1].id}/reject', json={})
+        self.assertEqual(response.status_code, 200)
+
+        db.session.expire_all()
+        self.assertEqual([m.status for m in matches], ['rejected', 'rejected'])
+        self.assertEqual([r.status for r in legs], ['pending', 'pending'])
+        self.assertEqual(tolerance.status, 'available')
+
+    def test_tour_reject_leaves_legs_already_rejected_alone(self):
+        """Test that a tour reject does not reopen a request matched elsewhere after its leg was rejected"""
+        tolerance = self.tolerance(is_empty_run=True)
+        other = self.tolerance()
+        legs = [self.request(), self.request(pickup=T0 + timedelta(hours=10), status='matched')]
+        matches = [Match(tolerance_id=tolerance.id, delivery_request_id=legs[0].id, tour_id='tour', tour_seq=1,
+                         status='pending'),
+                   Match(tolerance_id=tolerance.id, delivery_request_id=legs[1].id, tour_id='tour', tour_seq=2,
+                         status='rejected'),
+                   Match(tolerance_id=other.id, delivery_request_id=legs[1].id, status='accepted')]
+        db.session.add_all(matches)
+        db.session.commit()
+
+        response = self.client().post(f'/api/matches/{matches[0].id}/reject', json={})
+        self.assertEqual(response.get_json()['rejected'], [matches[0].id])
+        db.session.expire_all()
+        self.assertEqual([r.status for r in legs], ['pending', 'matched'])
+        self.assertEqual(matches[2].status, 'accepted')
+
+    def test_rejecting_accepted_consolidation_releases_slots(self):
+        """Test that an accepted consolidated match gives its slots back when rejected"""
+        tolerance = self.tolerance(container_count=3, remaining_count=1, status='matched')
+        delivery_request = self.request(container_count=2, status='matched')
+        match = Match(tolerance_id=tolerance.id, delivery_request_id=delivery_request.id, container_count=2,
+                      status='accepted')
+        db.session.add(match)
+        db.session.commit()
+
+        response = self.client().post(f'/api/matches/{match.id}/reject', json={})
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertEqual((tolerance.status, tolerance.remaining_count), ('available', 3))
+
+        # 이미 거절된 매칭을 다시 거절해도 슬롯이 두 번 돌아오지 않는다
+        self.client().post(f'/api/matches/{match.id}/reject', json={})
+        db.session.expire_all()
+        self.assertEqual(tolerance.remaining_count, 3)
+
+    def test_container_count_cannot_drop_below_reserved_slots(self):
+        """Test that a tolerance edit may not shrink below the slots consolidation reserved"""
+        tolerance = self.tolerance(container_count=3, remaining_count=1)
+
+        response = self.client().put('/api/tolerances', json={'id': tolerance.id, 'container_count': 1})
+        self.assertEqual(response.status_code, 409)
+        response = self.client().put('/api/tolerances', json={'id': tolerance.id, 'container_count': 2})
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertEqual((tolerance.container_count, tolerance.remaining_count), (2, 0))
+
+
+class LocationPathTestCase(RouteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        path_service.path_cache = PathCache()
+        tolerance, delivery_request = self.tolerance(), self.request()
+        self.match = Match(tolerance_id=tolerance.id, delivery_request_id=delivery_request.id, status='accepted')
+        db.session.add(self.match)
+        db.session.flush()
+        # 거의 직선으로 달리는 200개 위치 (10m 이내로 흔들림)
+        db.session.add_all(LocationPath(match_id=self.match.id, latitude=13.0 + i * 0.001 + (i % 2) * 0.00005,
+                                        longitude=100.9, timestamp=T0 + timedelta(seconds=10 * i))
+                           for i in range(200))
+        db.session.commit()
+
+    def test_path_is_simplified_for_level_and_zoom(self):
+        """Test that /api/location/path serves every point by default and fewer at a level or zoom"""
+        client = self.client()
+        raw = client.get(f'/api/location/path/{self.match.id}').get_json()
+        self.assertEqual(len(raw), 200)
+
+        coarse = client.get(f'/api/location/path/{self.match.id}?level=3').get_json()
+        self.assertLess(len(coarse), 10)
+        self.assertEqual((coarse[0], coarse[-1]), (raw[0], raw[-1]))
+        zoomed_out = client.get(f'/api/location/path/{self.match.id}?zoom=8').get_json()
+        self.assertEqual(zoomed_out, coarse)
+
+        self.assertEqual(client.get(f'/api/location/path/{self.match.id}?level=-1').status_code, 400)
+
+    def test_cached_path_catches_up_with_new_points(self):
+        """Test that points stored after the path was cached are added on the next read"""
+        client = self.client()
+        client.get(f'/api/location/path/{self.match.id}?level=1')
+        db.session.add(LocationPath(match_id=self.match.id, latitude=14.0, longitude=101.5,
+                                    timestamp=T0 + timedelta(hours=1)))
+        db.session.commit()
+
+        fine = client.get(f'/api/location/path/{self.match.id}?level=1').get_json()
+        self.assertEqual((fine[-1]['latitude'], fine[-1]['longitude']), (14.0, 101.5))
+
+
+class MatchJobTestCase(MatchServiceTestCase):
+
+    config = {'MATCH_LOCK_TTL': 1800}
+
+    def job(self, partition='all'):
+        job = MatchJob(id=f'job-{MatchJob.query.count()}', mode='all', partition=partition)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def test_all_partition_conflicts_with_every_other(self):
+        """Test that a partition lock keeps out the same partition and 'all', but not other partitions"""
+        first = self.job('20ft')
+        match_jobs.acquire_lock('20ft', first)
+
+        with self.assertRaises(match_jobs.MatchLockedError) as raised:
+            match_jobs.acquire_lock('20ft', self.job('20ft'))
+        self.assertEqual(raised.exception.job_id, first)
+        with self.assertRaises(match_jobs.MatchLockedError):
+            match_jobs.acquire_lock('all', self.job())
+        match_jobs.acquire_lock('reefer', self.job('reefer'))
+        self.assertEqual(sorted(lock.partition for lock in MatchLock.query), ['20ft', 'reefer'])
+
+        match_jobs.release_lock('20ft', first)
+        with self.assertRaises(match_jobs.MatchLockedError):
+            match_jobs.acquire_lock('all', self.job())
+
+    def test_stale_lock_is_cleared(self):
+        """Test that a lock older than MATCH_LOCK_TTL no longer blocks the partition"""
+        stale = self.job()
+        match_jobs.acquire_lock('all', stale)
+        MatchLock.query.get('all').acquired_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+
+        fresh = self.job()
+        match_jobs.acquire_lock('all', fresh)
+        self.assertEqual(MatchLock.query.get('all').job_id, fresh)
+
+    def test_inline_job_runs_under_the_lock(self):
+        """Test that an inline run records a completed job and releases its lock"""
+        tolerance = self.tolerance()
+        delivery_request = self.request()
+
+        job = match_jobs.run_auto_match_job('all')
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(match_jobs.job_payload(job)['stats']['matches_created'], 1)
+        self.assertEqual(self.pairs(), [(tolerance.id, delivery_request.id)])
+        self.assertEqual(MatchLock.query.count(), 0)
+
+    def test_inline_job_refused_while_partition_is_locked(self):
+        """Test that an inline run does not match while another job holds the lock"""
+        self.tolerance()
+        self.request()
+        match_jobs.acquire_lock('all', self.job())
+
+        with self.assertRaises(match_jobs.MatchLockedError):
+            match_jobs.run_auto_match_job('all')
+        self.assertEqual(self.pairs(), [])
+        self.assertEqual(MatchJob.query.count(), 1)
+
+    def test_queued_job_tells_clients_to_poll_without_a_message_queue(self):
+        """Test that a queued job answers with updates='poll' when progress cannot be pushed"""
+        app.config.pop('SOCKETIO_MESSAGE_QUEUE', None)
+        admin = User(username='admin', email='admin@example.com', password_hash='x', role='admin', full_name='관리자')
+        db.session.add(admin)
+        db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['token'] = main.generate_token(admin.id, 'admin')
+
+        response = client.post('/api/auto-match', json={})
+        self.assertEqual(response.status_code, 202, response.get_json())
+        body = response.get_json()
+        self.assertEqual(body['updates'], 'poll')
+        self.assertEqual(body['status_url'], f"/api/auto-match/jobs/{body['job_id']}")
+
+        # 작업이 끝날 때까지 폴링해서 테스트 DB 정리와 겹치지 않게 한다
+        for _ in range(100):
+            status = client.get(body['status_url']).get_json()['status']
+            if status in ('completed', 'failed'):
+                break
+            time.sleep(0.05)
+        self.assertEqual(status, 'completed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,370 @@
+import pickle
+import random
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from geo import haversine_km
+from matching import (ToleranceIndex, MatchRules, OpenBook, PlacePoints, candidate_pairs, pack_requests,
+                      consolidated_allocations, propose_matches, score_partition, split_partitions,
+                      candidate_score, top_candidates, CONTAINER_COMPATIBILITY, ContainerCompatibility,
+                      RequestIndex, partition_key, posting_lane)
+
+
+def make_tolerance(id, origin='람차방 항구', destination='부산 신항', container_type='40ft',
+                   departure_time=None, arrival_time=None, container_count=1, remaining_count=None, price=0,
+                   carrier_id=1):
+    return SimpleNamespace(
+        id=id,
+        carrier_id=carrier_id,
+        origin=origin,
+        destination=destination,
+        origin_place_id=None,
+        destination_place_id=None,
+        container_type=container_type,
+        departure_time=departure_time or datetime(2025, 7, 10, 9, 0),
+        arrival_time=arrival_time,
+        container_count=container_count,
+        remaining_count=remaining_count,
+        price=price
+    )
+
+
+def make_request(id, origin='람차방 항구', destination='부산 신항', container_type='40ft',
+                 pickup_time=None, delivery_time=None, container_count=1, budget=0):
+    return SimpleNamespace(
+        id=id,
+        origin=origin,
+        destination=destination,
+        origin_place_id=None,
+        destination_place_id=None,
+        container_type=container_type,
+        pickup_time=pickup_time or datetime(2025, 7, 10, 10, 0),
+        delivery_time=delivery_time,
+        container_count=container_count,
+        budget=budget
+    )
+
+
+class MatchingIndexTestCase(unittest.TestCase):
+
+    def test_candidates_probe_only_matching_lane_and_window(self):
+        """Test that a request only sees tolerances on the same lane inside its pickup window"""
+        index = ToleranceIndex([
+            make_tolerance(1),
+            make_tolerance(2, destination='인천 항구'),
+            make_tolerance(3, container_type='20ft'),
+            make_tolerance(4, departure_time=datetime(2025, 7, 11, 9, 0)),
+        ])
+
+        candidates = index.candidates(make_request(1))
+        self.assertEqual([t.id for t in candidates], [1])
+        self.assertEqual(len(index), 4)
+
+    def test_window_crosses_midnight(self):
+        """Test that a 23:30 departure matches a 00:15 pickup but not an 18:00 one"""
+        index = ToleranceIndex([make_tolerance(1, departure_time=datetime(2025, 7, 10, 23, 30))])
+
+        self.assertEqual(len(index.candidates(make_request(1, pickup_time=datetime(2025, 7, 11, 0, 15)))), 1)
+        self.assertEqual(index.candidates(make_request(2, pickup_time=datetime(2025, 7, 10, 18, 0))), [])
+
+    def test_arrival_must_meet_delivery_time(self):
+        """Test that a tolerance arriving after the requested delivery time is rejected"""
+        index = ToleranceIndex([make_tolerance(1, arrival_time=datetime(2025, 7, 10, 17, 0))])
+
+        self.assertEqual(len(index.candidates(make_request(1, delivery_time=datetime(2025, 7, 10, 18, 0)))), 1)
+        self.assertEqual(index.candidates(make_request(2, delivery_time=datetime(2025, 7, 10, 16, 0))), [])
+
+    def test_candidate_pairs_matches_nested_loop(self):
+        """Test that the indexed join returns the same pairs as the nested loop"""
+        base = datetime(2025, 7, 10, 6, 0)
+        rules = MatchRules.from_config({'MATCH_DEPARTURE_BEFORE_PICKUP_MINUTES': 90,
+                                        'MATCH_DEPARTURE_AFTER_PICKUP_MINUTES': 30})
+        tolerances = [make_tolerance(i, container_type=['20ft', '40ft'][i % 2],
+                                     departure_time=base + timedelta(minutes=70 * i),
+                                     arrival_time=base + timedelta(minutes=70 * i + 300))
+                      for i in range(40)]
+        requests = [make_request(i, container_type=['20ft', '40ft'][i % 3 % 2],
+                                 pickup_time=base + timedelta(minutes=50 * i),
+                                 delivery_time=base + timedelta(minutes=50 * i + 320))
+                    for i in range(40)]
+
+        expected = {(t.id, r.id) for t in tolerances for r in requests
+                    if t.origin == r.origin and t.destination == r.destination
+                    and r.container_type in CONTAINER_COMPATIBILITY[t.container_type]
+                    and r.pickup_time - timedelta(minutes=90) <= t.departure_time <= r.pickup_time + timedelta(minutes=30)
+                    and t.arrival_time <= r.delivery_time}
+        self.assertTrue(expected)
+        actual = {(t.id, r.id) for t, r in candidate_pairs(tolerances, requests, rules)}
+        self.assertEqual(actual, expected)
+
+
+class ContainerCompatibilityTestCase(unittest.TestCase):
+
+    def test_lookup_both_directions(self):
+        """Test that slot types and request types come from the precomputed table"""
+        compatibility = ContainerCompatibility()
+
+        self.assertEqual(compatibility.slot_types('20ft'), ('20ft', '40HC', '40ft'))
+        self.assertEqual(compatibility.request_types('40HC'), ('20ft', '40HC', '40ft'))
+        self.assertEqual(compatibility.request_types('53ft'), ('53ft',))
+        self.assertEqual(compatibility.group('40HC'), compatibility.group('20ft'))
+        self.assertNotEqual(compatibility.group('45ft'), compatibility.group('20ft'))
+        # 자동 매칭 파티션은 그룹 단위로 잠그고 읽는다
+        self.assertEqual(compatibility.members('40ft'), ('20ft', '40HC', '40ft'))
+        self.assertEqual(compatibility.members('53ft'), ('53ft',))
+
+    def test_larger_slots_carry_smaller_containers(self):
+        """Test that a 40ft tolerance sees 20ft and 40ft requests but a 20ft one only 20ft"""
+        index = RequestIndex([
+            make_request(1, container_type='20ft'),
+            make_request(2, container_type='40ft'),
+            make_request(3, container_type='40HC'),
+        ])
+
+        self.assertEqual({r.id for r in index.candidates(make_tolerance(1, container_type='40ft'))}, {1, 2})
+        self.assertEqual({r.id for r in index.candidates(make_tolerance(2, container_type='20ft'))}, {1})
+        self.assertEqual(partition_key(make_request(1, container_type='20ft')),
+                         partition_key(make_tolerance(1, container_type='40ft')))
+
+    def test_consolidation_fits_two_20ft_per_40ft_slot(self):
+        """Test that three 20ft containers take two 40ft slots"""
+        tolerance = make_tolerance(1, container_type='40ft', container_count=2)
+        requests = [make_request(1, container_type='20ft', container_count=3),
+                    make_request(2, container_type='40ft', container_count=1)]
+
+        allocations = consolidated_allocations([tolerance], requests)
+        self.assertEqual([(r.id, count) for _, r, count in allocations], [(1, 2)])
+
+
+class PricePruningTestCase(unittest.TestCase):
+
+    def test_price_cut_matches_brute_force(self):
+        """Test that both query plans return exactly the in-window pairs within budget plus margin"""
+        rng = random.Random(15)
+        rules = MatchRules.from_config({'MATCH_PRICE_MARGIN': 0.1})
+        base = datetime(2025, 7, 10, 0, 0)
+        tolerances = [make_tolerance(i, price=0 if rng.random() < 0.05 else rng.randint(50, 400),
+                                     departure_time=base + timedelta(minutes=rng.randint(0, 2880)))
+                      for i in range(300)]
+        requests = [make_request(i, budget=0 if rng.random() < 0.05 else rng.randint(50, 400),
+                                 pickup_time=base + timedelta(minutes=rng.randint(0, 2880)))
+                    for i in range(300)]
+
+        def fits(t, r):
+            return (r.pickup_time - timedelta(hours=2) <= t.departure_time <= r.pickup_time + timedelta(hours=2)
+                    and (not t.price or not r.budget or t.price <= r.budget * 1.1))
+
+        tolerance_index = ToleranceIndex(tolerances, rules)
+        request_index = RequestIndex(requests, rules)
+        for r in requests:
+            self.assertEqual({t.id for t in tolerance_index.candidates(r)},
+                             {t.id for t in tolerances if fits(t, r)})
+        for t in tolerances:
+            self.assertEqual({r.id for r in request_index.candidates(t)},
+                             {r.id for r in requests if fits(t, r)})
+
+    def test_over_budget_tolerance_is_pruned_and_discard_keeps_price_list(self):
+        """Test that the default 20% margin admits 115 but not 130 for a budget of 100"""
+        index = ToleranceIndex([make_tolerance(1, price=115), make_tolerance(2, price=130),
+                                make_tolerance(3, price=90)])
+
+        self.assertEqual([t.id for t in index.candidates(make_request(1, budget=100))], [1, 3])
+        index.discard(3)
+        self.assertEqual([t.id for t in index.candidates(make_request(1, budget=100))], [1])
+        rules = MatchRules.from_config({'MATCH_PRICE_MARGIN': None})
+        self.assertEqual(len(ToleranceIndex([make_tolerance(2, price=130)], rules)
+                             .candidates(make_request(1, budget=100))), 1)
+
+
+class RadiusMatchingTestCase(unittest.TestCase):
+
+    def test_radius_join_matches_brute_force(self):
+        """Test that grid-bucketed radius matching returns the same pairs as comparing every pair"""
+        rng = random.Random(5)
+        points = {f'P{i}': (rng.uniform(12.5, 14.0), rng.uniform(100.3, 101.5)) for i in range(30)}
+        points.update({f'K{i}': (rng.uniform(34.8, 37.6), rng.uniform(126.5, 129.2)) for i in range(10)})
+        thai, korea = [n for n in points if n[0] == 'P'], [n for n in points if n[0] == 'K']
+
+        def locate(place_id, name):
+            return points.get(name)
+
+        rules = MatchRules.from_config({'MATCH_ORIGIN_RADIUS_KM': 25, 'MATCH_DESTINATION_RADIUS_KM': 60})
+        base = datetime(2025, 7, 10, 6, 0)
+        tolerances = [make_tolerance(i, origin=rng.choice(thai), destination=rng.choice(korea),
+                                     departure_time=base + timedelta(minutes=rng.randint(0, 600)))
+                      for i in range(150)]
+        requests = [make_request(i, origin=rng.choice(thai), destination=rng.choice(korea),
+                                 pickup_time=base + timedelta(minutes=rng.randint(0, 600)))
+                    for i in range(150)]
+
+        expected = {(t.id, r.id) for t in tolerances for r in requests
+                    if haversine_km(*points[t.origin], *points[r.origin]) <= 25
+                    and haversine_km(*points[t.destination], *points[r.destination]) <= 60
+                    and abs(t.departure_time - r.pickup_time) <= timedelta(hours=2)}
+        self.assertTrue(expected)
+        actual = {(t.id, r.id) for t, r in candidate_pairs(tolerances, requests, rules, locate)}
+        self.assertEqual(actual, expected)
+
+    def test_unlocated_places_fall_back_to_same_name(self):
+        """Test that postings without coordinates still match on the normalized name"""
+        rules = MatchRules.from_config({'MATCH_ORIGIN_RADIUS_KM': 25})
+        index = ToleranceIndex([make_tolerance(1, origin='미등록 창고'), make_tolerance(2, origin='다른 창고')],
+                               rules, locate=lambda place_id, name: None)
+
+        self.assertEqual([t.id for t in index.candidates(make_request(1, origin='미등록창고'))], [1])
+
+
+class PartitionTestCase(unittest.TestCase):
+
+    def postings(self):
+        rng = random.Random(9)
+        origins = ['람차방 항구', '방콕 항구', '라용', '시라차']
+        destinations = ['부산 신항', '인천 항구']
+        base = datetime(2025, 7, 10, 6, 0)
+        tolerances = [make_tolerance(i, origin=rng.choice(origins), destination=rng.choice(destinations),
+                                     container_type=rng.choice(['20ft', '40ft']), container_count=rng.randint(1, 3),
+                                     departure_time=base + timedelta(minutes=rng.randint(0, 600)))
+                      for i in range(120)]
+        requests = [make_request(i, origin=rng.choice(origins), destination=rng.choice(destinations),
+                                 container_type=rng.choice(['20ft', '40ft']), container_count=rng.randint(1, 2),
+                                 pickup_time=base + timedelta(minutes=rng.randint(0, 600)))
+                    for i in range(120)]
+        matches = [(0, 0, 'rejected'), (3, 5, 'pending')]
+        return tolerances, requests, matches
+
+    def test_partitions_cover_postings_once(self):
+        """Test that every posting lands in exactly one partition"""
+        tolerances, requests, _ = self.postings()
+        partitions = split_partitions(tolerances, requests, count=3)
+
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual(sorted(t.id for part in partitions for t in part[0]), [t.id for t in tolerances])
+        self.assertEqual(sorted(r.id for part in partitions for r in part[1]), [r.id for r in requests])
+
+    def test_partitioned_proposals_equal_single_run(self):
+        """Test that scoring partitions separately gives the same proposals in every mode"""
+        tolerances, requests, matches = self.postings()
+        for mode in ('all', 'assignment', 'consolidation'):
+            expected = {(t.id, r.id, c) for t, r, c in propose_matches(mode, tolerances, requests, matches)}
+            actual = set()
+            for part_tolerances, part_requests in split_partitions(tolerances, requests, count=4):
+                actual.update(score_partition(mode, part_tolerances, part_requests, matches))
+            self.assertEqual(actual, expected, mode)
+
+    def test_place_points_snapshot_is_picklable(self):
+        """Test that the coordinate snapshot survives pickling for process workers"""
+        tolerances, _, _ = self.postings()
+        points = PlacePoints.snapshot(lambda place_id, name: (len(name), 0.0), tolerances)
+
+        restored = pickle.loads(pickle.dumps(points))
+        self.assertEqual(restored(None, '라 용'), (2, 0.0))
+
+
+class RankingTestCase(unittest.TestCase):
+
+    def test_top_candidates_equal_full_sort(self):
+        """Test that the bounded heap returns the k best of a full sort, minus skipped tolerances"""
+        rng = random.Random(13)
+        base = datetime(2025, 7, 10, 10, 0)
+        tolerances = [make_tolerance(i, price=rng.randint(80, 140), carrier_id=i % 4,
+                                     departure_time=base + timedelta(minutes=rng.randint(-120, 120)))
+                      for i in range(200)]
+        delivery_request = make_request(1, budget=100)
+        reliability = {0: 0.9, 1: 0.2}
+
+        expected = sorted((t for t in tolerances if t.id != 7),
+                          key=lambda t: (candidate_score(t, delivery_request, reliability=reliability)[0], t.id))[:5]
+        ranked = top_candidates(tolerances, delivery_request, 5, reliability=reliability, skip={7})
+        self.assertEqual([t.id for _, t, _ in ranked], [t.id for t in expected])
+
+    def test_score_prefers_cheaper_reliable_and_closer(self):
+        """Test that price over budget, poor history and distance all lower the rank"""
+        delivery_request = make_request(1, budget=100)
+        points = {'람차방 항구': (13.0833, 100.8833), '시라차': (13.1737, 100.9311), '부산 신항': (35.075, 128.817)}
+
+        def locate(place_id, name):
+            return points.get(name)
+
+        base, _ = candidate_score(make_tolerance(1, price=100), delivery_request, locate, {1: 0.9})
+        self.assertLess(base, candidate_score(make_tolerance(2, price=150), delivery_request, locate, {1: 0.9})[0])
+        self.assertLess(base, candidate_score(make_tolerance(3, price=100), delivery_request, locate, {1: 0.1})[0])
+        farther, components = candidate_score(make_tolerance(4, origin='시라차', price=100), delivery_request,
+                                               locate, {1: 0.9})
+        self.assertLess(base, farther)
+        self.assertGreater(components['distance_km'], 10)
+
+    def test_score_penalises_price_above_lane_history(self):
+        """Test that a tolerance priced above its lane's traded median ranks lower"""
+        # 20ft 요청을 40ft 슬롯에 싣는 경우에도 요청 레인의 기록과 비교한다
+        delivery_request = make_request(1, container_type='20ft', budget=0)
+        references = {posting_lane(delivery_request): 100, posting_lane(make_tolerance(1)): 150}
+
+        cheap, _ = candidate_score(make_tolerance(1, price=100), delivery_request, lane_price=references.get)
+        dear, components = candidate_score(make_tolerance(2, price=150), delivery_request,
+                                           lane_price=references.get)
+        self.assertLess(cheap, dear)
+        self.assertEqual((components['lane_price'], components['lane_price_gap']), (100, 0.5))
+
+    def test_lane_of_posting_without_place_columns(self):
+        """Test that a posting without place id attributes (app_simple models) is keyed by its names"""
+        posting = SimpleNamespace(origin='람차방 항구', destination='부산 신항', container_type='40ft')
+        self.assertEqual(posting_lane(posting), posting_lane(make_request(1)))
+
+
+class OpenBookTestCase(unittest.TestCase):
+
+    def test_new_postings_match_only_open_counterparts(self):
+        """Test that incremental adds return the opposite side's bucket"""
+        book = OpenBook()
+        book.load([make_tolerance(1), make_tolerance(2, destination='인천 항구')], [])
+
+        self.assertEqual([t.id for t in book.add_request(make_request(10))], [1])
+        self.assertEqual([r.id for r in book.add_tolerance(make_tolerance(3))], [10])
+
+    def test_discard_removes_posting_and_bumps_version(self):
+        """Test that closed postings stop matching"""
+        book = OpenBook()
+        book.load([make_tolerance(1)], [make_request(10)])
+        version = book.version
+
+        book.discard_tolerance(1)
+        book.discard_tolerance(1)
+        self.assertEqual(book.add_request(make_request(11)), [])
+        self.assertEqual(book.version, version + 2)
+
+
+class ConsolidationTestCase(unittest.TestCase):
+
+    def test_pack_fills_most_slots(self):
+        """Test that 2 + 3 is chosen over a single 4 for five free slots"""
+        requests = [make_request(1, container_count=4), make_request(2, container_count=2),
+                    make_request(3, container_count=3)]
+
+        packed = pack_requests(requests, 5)
+        self.assertEqual(sorted(r.id for r in packed), [2, 3])
+
+    def test_pack_breaks_ties_on_cost(self):
+        """Test that equally full packings prefer the cheaper requests"""
+        requests = [make_request(1, container_count=2), make_request(2, container_count=2)]
+
+        packed = pack_requests(requests, 2, cost=lambda r: {1: 5.0, 2: 1.0}[r.id])
+        self.assertEqual([r.id for r in packed], [2])
+
+    def test_allocations_respect_free_slots_and_allocate_once(self):
+        """Test that each request goes to one tolerance and no tolerance is overfilled"""
+        tolerances = [make_tolerance(1, container_count=4, remaining_count=3),
+                      make_tolerance(2, container_count=2, departure_time=datetime(2025, 7, 10, 10, 0))]
+        requests = [make_request(i, container_count=c) for i, c in [(10, 2), (11, 1), (12, 2), (13, 3)]]
+
+        allocations = consolidated_allocations(tolerances, requests, skip={(2, 12)})
+        used = {}
+        for tolerance, delivery_request, count in allocations:
+            used[tolerance.id] = used.get(tolerance.id, 0) + count
+        self.assertEqual(used, {1: 3, 2: 2})
+        self.assertEqual(len({r.id for _, r, _ in allocations}), len(allocations))
+        self.assertNotIn((2, 12), {(t.id, r.id) for t, r, _ in allocations})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import math
+import unittest
+from datetime import datetime, timedelta
+
+from matching import RequestPosting, TolerancePosting
+from orderbook import OrderBook
+
+BASE = datetime(2025, 7, 10, 9, 0)
+
+
+def make_tolerance(id, price, container_count=1, remaining_count=None, container_type='40ft', days=0):
+    departure = BASE + timedelta(days=days)
+    return TolerancePosting(id, 1, '람차방 항구', '방콕', None, None, departure, departure + timedelta(hours=4),
+                            container_type, container_count, remaining_count, price, False, 1)
+
+
+def make_request(id, budget, container_count=1, container_type='40ft', days=0):
+    pickup = BASE + timedelta(days=days, hours=1)
+    return RequestPosting(id, 2, '람차방 항구', '방콕', None, None, pickup, pickup + timedelta(hours=8),
+                          container_type, container_count, budget, 1)
+
+
+class OrderBookTestCase(unittest.TestCase):
+
+    def test_bid_takes_best_price_then_oldest_ask(self):
+        """Test that a new request fills at the cheapest ask, the earliest one within a price"""
+        book = OrderBook()
+        book.load([make_tolerance(1, 300), make_tolerance(2, 200), make_tolerance(3, 200)], [])
+
+        fills = book.add_request(make_request(10, 250))
+        self.assertEqual([(f.tolerance.id, f.slots, f.price) for f in fills], [(2, 1, 200)])
+
+        fills = book.add_request(make_request(11, 250))
+        self.assertEqual([f.tolerance.id for f in fills], [3])
+        # 예산보다 비싼 호가만 남으면 체결되지 않고 대기
+        self.assertEqual(book.add_request(make_request(12, 250)), [])
+        quote, = book.snapshot()
+        self.assertEqual((quote.best_bid, quote.best_ask, quote.bid_orders, quote.ask_orders), (250, 300, 1, 1))
+
+    def test_ask_fills_several_bids_and_rests_the_rest(self):
+        """Test that a tolerance fills bids at their budgets while it has slots, skipping ones too large"""
+        book = OrderBook()
+        book.load([], [make_request(1, 500, container_count=3), make_request(2, 400), make_request(3, None),
+                       make_request(4, 100)])
+
+        fills = book.add_tolerance(make_tolerance(10, 150, container_count=3))
+        # 예산 없는 요청이 최우선, 호가 가격으로 체결
+        self.assertEqual([(f.delivery_request.id, f.price) for f in fills], [(3, 150), (2, 400)])
+        quote, = book.snapshot()
+        self.assertEqual((quote.ask_quantity, quote.best_ask), (1, 150))
+        self.assertEqual((quote.best_bid, quote.bid_orders), (500, 2))
+
+    def test_lanes_split_by_day_and_container_type(self):
+        """Test that orders on another day or container type never cross"""
+        book = OrderBook()
+        book.load([make_tolerance(1, 100, days=1), make_tolerance(2, 100, container_type='20ft')], [])
+
+        self.assertEqual(book.add_request(make_request(10, 500)), [])
+        self.assertEqual(len(book.snapshot()), 3)
+
+    def test_cancel_and_rest_keep_the_heaps_consistent(self):
+        """Test that lazily deleted orders are skipped and an edit keeps time priority unless repriced"""
+        book = OrderBook()
+        book.load([make_tolerance(i, 100) for i in range(1, 50)], [])
+        for i in range(1, 48):
+            book.discard_tolerance(i)
+        quote, = book.snapshot()
+        self.assertEqual((quote.ask_orders, quote.ask_quantity), (2, 2))
+
+        book.rest_tolerance(make_tolerance(48, 100))
+        self.assertEqual(book.add_request(make_request(10, math.inf))[0].tolerance.id, 48)
+        book.load([make_tolerance(1, 100), make_tolerance(2, 100)], [])
+        book.rest_tolerance(make_tolerance(1, 90))
+        book.rest_tolerance(make_tolerance(1, 100))
+        self.assertEqual(book.add_request(make_request(11, 100))[0].tolerance.id, 2)
+
+        book.discard_tolerance(1)
+        self.assertEqual(book.snapshot(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
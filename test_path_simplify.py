@@ -0,0 +1,100 @@
+import math
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from path_simplify import (PathCache, PathLevels, StreamingSimplifier, choose_level, level_for_zoom, parse_path_detail,
+                           segment_distance_m)
+
+T0 = datetime(2026, 11, 1, 9, 0, 0)
+
+
+def point(latitude, longitude):
+    return {'latitude': latitude, 'longitude': longitude}
+
+
+def noisy_haul(n, seed=5):
+    """5초 간격 GPS 로 기록한 완만한 곡선 도로 (약 3m 오차)"""
+    rng = random.Random(seed)
+    points = []
+    for i in range(n):
+        t = i / n
+        latitude = 13.08 + 0.6 * t + 0.02 * math.sin(6 * t)
+        longitude = 100.88 + 0.4 * t * t
+        points.append(point(latitude + rng.gauss(0, 0.00003), longitude + rng.gauss(0, 0.00003)))
+    return points
+
+
+def max_deviation(points, simplified):
+    """단순화 경로의 각 구간과 그 사이 원본 위치의 최대 거리"""
+    index = {id(p): i for i, p in enumerate(points)}
+    ends = [index[id(p)] for p in simplified]
+    return max(segment_distance_m(points[i], points[a], points[b])
+               for a, b in zip(ends, ends[1:]) for i in range(a, b + 1))
+
+
+class StreamingSimplifierTestCase(unittest.TestCase):
+
+    def test_straight_line_keeps_endpoints_and_corners(self):
+        """Test that collinear points collapse and a turn sharper than the tolerance is kept"""
+        simplifier = StreamingSimplifier(10.0)
+        for i in range(11):
+            simplifier.add(point(13.0 + i * 0.001, 100.0))
+        for i in range(1, 11):
+            simplifier.add(point(13.01, 100.0 + i * 0.001))
+
+        self.assertEqual(simplifier.points(), [point(13.0, 100.0), point(13.01, 100.0), point(13.01, 100.01)])
+
+    def test_long_haul_shrinks_within_tolerance(self):
+        """Test that a 7,000 point haul shrinks at least 10x at every level and stays within each tolerance"""
+        raw = noisy_haul(7000)
+        paths = PathLevels()
+        for i, p in enumerate(raw):
+            paths.add(p, T0 + timedelta(seconds=5 * i))
+
+        for level, tolerance in enumerate((10.0, 40.0, 160.0), start=1):
+            simplified = paths.points(level)
+            self.assertGreaterEqual(len(raw) / len(simplified), 10)
+            self.assertLessEqual(max_deviation(raw, simplified), tolerance)
+            self.assertEqual((simplified[0], simplified[-1]), (raw[0], raw[-1]))
+        self.assertEqual(paths.raw_count, 7000)
+        self.assertFalse(paths.add(raw[0], T0))
+
+
+class PathCacheTestCase(unittest.TestCase):
+
+    def test_only_cached_paths_are_extended_and_least_recent_is_evicted(self):
+        """Test that new points extend cached paths and the cache keeps max_paths matches"""
+        cache = PathCache(max_paths=2)
+        cache.add_point(1, point(13.0, 100.0), T0)
+        self.assertIsNone(cache.get(1))
+
+        cache.put(1, PathLevels())
+        cache.put(2, PathLevels())
+        cache.add_point(1, point(13.0, 100.0), T0)
+        cache.get(1)
+        cache.put(3, PathLevels())
+        self.assertEqual((cache.get(1).raw_count, cache.get(2), len(cache)), (1, None, 2))
+
+    def test_zoom_picks_coarser_levels_further_out(self):
+        """Test that zooming out selects the same or a coarser level"""
+        levels = [level_for_zoom(zoom, 13.0) for zoom in range(20, 5, -1)]
+        self.assertEqual(levels, sorted(levels))
+        self.assertEqual((levels[0], levels[-1]), (0, 3))
+
+    def test_requested_detail_is_parsed_and_chosen(self):
+        """Test that an explicit level wins, a zoom needs the path, and no detail means every point"""
+        self.assertEqual(parse_path_detail('2', ''), (2, None))
+        self.assertRaises(ValueError, parse_path_detail, None, '31')
+
+        def no_path():
+            raise AssertionError('path loaded without a zoom')
+
+        self.assertEqual((choose_level(5, None, no_path), choose_level(None, None, no_path)), (3, 0))
+        paths = PathLevels()
+        paths.add({'latitude': 13.0, 'longitude': 100.9}, datetime(2026, 1, 1))
+        self.assertEqual(choose_level(None, 6, lambda: paths), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
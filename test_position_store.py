@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta
+
+from position_store import LocalPositionBackend, PositionStore, position_backend
+
+T0 = datetime(2026, 11, 1, 9, 0, 0)
+
+
+class RecordingWriter:
+
+    def __init__(self, fail=0):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, positions):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('database is locked')
+        self.batches.append(dict(positions))
+
+
+class PositionStoreTestCase(unittest.TestCase):
+
+    def test_speed_and_heading_are_derived_from_the_previous_position(self):
+        """Test that a missing speed or heading comes from the last position of the driver"""
+        store = PositionStore(RecordingWriter())
+        first = store.update(7, 13.0, 100.0, timestamp=T0)
+        self.assertEqual((first.speed, first.heading), (None, None))
+
+        # 북쪽으로 위도 0.01도 (약 1.11 km) 를 1분에
+        moved = store.update(7, 13.01, 100.0, timestamp=T0 + timedelta(minutes=1))
+        self.assertAlmostEqual(moved.speed, 66.7, places=1)
+        self.assertAlmostEqual(moved.heading, 0.0, places=3)
+
+        stopped = store.update(7, 13.01, 100.0, timestamp=T0 + timedelta(minutes=2))
+        self.assertEqual((stopped.speed, stopped.heading), (0.0, moved.heading))
+        sent = store.update(7, 13.02, 100.0, speed=50, heading=10, timestamp=T0 + timedelta(minutes=3))
+        self.assertEqual(store.get(7), sent)
+        self.assertEqual((sent.speed, sent.heading), (50, 10))
+
+    def test_write_back_sends_latest_position_once_and_retries_failures(self):
+        """Test that write-back writes each changed driver once and keeps failed positions for the next one"""
+        writer = RecordingWriter(fail=1)
+        store = PositionStore(writer)
+        for i in range(5):
+            store.update(7, 13.0 + i, 100.0, timestamp=T0 + timedelta(seconds=i))
+        store.update(8, 14.0, 101.0, timestamp=T0)
+
+        self.assertEqual(store.write_back(), 0)
+        store.update(8, 15.0, 101.0, timestamp=T0 + timedelta(seconds=9))
+        self.assertEqual(store.write_back(), 2)
+        self.assertEqual(writer.batches, [{7: (17.0, 100.0), 8: (15.0, 101.0)}])
+        self.assertEqual(store.write_back(), 0)
+        self.assertEqual(set(store.get_many([7, 8, 9])), {7, 8})
+
+    def test_stores_sharing_a_backend_see_each_others_positions(self):
+        """Test that two nodes on one backend read each other's positions but write back only their own"""
+        backend = position_backend(None)
+        self.assertIsInstance(backend, LocalPositionBackend)
+        writers = RecordingWriter(), RecordingWriter()
+        node_a, node_b = PositionStore(writers[0], backend), PositionStore(writers[1], backend)
+        node_a.update(7, 13.0, 100.0, timestamp=T0)
+
+        self.assertEqual(node_b.get(7).latitude, 13.0)
+        self.assertEqual((node_a.stop(), node_b.stop()), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
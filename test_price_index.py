@@ -0,0 +1,55 @@
+import random
+import unittest
+
+from price_index import LanePriceStats, PriceIndex
+
+LANE = (1, 2, '40ft')
+
+
+class LanePriceStatsTestCase(unittest.TestCase):
+
+    def test_percentiles_cover_the_recent_window(self):
+        """Test that percentiles match a full sort of the last ``window`` prices"""
+        rng = random.Random(3)
+        stats = LanePriceStats(window=50)
+        prices = [rng.randint(100, 900) * 1000 for _ in range(400)]
+        for price in prices:
+            stats.add(price)
+
+        recent = sorted(prices[-50:])
+        self.assertEqual(stats.count, 400)
+        self.assertEqual(stats.percentile(50), recent[24])
+        self.assertEqual(stats.percentile(90), recent[44])
+        self.assertEqual(stats.percentile(100), recent[-1])
+        self.assertEqual(stats.sorted, recent)
+
+    def test_ewma_follows_new_prices_and_state_round_trips(self):
+        """Test that the EWMA moves toward new prices and a persisted state restores the same stats"""
+        stats = LanePriceStats(alpha=0.5)
+        for price in (100, 100, 200):
+            stats.add(price)
+        self.assertEqual(stats.ewma, 150)
+
+        restored = LanePriceStats(200, 0.5, *stats.state())
+        self.assertEqual(restored.quote(), stats.quote())
+
+
+class PriceIndexTestCase(unittest.TestCase):
+
+    def test_reference_is_lane_median_and_version_changes(self):
+        """Test that the reference price is the recent median and every update bumps the version"""
+        index = PriceIndex()
+        self.assertIsNone(index.reference(LANE))
+        version = index.version
+        for price in (300, 100, 200):
+            index.add(LANE, price)
+        self.assertEqual(index.reference(LANE), 200)
+        self.assertGreater(index.version, version)
+
+        index.load({LANE: (2, 500.0, [400, 600])})
+        self.assertEqual(index.quote(LANE).count, 2)
+        self.assertEqual(index.reference(LANE), 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from collections import namedtuple
+
+from socket_context import SocketContexts
+
+User = namedtuple('User', ['id', 'role', 'full_name'])
+DRIVER = User(7, 'driver', '김기사')
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SocketContextsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.contexts = SocketContexts(max_age=60, clock=self.clock)
+
+    def test_allowed_match_is_served_from_the_context(self):
+        """Test that an allowed match is found only for the same user and match"""
+        self.assertIsNone(self.contexts.get('a', 7, 1))
+        self.contexts.allow('a', DRIVER, 3, 1, (3, '김기사'))
+        self.contexts.allow('a', DRIVER, 3, 2, (3, '김기사'))
+
+        context = self.contexts.get('a', 7, 1)
+        self.assertEqual((context.role, context.driver_id, context.matches[2]), ('driver', 3, (3, '김기사')))
+        self.assertIsNone(self.contexts.get('a', 8, 1))
+        self.assertIsNone(self.contexts.get('a', 7, 5))
+        self.assertIsNone(self.contexts.get('b', 7, 1))
+
+    def test_context_expires_after_max_age(self):
+        """Test that a context older than max_age has to be authorized again"""
+        self.contexts.allow('a', DRIVER, 3, 1, (3, '김기사'))
+        self.clock.now = 61
+        self.assertIsNone(self.contexts.get('a', 7, 1))
+        self.assertEqual(len(self.contexts), 0)
+
+    def test_invalidate_match_and_drop(self):
+        """Test that a changed match is dropped from every connection and disconnect forgets the sid"""
+        self.contexts.allow('a', DRIVER, 3, 1, (3, '김기사'))
+        self.contexts.allow('a', DRIVER, 3, 2, (3, '김기사'))
+        self.contexts.allow('b', User(9, 'admin', '관리자'), None, 1, (3, '김기사'))
+
+        self.contexts.invalidate_match(1)
+        self.assertIsNone(self.contexts.get('a', 7, 1))
+        self.assertIsNone(self.contexts.get('b', 9, 1))
+        self.assertIsNotNone(self.contexts.get('a', 7, 2))
+
+        self.contexts.drop('a')
+        self.assertIsNone(self.contexts.get('a', 7, 2))
+        self.contexts.invalidate_match(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
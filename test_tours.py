@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from tours import DEFAULT_TOUR_RULES, PickupIndex, build_tours
+
+BASE = datetime(2025, 7, 10, 9, 0)
+
+
+def make_tolerance(id, origin='람차방 항구', destination='부산 신항', is_empty_run=True):
+    return SimpleNamespace(
+        id=id,
+        origin=origin,
+        destination=destination,
+        origin_place_id=None,
+        destination_place_id=None,
+        container_type='40ft',
+        departure_time=BASE,
+        arrival_time=None,
+        price=0,
+        is_empty_run=is_empty_run
+    )
+
+
+def make_request(id, origin, destination, pickup_hours, delivery_hours):
+    return SimpleNamespace(
+        id=id,
+        origin=origin,
+        destination=destination,
+        origin_place_id=None,
+        destination_place_id=None,
+        container_type='40ft',
+        pickup_time=BASE + timedelta(hours=pickup_hours),
+        delivery_time=BASE + timedelta(hours=delivery_hours),
+        budget=0
+    )
+
+
+class TourTestCase(unittest.TestCase):
+
+    def test_successors_start_at_destination_inside_wait_window(self):
+        """Test that only pickups at the drop-off place between turnaround and max wait link"""
+        inbound = make_request(1, '람차방 항구', '부산 신항', 1, 10)
+        index = PickupIndex([
+            inbound,
+            make_request(2, '부산 신항', '인천 항구', 12, 20),
+            make_request(3, '부산 신항', '인천 항구', 10.5, 20),
+            make_request(4, '부산 신항', '인천 항구', 40, 50),
+            make_request(5, '시라차', '인천 항구', 12, 20),
+        ])
+
+        self.assertEqual([r.id for r in index.successors(inbound, DEFAULT_TOUR_RULES)], [2])
+
+    def test_empty_run_chains_inbound_and_backhaul(self):
+        """Test that an empty run carries a port delivery and then the backhaul out of the port"""
+        requests = [
+            make_request(1, '람차방 항구', '부산 신항', 1, 10),
+            make_request(2, '부산 신항', '람차방 항구', 20, 30),
+            make_request(3, '부산 신항', '인천 항구', 12, 20),
+        ]
+
+        tours = build_tours([make_tolerance(1), make_tolerance(2, is_empty_run=False)], requests)
+        self.assertEqual(len(tours), 1)
+        self.assertEqual(tours[0].tolerance.id, 1)
+        # 대기 시간이 짧은 후속 구간이 우선
+        self.assertEqual([r.id for r in tours[0].legs], [1, 3])
+
+    def test_deadhead_lowers_tour_value(self):
+        """Test that a backhaul starting near the drop-off is linked and its empty km counted"""
+        points = {'람차방 항구': (13.0833, 100.8833), '시라차': (13.1737, 100.9311),
+                  '부산 신항': (35.075, 128.817), '인천 항구': (37.45, 126.6)}
+
+        def locate(place_id, name):
+            return points.get(name)
+
+        requests = [
+            make_request(1, '부산 신항', '람차방 항구', 1, 10),
+            make_request(2, '시라차', '부산 신항', 12, 20),
+        ]
+        rules = DEFAULT_TOUR_RULES._replace(link_radius_km=20)
+
+        tours = build_tours([make_tolerance(1, origin='부산 신항', destination='람차방 항구')], requests,
+                            tour_rules=rules, locate=locate)
+        self.assertEqual([r.id for r in tours[0].legs], [1, 2])
+        self.assertGreater(tours[0].deadhead_km, 5)
+        self.assertLess(tours[0].value, tours[0].loaded_km - tours[0].deadhead_km)
+
+    def test_requests_are_used_by_one_tour_and_skip_is_respected(self):
+        """Test that two empty runs never share a leg and skipped pairs are left out"""
+        requests = [
+            make_request(1, '람차방 항구', '부산 신항', 1, 10),
+            make_request(2, '람차방 항구', '부산 신항', 1, 10),
+            make_request(3, '부산 신항', '인천 항구', 12, 20),
+            make_request(4, '부산 신항', '인천 항구', 18, 26),
+        ]
+
+        tours = build_tours([make_tolerance(1), make_tolerance(2)], requests)
+        legs = [r.id for tour in tours for r in tour.legs]
+        self.assertEqual(len(tours), 2)
+        self.assertEqual(len(legs), len(set(legs)))
+
+        tours = build_tours([make_tolerance(1)], requests, skip={(1, 3), (1, 4)})
+        self.assertEqual(tours, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
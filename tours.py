@@ -0,0 +1,167 @@
+import heapq
+from collections import namedtuple
+from datetime import timedelta
+
+from geo import haversine_km
+from matching import DEFAULT_RULES, MatchRules, RequestIndex, _LaneIndex, place_key
+
+Tour = namedtuple('Tour', ['tolerance', 'legs', 'loaded_km', 'deadhead_km', 'wait_hours', 'value'])
+
+_Stop = namedtuple('_Stop', ['origin', 'origin_place_id', 'container_type'])
+
+
+class TourRules(namedtuple('TourRules', [
+        'turnaround', 'max_wait', 'link_radius_km', 'max_legs', 'beam_width', 'max_successors',
+        'wait_km_per_hour'])):
+    """Limits for chaining delivery requests into one truck's tour.
+
+    The next leg must be picked up at (or within ``link_radius_km`` of) the
+    previous leg's destination, between ``turnaround`` and ``max_wait``
+    after its delivery time. Each hour of waiting costs ``wait_km_per_hour``
+    km of tour value.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            turnaround=timedelta(minutes=config.get('MATCH_TOUR_TURNAROUND_MINUTES', 60)),
+            max_wait=timedelta(hours=config.get('MATCH_TOUR_MAX_WAIT_HOURS', 24)),
+            link_radius_km=config.get('MATCH_TOUR_LINK_RADIUS_KM', 0),
+            max_legs=config.get('MATCH_TOUR_MAX_LEGS', 3),
+            beam_width=config.get('MATCH_TOUR_BEAM_WIDTH', 8),
+            max_successors=config.get('MATCH_TOUR_MAX_SUCCESSORS', 10),
+            wait_km_per_hour=config.get('MATCH_TOUR_WAIT_KM_PER_HOUR', 5.0)
+        )
+
+
+DEFAULT_TOUR_RULES = TourRules.from_config({})
+
+
+class PickupIndex(_LaneIndex):
+    """Pending requests by pickup place and container type, sorted by pickup time.
+
+    This is the adjacency index of the tour graph: the successors of a leg
+    are one window query at its destination.
+    """
+
+    def __init__(self, requests=(), link_radius_km=0, locate=None):
+        rules = MatchRules(timedelta(0), timedelta(0), timedelta(0), link_radius_km, 0)
+        super().__init__(requests, rules, locate)
+
+    def _time(self, delivery_request):
+        return delivery_request.pickup_time
+
+    def _lane(self, posting):
+        if self.locate is None:
+            return (place_key(posting.origin_place_id, posting.origin), posting.container_type)
+        return super()._lane(posting)
+
+    def _near(self, a, b):
+        if self.locate is None:
+            return True
+        return self._places_near(a.origin_place_id, a.origin, b.origin_place_id, b.origin,
+                                 self.rules.origin_radius_km)
+
+    def successors(self, delivery_request, tour_rules, container_types=None):
+        """Requests that can be picked up after ``delivery_request`` is delivered, earliest first"""
+        if delivery_request.delivery_time is None:
+            return []
+        stop = _Stop(delivery_request.destination, delivery_request.destination_place_id,
+                     delivery_request.container_type)
+        window = self.near_window(stop, delivery_request.delivery_time + tour_rules.turnaround,
+                                  delivery_request.delivery_time + tour_rules.max_wait, container_types)
+        window.sort(key=lambda r: (r.pickup_time, r.id))
+        return [r for r in window if r.id != delivery_request.id][:tour_rules.max_successors]
+
+
+def _km(locate, a_id, a_name, b_id, b_name):
+    if locate is None:
+        return 0.0
+    a, b = locate(a_id, a_name), locate(b_id, b_name)
+    return haversine_km(*a, *b) if a is not None and b is not None else 0.0
+
+
+def leg_km(delivery_request, locate=None):
+    return _km(locate, delivery_request.origin_place_id, delivery_request.origin,
+               delivery_request.destination_place_id, delivery_request.destination)
+
+
+def build_tours(tolerances, requests, rules=None, tour_rules=None, locate=None, skip=frozenset()):
+    """Multi-leg tours that load empty-run tolerances, best value first.
+
+    Each empty run takes a first leg it can carry under the matching rules,
+    then a beam
+    search of width ``beam_width`` extends it through the pickup index up to
+    ``max_legs`` legs. A tour's value is loaded km minus deadhead km between
+    legs minus the waiting penalty. The best ``beam_width`` tours of each
+    empty run are kept and chosen greedily by value, so every tolerance and
+    request is used at most once. With bounded beam, depth and successor
+    lists the work grows linearly with the number of postings.
+
+    ``skip`` holds (tolerance_id, request_id) pairs no leg may use.
+    """
+    rules = rules or DEFAULT_RULES
+    tour_rules = tour_rules or DEFAULT_TOUR_RULES
+    first_legs = RequestIndex(requests, rules, locate)
+    pickups = PickupIndex(requests, tour_rules.link_radius_km, locate)
+    successors = {}
+
+    def next_legs(delivery_request, slot_type):
+        key = (delivery_request.id, slot_type)
+        if key not in successors:
+            successors[key] = pickups.successors(delivery_request, tour_rules,
+                                                 rules.compatibility.request_types(slot_type))
+        return successors[key]
+
+    options = []
+    for tolerance in tolerances:
+        if not tolerance.is_empty_run:
+            continue
+        # 상태: (가치, 적재 km, 공차 km, 대기 시간, 구간들)
+        starts = [(leg_km(r, locate), leg_km(r, locate), 0.0, 0.0, (r,))
+                  for r in first_legs.candidates(tolerance) if (tolerance.id, r.id) not in skip]
+        beam = heapq.nlargest(tour_rules.beam_width, starts, key=_first_leg_rank)
+        tours = []
+        for _ in range(tour_rules.max_legs - 1):
+            expanded = []
+            for value, loaded, deadhead, wait, legs in beam:
+                last = legs[-1]
+                for nxt in next_legs(last, tolerance.container_type):
+                    if (tolerance.id, nxt.id) in skip or any(nxt.id == leg.id for leg in legs):
+                        continue
+                    empty = _km(locate, last.destination_place_id, last.destination,
+                                nxt.origin_place_id, nxt.origin)
+                    hours = (nxt.pickup_time - last.delivery_time).total_seconds() / 3600
+                    km = leg_km(nxt, locate)
+                    expanded.append((value + km - empty - tour_rules.wait_km_per_hour * hours,
+                                     loaded + km, deadhead + empty, wait + hours, legs + (nxt,)))
+            beam = heapq.nlargest(tour_rules.beam_width, expanded, key=_state_rank)
+            tours.extend(beam)
+        # 다른 투어와 구간이 겹칠 때를 대비해 차선책도 남긴다
+        for value, loaded, deadhead, wait, legs in heapq.nlargest(tour_rules.beam_width, tours, key=_state_rank):
+            options.append(Tour(tolerance, list(legs), round(loaded, 1), round(deadhead, 1),
+                                round(wait, 2), round(value, 1)))
+
+    chosen = []
+    used_tolerances = set()
+    used_requests = set()
+    for tour in sorted(options, key=lambda tour: (-tour.value, tour.wait_hours, tour.tolerance.id)):
+        ids = {leg.id for leg in tour.legs}
+        if tour.tolerance.id in used_tolerances or ids & used_requests:
+            continue
+        used_tolerances.add(tour.tolerance.id)
+        used_requests |= ids
+        chosen.append(tour)
+    return chosen
+
+
+def _first_leg_rank(state):
+    # 첫 구간은 적재 거리, 같으면 다음 구간을 빨리 시작할 수 있는 쪽
+    legs = state[4]
+    return (state[0], -legs[0].delivery_time.timestamp() if legs[0].delivery_time else float('-inf'))
+
+
+def _state_rank(state):
+    value, _, _, wait, _ = state
+    return (value, -wait)
@@ -3,15 +3,19 @@ import logging
 from datetime import datetime
 from flask import request
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from app_simple import app, db
-from app_simple import User, Driver, Match, LocationPath
+from app_simple import app, db, authorize_tracking, parse_history_cursor, parse_path_detail, position_store
+from app_simple import complete_match, queue_location, socket_contexts, stream_location_history
+from app_simple import Driver, Match
+from position_store import Position
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# SOCKETIO_MESSAGE_QUEUE (예: redis://)를 설정하면 다른 프로세스의 자동 매칭 진행 상황도 전달된다
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading',
+                    message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
 
 # Store active connections
 active_connections = {}
@@ -26,6 +30,7 @@ def handle_connect():
 def handle_disconnect():
     """클라이언트 연결 해제 처리"""
     logger.info(f"Client disconnected: {request.sid}")
+    socket_contexts.drop(request.sid)
     if request.sid in active_connections:
         user_id = active_connections[request.sid]
         del active_connections[request.sid]
@@ -41,32 +46,23 @@ def handle_join_tracking(data):
         if not user_id or not match_id:
             emit('error', {'message': 'user_id와 match_id가 필요합니다'})
             return
-        
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user:
-            emit('error', {'message': '유효하지 않은 사용자입니다'})
+        try:
+            # 재연결한 클라이언트는 마지막으로 받은 위치의 커서 (시각, id) 를 보내 그 이후만 받는다
+            since = parse_history_cursor(data.get('since'))
+        except (TypeError, ValueError):
+            emit('error', {'message': '유효하지 않은 since 값입니다'})
             return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
+        try:
+            # level 1-3 또는 지도 zoom 을 주면 단순화한 경로를 받는다
+            level, zoom = parse_path_detail(data.get('level'), data.get('zoom'))
+        except (TypeError, ValueError):
+            emit('error', {'message': '유효하지 않은 level 또는 zoom 값입니다'})
             return
         
-        # 권한 확인 (기사, 운송사, 관리자만 접근 가능)
-        if user.role == 'driver':
-            driver = Driver.query.filter_by(user_id=user_id).first()
-            if not driver or match.driver_id != driver.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role == 'carrier':
-            # 운송사는 자신의 매칭만 볼 수 있음
-            if match.tolerance.carrier_id != user.carrier.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role != 'admin':
-            emit('error', {'message': '권한이 없습니다'})
+        # 권한 확인 (기사, 운송사, 관리자만 접근 가능) 후 연결별 컨텍스트에 저장
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
         
         # 룸 참가
@@ -80,20 +76,9 @@ def handle_join_tracking(data):
             'match_id': match_id
         })
         
-        # 기존 위치 데이터 전송
-        locations = LocationPath.query.filter_by(match_id=match_id).order_by(LocationPath.timestamp).all()
-        location_data = [{
-            'latitude': loc.latitude,
-            'longitude': loc.longitude,
-            'timestamp': loc.timestamp.isoformat(),
-            'status': loc.status,
-            'notes': loc.notes
-        } for loc in locations]
-        
-        emit('location_history', {
-            'match_id': match_id,
-            'locations': location_data
-        })
+        # 기존 위치 데이터는 백그라운드에서 나눠 전송 (아직 저장되지 않은 버퍼 포함)
+        socketio.start_background_task(stream_location_history, socketio, request.sid, int(match_id), since,
+                                       level, zoom, data.get('stream'))
         
     except Exception as e:
         logger.error(f"Error in join_tracking: {str(e)}")
@@ -116,6 +101,20 @@ def handle_leave_tracking(data):
         logger.error(f"Error in leave_tracking: {str(e)}")
         emit('error', {'message': f'오류가 발생했습니다: {str(e)}'})
 
+@socketio.on('join_auto_match')
+def handle_join_auto_match(data):
+    """자동 매칭 진행 상황 룸 참가 (job_id가 없으면 전체 작업)"""
+    job_id = (data or {}).get('job_id')
+    room = f"auto_match_{job_id}" if job_id else 'auto_match'
+    join_room(room)
+    logger.info(f"Client joined auto-match room: {room}")
+    if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+        emit('joined_auto_match', {'room': room, 'updates': 'socket'})
+    else:
+        # 메시지 큐 없이는 main.py 의 진행 상황이 이 서버로 오지 않는다
+        emit('joined_auto_match', {'room': room, 'updates': 'poll',
+                                   'status_url': f"/api/auto-match/jobs/{job_id}" if job_id else None})
+
 @socketio.on('update_location')
 def handle_update_location(data):
     """기사 위치 업데이트"""
@@ -126,55 +125,37 @@ def handle_update_location(data):
         longitude = data.get('longitude')
         status = data.get('status', 'in_transit')
         notes = data.get('notes', '')
+        speed = data.get('speed')  # km/h, 없으면 이전 위치로 계산
+        heading = data.get('heading')
         
         # 필수 데이터 검증
         if not all([user_id, match_id, latitude, longitude]):
             emit('error', {'message': '필수 데이터가 누락되었습니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user or user.role != 'driver':
-            emit('error', {'message': '기사만 위치를 업데이트할 수 있습니다'})
-            return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
+        # 연결별 컨텍스트로 권한 확인 (처음 한 번만 DB 조회)
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
-        
-        # 기사 권한 확인
-        driver = Driver.query.filter_by(user_id=user_id).first()
-        if not driver or match.driver_id != driver.id:
-            emit('error', {'message': '권한이 없습니다'})
+        if context.role != 'driver':
+            emit('error', {'message': '기사만 위치를 업데이트할 수 있습니다'})
             return
         
-        # 위치 데이터 저장
-        location_path = LocationPath(
-            match_id=match_id,
-            latitude=latitude,
-            longitude=longitude,
-            status=status,
-            notes=notes
-        )
-        
-        db.session.add(location_path)
-        
-        # 기사 현재 위치 업데이트
-        driver.current_location_lat = latitude
-        driver.current_location_lng = longitude
-        
-        db.session.commit()
+        # 위치는 버퍼에 쌓아 일괄 저장하고 기사 현재 위치는 위치 저장소에 둔다 (브로드캐스트는 저장을 기다리지 않는다)
+        point, position = queue_location(context.driver_id, int(match_id), latitude, longitude, status, notes,
+                                         speed, heading)
         
         # 위치 데이터를 룸의 모든 클라이언트에게 브로드캐스트
         location_data = {
             'match_id': match_id,
-            'driver_id': driver.id,
-            'driver_name': user.full_name,
+            'driver_id': context.driver_id,
+            'driver_name': context.full_name,
             'latitude': latitude,
             'longitude': longitude,
-            'timestamp': location_path.timestamp.isoformat(),
+            'speed': position.speed,
+            'heading': position.heading,
+            'timestamp': point['timestamp'].isoformat(),
             'status': status,
             'notes': notes
         }
@@ -204,42 +185,30 @@ def handle_request_location(data):
             emit('error', {'message': 'user_id와 match_id가 필요합니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user:
-            emit('error', {'message': '유효하지 않은 사용자입니다'})
-            return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
-            return
-        
         # 권한 확인
-        if user.role == 'driver':
-            driver = Driver.query.filter_by(user_id=user_id).first()
-            if not driver or match.driver_id != driver.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role == 'carrier':
-            if match.tolerance.carrier_id != user.carrier.id:
-                emit('error', {'message': '권한이 없습니다'})
-                return
-        elif user.role != 'admin':
-            emit('error', {'message': '권한이 없습니다'})
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
         
-        # 기사 현재 위치 조회
-        driver = Driver.query.get(match.driver_id)
-        if driver and driver.current_location_lat and driver.current_location_lng:
+        # 기사 현재 위치 조회 (위치 저장소에 없을 때만 DB)
+        driver_id, driver_name = context.matches[int(match_id)]
+        position = position_store.get(driver_id) if driver_id else None
+        if position is None and driver_id:
+            driver = Driver.query.get(driver_id)
+            if driver and driver.current_location_lat and driver.current_location_lng:
+                position = Position(driver.current_location_lat, driver.current_location_lng, None, None,
+                                    datetime.utcnow())
+        if position is not None:
             location_data = {
                 'match_id': match_id,
-                'driver_id': driver.id,
-                'driver_name': driver.user.full_name,
-                'latitude': driver.current_location_lat,
-                'longitude': driver.current_location_lng,
-                'timestamp': datetime.now().isoformat(),
+                'driver_id': driver_id,
+                'driver_name': driver_name,
+                'latitude': position.latitude,
+                'longitude': position.longitude,
+                'speed': position.speed,
+                'heading': position.heading,
+                'timestamp': position.timestamp.isoformat(),
                 'status': 'current',
                 'notes': '현재 위치'
             }
@@ -263,38 +232,26 @@ def handle_delivery_status_update(data):
             emit('error', {'message': '필수 데이터가 누락되었습니다'})
             return
         
-        # 사용자 인증 확인
-        user = User.query.get(user_id)
-        if not user or user.role != 'driver':
-            emit('error', {'message': '기사만 배송 상태를 업데이트할 수 있습니다'})
-            return
-        
-        # 매칭 정보 확인
-        match = Match.query.get(match_id)
-        if not match:
-            emit('error', {'message': '유효하지 않은 매칭입니다'})
+        # 연결별 컨텍스트로 기사 권한 확인
+        context, error = authorize_tracking(request.sid, user_id, match_id)
+        if context is None:
+            emit('error', {'message': error})
             return
-        
-        # 기사 권한 확인
-        driver = Driver.query.filter_by(user_id=user_id).first()
-        if not driver or match.driver_id != driver.id:
-            emit('error', {'message': '권한이 없습니다'})
+        if context.role != 'driver':
+            emit('error', {'message': '기사만 배송 상태를 업데이트할 수 있습니다'})
             return
         
-        # 배송 상태 업데이트
+        # 배송 상태 업데이트 (매칭 상태가 바뀌면 권한 캐시에서 빠진다)
         if status == 'delivered':
-            match.status = 'completed'
-            match.tolerance.status = 'completed'
-            match.delivery_request.status = 'completed'
-        
-        db.session.commit()
+            complete_match(Match.query.get(match_id))
+            db.session.commit()
         
         # 상태 변경을 룸의 모든 클라이언트에게 브로드캐스트
         status_data = {
             'match_id': match_id,
             'status': status,
             'timestamp': datetime.now().isoformat(),
-            'driver_name': user.full_name
+            'driver_name': context.full_name
         }
         
         room = f"match_{match_id}"